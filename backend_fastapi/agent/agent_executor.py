@@ -1,47 +1,69 @@
 from langchain.agents import initialize_agent, Tool, AgentType
 from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage, SystemMessage
+from langchain.schema import HumanMessage, SystemMessage, AIMessage
+from langchain.prompts import MessagesPlaceholder
 from services.chart_generator import ChartGenerator
 from services.report_generator import ReportGenerator
 from services.file_reader import FileReader
 from services.mcp_client import MCPClient
+from services.chat_history import ChatHistoryStore
+from agent.streaming import StreamingEventHandler
+from agent.file_analyzer import FileAnalyzer
+from agent.bulk_analyzer import BulkAnalyzer
+import asyncio
 import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, AsyncIterator, Optional
 import json
 
 class AgentExecutor:
-    def __init__(self):
+    def __init__(
+        self,
+        chart_generator: Optional[ChartGenerator] = None,
+        report_generator: Optional[ReportGenerator] = None,
+        file_reader: Optional[FileReader] = None,
+        mcp_client: Optional[MCPClient] = None,
+        chat_history: Optional[ChatHistoryStore] = None
+    ):
         self.llm = ChatOpenAI(
             model="gpt-4o",
             temperature=0.7,
+            streaming=True,  # tokens only reach callbacks when a streaming handler is attached
             openai_api_key=os.getenv("OPENAI_API_KEY")
         )
         
-        self.chart_generator = ChartGenerator()
-        self.report_generator = ReportGenerator()
-        self.file_reader = FileReader()
-        self.mcp_client = MCPClient()
+        # Shared service instances are injected by the service container
+        self.chart_generator = chart_generator or ChartGenerator()
+        self.report_generator = report_generator or ReportGenerator()
+        self.file_reader = file_reader or FileReader()
+        self.mcp_client = mcp_client or MCPClient()
+        self.chat_history = chat_history or ChatHistoryStore()
+        self.file_analyzer = FileAnalyzer(self.llm, self.chat_history.tokens)
+        self.bulk_analyzer = BulkAnalyzer(self.file_reader, self.file_analyzer)
         
-        # Initialize tools
+        # Initialize tools as coroutines so agent.arun awaits them on the server loop
         self.tools = [
             Tool(
                 name="GenerateChart",
-                func=self.generate_chart,
+                func=None,
+                coroutine=self.generate_chart,
                 description="根据数据和描述生成专业的ECharts图表配置"
             ),
             Tool(
                 name="GenerateReport", 
-                func=self.generate_report,
+                func=None,
+                coroutine=self.generate_report,
                 description="根据数据和分析要求生成专业的分析报告"
             ),
             Tool(
                 name="ReadRemoteFile",
-                func=self.read_remote_file,
+                func=None,
+                coroutine=self.read_remote_file,
                 description="从远程服务器读取文件内容进行分析"
             ),
             Tool(
                 name="MCPQuery",
-                func=self.mcp_query,
+                func=None,
+                coroutine=self.mcp_query,
                 description="使用MCP协议查询和处理文档数据"
             )
         ]
@@ -53,28 +75,63 @@ class AgentExecutor:
             agent=AgentType.OPENAI_FUNCTIONS,
             verbose=True,
             max_iterations=3,
-            handle_parsing_errors=True
+            handle_parsing_errors=True,
+            agent_kwargs={"extra_prompt_messages": [MessagesPlaceholder(variable_name="chat_history")]}
         )
 
-    async def execute(self, user_input: str, session_id: str = "default") -> Dict[str, Any]:
-        """执行用户请求"""
+    def _route(self, user_input: str) -> str:
+        """根据关键词确定请求类型"""
+        text = user_input.lower()
+        if any(keyword in text for keyword in ['图表', 'chart', '可视化', '统计图']):
+            return "chart"
+        elif any(keyword in text for keyword in ['报告', 'report', '分析文档', '文档']):
+            return "report"
+        elif any(keyword in text for keyword in ['读取', '文件', '远程', '服务器']):
+            return "file"
+        return "analysis"
+
+    async def execute(
+        self,
+        user_input: str,
+        session_id: str = "default",
+        handler: Optional[StreamingEventHandler] = None,
+        options: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """执行用户请求（带会话上下文，成功后记录本轮对话）；options可指定报告模板等"""
         try:
+            window = await self.chat_history.get_window(session_id)
+
             # Determine the type of request and execute accordingly
-            if any(keyword in user_input.lower() for keyword in ['图表', 'chart', '可视化', '统计图']):
-                return await self.handle_chart_request(user_input, session_id)
-            elif any(keyword in user_input.lower() for keyword in ['报告', 'report', '分析文档', '文档']):
-                return await self.handle_report_request(user_input, session_id)
-            elif any(keyword in user_input.lower() for keyword in ['读取', '文件', '远程', '服务器']):
-                return await self.handle_file_request(user_input, session_id)
+            route = self._route(user_input)
+            if route == "chart":
+                result = await self.handle_chart_request(self._contextualize(user_input, window), session_id, handler)
+            elif route == "report":
+                result = await self.handle_report_request(
+                    self._contextualize(user_input, window),
+                    session_id,
+                    handler,
+                    template=(options or {}).get("template")
+                )
+            elif route == "file":
+                result = await self.handle_file_request(user_input, session_id, handler, window)
             else:
                 # General analysis request
-                result = await self.agent.arun(input=user_input)
-                return {
+                callbacks = [handler] if handler else None
+                answer = await self.agent.arun(
+                    input=user_input,
+                    chat_history=self._history_messages(window),
+                    callbacks=callbacks
+                )
+                result = {
                     "success": True,
-                    "result": result,
+                    "result": answer,
                     "type": "analysis",
                     "session_id": session_id
                 }
+
+            if result.get("success"):
+                await self._record_turn(session_id, user_input, result)
+            return result
                 
         except Exception as e:
             return {
@@ -83,10 +140,96 @@ class AgentExecutor:
                 "session_id": session_id
             }
 
-    async def handle_chart_request(self, user_input: str, session_id: str) -> Dict[str, Any]:
+    @staticmethod
+    def _history_messages(window: Dict[str, Any]) -> List[Any]:
+        """将上下文窗口转换为LangChain消息"""
+        messages: List[Any] = []
+        if window["summary"]:
+            messages.append(SystemMessage(content=f"此前对话摘要：{window['summary']}"))
+        for message in window["messages"]:
+            message_class = HumanMessage if message["role"] == "user" else AIMessage
+            messages.append(message_class(content=message["content"]))
+        return messages
+
+    @staticmethod
+    def _contextualize(user_input: str, window: Dict[str, Any]) -> str:
+        """为单次调用的工具拼接会话上下文；没有历史时原样返回"""
+        if not window["summary"] and not window["messages"]:
+            return user_input
+        lines = []
+        if window["summary"]:
+            lines.append(f"此前对话摘要：{window['summary']}")
+        for message in window["messages"]:
+            speaker = "用户" if message["role"] == "user" else "助手"
+            lines.append(f"{speaker}：{message['content']}")
+        return "对话上下文：\n" + "\n".join(lines) + f"\n\n当前请求：{user_input}"
+
+    async def _record_turn(self, session_id: str, user_input: str, result: Dict[str, Any]):
+        """保存本轮问答，并在后台把滑出窗口的旧消息并入滚动摘要"""
+        answer = result.get("result")
+        if not isinstance(answer, str):
+            answer = json.dumps(answer, ensure_ascii=False)
+        await self.chat_history.append(session_id, "user", user_input)
+        await self.chat_history.append(session_id, "assistant", answer)
+        self.chat_history.schedule_summary(session_id, self._summarize_history)
+
+    async def _summarize_history(self, previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+        """用LLM把旧摘要和新滑出的消息压缩为新的摘要"""
+        transcript = "\n".join(
+            f"{'用户' if m['role'] == 'user' else '助手'}：{m['content']}" for m in messages
+        )
+        prompt = (
+            "请将以下对话压缩为简洁的摘要，保留关键事实、数据、结论和用户偏好，不超过300字。\n\n"
+            f"已有摘要：{previous_summary or '无'}\n\n新增对话：\n{transcript}"
+        )
+        response = await self.llm.agenerate([[HumanMessage(content=prompt)]])
+        return response.generations[0][0].text.strip()
+
+    async def execute_stream(
+        self,
+        user_input: str,
+        session_id: str = "default",
+        options: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式执行用户请求，依次产出路由、工具、令牌事件，最后产出完整结果"""
+        yield {"type": "route", "route": self._route(user_input), "session_id": session_id}
+
+        queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        handler = StreamingEventHandler(queue)
+        task = asyncio.create_task(self.execute(user_input, session_id, handler, options))
+        getter: Optional["asyncio.Future[Dict[str, Any]]"] = None
+        try:
+            while not task.done():
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    yield getter.result()
+                else:
+                    getter.cancel()
+
+            while not queue.empty():
+                yield queue.get_nowait()
+            result = task.result()
+            yield {**result, "type": "done", "result_type": result.get("type")}
+        finally:
+            # Client went away (or the consumer stopped early): abort the upstream LLM call
+            if getter is not None:
+                getter.cancel()
+            task.cancel()
+
+    async def handle_chart_request(
+        self,
+        user_input: str,
+        session_id: str,
+        handler: Optional[StreamingEventHandler] = None
+    ) -> Dict[str, Any]:
         """处理图表生成请求"""
         try:
-            chart_config = await self.chart_generator.generate(user_input)
+            if handler:
+                await handler.emit({"type": "tool_start", "tool": "GenerateChart", "input": user_input})
+            chart_config = await self.chart_generator.generate(user_input, callbacks=[handler] if handler else None)
+            if handler:
+                await handler.emit({"type": "tool_end", "tool": "GenerateChart"})
             return {
                 "success": True,
                 "result": chart_config,
@@ -100,10 +243,25 @@ class AgentExecutor:
                 "session_id": session_id
             }
 
-    async def handle_report_request(self, user_input: str, session_id: str) -> Dict[str, Any]:
+    async def handle_report_request(
+        self,
+        user_input: str,
+        session_id: str,
+        handler: Optional[StreamingEventHandler] = None,
+        template: Optional[str] = None
+    ) -> Dict[str, Any]:
         """处理报告生成请求"""
         try:
-            report_path = await self.report_generator.generate(user_input, session_id)
+            if handler:
+                await handler.emit({"type": "tool_start", "tool": "GenerateReport", "input": user_input})
+            report_path = await self.report_generator.generate(
+                user_input,
+                session_id,
+                template=template,
+                callbacks=[handler] if handler else None
+            )
+            if handler:
+                await handler.emit({"type": "tool_end", "tool": "GenerateReport", "output": report_path})
             return {
                 "success": True,
                 "result": report_path,
@@ -117,18 +275,29 @@ class AgentExecutor:
                 "session_id": session_id
             }
 
-    async def handle_file_request(self, user_input: str, session_id: str) -> Dict[str, Any]:
+    async def handle_file_request(
+        self,
+        user_input: str,
+        session_id: str,
+        handler: Optional[StreamingEventHandler] = None,
+        window: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """处理文件读取请求"""
         try:
+            if handler:
+                await handler.emit({"type": "tool_start", "tool": "ReadRemoteFile", "input": user_input})
             file_content = await self.file_reader.read_remote_file(user_input)
+            if handler:
+                await handler.emit({"type": "tool_end", "tool": "ReadRemoteFile", "output": f"{len(file_content)} chars"})
             # Process the file content with AI
-            analysis = await self.llm.apredict(
-                f"请分析以下文件内容：\n\n{file_content}\n\n用户要求：{user_input}"
-            )
+            request = self._contextualize(user_input, window) if window else user_input
+            # Large files are summarized chunk by chunk and reduced under a token budget
+            analysis = await self.file_analyzer.analyze(file_content, request, handler)
             return {
                 "success": True,
-                "result": analysis,
+                "result": analysis.pop("analysis"),
                 "type": "file_analysis",
+                "metadata": analysis,
                 "session_id": session_id
             }
         except Exception as e:
@@ -138,18 +307,45 @@ class AgentExecutor:
                 "session_id": session_id
             }
 
-    def generate_chart(self, prompt: str) -> str:
+    async def execute_bulk(
+        self,
+        file_references: List[str],
+        analysis_prompt: str,
+        session_id: str = "default",
+        handler: Optional[StreamingEventHandler] = None
+    ) -> Dict[str, Any]:
+        """批量分析多个文件：并发读取和分析，归并为一个回答（部分文件失败时返回部分结果）"""
+        try:
+            analysis = await self.bulk_analyzer.analyze(file_references, analysis_prompt, handler)
+            result = {
+                "success": True,
+                "result": analysis.pop("analysis"),
+                "type": "bulk_analysis",
+                "metadata": analysis,
+                "session_id": session_id
+            }
+            await self._record_turn(session_id, f"批量分析 {len(file_references)} 个文件：{analysis_prompt}", result)
+            return result
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"批量分析失败: {str(e)}",
+                "session_id": session_id
+            }
+
+    async def generate_chart(self, prompt: str) -> str:
         """图表生成工具函数"""
-        return self.chart_generator.generate_sync(prompt)
+        return await self.chart_generator.generate(prompt)
 
-    def generate_report(self, prompt: str) -> str:
+    async def generate_report(self, prompt: str) -> str:
         """报告生成工具函数"""
-        return self.report_generator.generate_sync(prompt)
+        return await self.report_generator.generate(prompt)
 
-    def read_remote_file(self, file_path: str) -> str:
+    async def read_remote_file(self, file_path: str) -> str:
         """远程文件读取工具函数"""
-        return self.file_reader.read_remote_file_sync(file_path)
+        return await self.file_reader.read_remote_file(file_path)
 
-    def mcp_query(self, query: str) -> str:
+    async def mcp_query(self, query: str) -> str:
         """MCP查询工具函数"""
-        return self.mcp_client.query_sync(query)
\ No newline at end of file
+        result = await self.mcp_client.query(query)
+        return json.dumps(result, ensure_ascii=False, indent=2)
\ No newline at end of file
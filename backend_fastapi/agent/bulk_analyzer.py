@@ -0,0 +1,127 @@
+import asyncio
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+from agent.file_analyzer import FileAnalyzer
+from agent.streaming import StreamingEventHandler
+from services.concurrency import get_host_limiter, iterate_completed
+from services.file_reader import FileReader
+
+class BulkAnalyzer:
+    """多文件批量分析：并发读取和分析每个文件（读取按主机限流，分析有独立并发上限），
+    再把成功的结果归并为一个回答；单个文件失败或超时不影响其他文件"""
+
+    def __init__(self, file_reader: FileReader, file_analyzer: FileAnalyzer):
+        self.file_reader = file_reader
+        self.file_analyzer = file_analyzer
+        self.limiter = get_host_limiter("bulk_analysis", "BULK_FETCH_MAX_CONCURRENCY", "BULK_FETCH_PER_HOST_CONCURRENCY")
+        self.analyze_concurrency = int(os.getenv("BULK_ANALYZE_CONCURRENCY", "3"))
+        self.file_timeout = float(os.getenv("BULK_FILE_TIMEOUT", "180"))
+        self.max_files = int(os.getenv("BULK_MAX_FILES", "50"))
+
+    async def _analyze_one(
+        self,
+        file_reference: str,
+        request: str,
+        semaphore: asyncio.Semaphore
+    ) -> Dict[str, Any]:
+        timing: Dict[str, float] = {}
+        started = time.perf_counter()
+
+        async def run() -> Dict[str, Any]:
+            async with self.limiter.limit(file_reference):
+                content = await self.file_reader.read_remote_file(file_reference)
+            timing["fetch_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            # LLM calls are the scarce resource, so they get their own limit
+            async with semaphore:
+                analysis_started = time.perf_counter()
+                analysis = await self.file_analyzer.analyze(content, request)
+            timing["analyze_ms"] = round((time.perf_counter() - analysis_started) * 1000, 2)
+            analysis["chars"] = len(content)
+            return analysis
+
+        try:
+            analysis = await asyncio.wait_for(run(), timeout=self.file_timeout)
+            return {
+                "file_reference": file_reference,
+                "success": True,
+                "analysis": analysis.pop("analysis"),
+                "metadata": analysis,
+                "timing": {**timing, "total_ms": round((time.perf_counter() - started) * 1000, 2)}
+            }
+        except asyncio.TimeoutError:
+            error = f"处理超时（{self.file_timeout}秒）"
+        except Exception as e:
+            error = str(e)
+        return {
+            "file_reference": file_reference,
+            "success": False,
+            "error": error,
+            "stage": "analyze" if "fetch_ms" in timing else "fetch",
+            "timing": {**timing, "total_ms": round((time.perf_counter() - started) * 1000, 2)}
+        }
+
+    async def analyze(
+        self,
+        file_references: List[str],
+        request: str,
+        handler: Optional[StreamingEventHandler] = None
+    ) -> Dict[str, Any]:
+        """分析多个文件并归并结果；结果按请求顺序返回"""
+        # Duplicate references would only be fetched and analyzed twice
+        references = list(dict.fromkeys(file_references))
+        if not references:
+            raise ValueError("未提供文件")
+        if len(references) > self.max_files:
+            raise ValueError(f"文件数量超过上限 {self.max_files}")
+
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.analyze_concurrency)
+        files: List[Optional[Dict[str, Any]]] = [None] * len(references)
+        jobs = [self._analyze_one(reference, request, semaphore) for reference in references]
+        async for index, item in iterate_completed(jobs):
+            files[index] = item
+            if handler:
+                await handler.emit({
+                    "type": "progress",
+                    "stage": "files",
+                    "file_reference": item["file_reference"],
+                    "success": item["success"],
+                    "completed": sum(1 for f in files if f is not None),
+                    "total": len(references)
+                })
+
+        succeeded = [f for f in files if f["success"]]
+        if not succeeded:
+            raise RuntimeError("所有文件均处理失败: " + "; ".join(f"{f['file_reference']}: {f['error']}" for f in files))
+
+        merge_started = time.perf_counter()
+        if len(succeeded) == 1:
+            merged = {"analysis": succeeded[0]["analysis"], "tokens_used": 0}
+        else:
+            if handler:
+                await handler.emit({"type": "progress", "stage": "merge", "files": len(succeeded)})
+            merged = await self.file_analyzer.merge(
+                [f"【{f['file_reference']}】\n{f['analysis']}" for f in succeeded],
+                request,
+                handler
+            )
+
+        analysis = merged["analysis"]
+        failed = [f for f in files if not f["success"]]
+        if failed:
+            analysis += f"\n\n（注：{len(failed)}/{len(files)} 个文件处理失败，未纳入分析：{', '.join(f['file_reference'] for f in failed)}）"
+
+        return {
+            "analysis": analysis,
+            "files": files,
+            "succeeded": len(succeeded),
+            "failed": len(failed),
+            "tokens_used": merged["tokens_used"] + sum(f["metadata"]["tokens_used"] for f in succeeded),
+            "timing": {
+                "files_ms": round((merge_started - started) * 1000, 2),
+                "merge_ms": round((time.perf_counter() - merge_started) * 1000, 2),
+                "total_ms": round((time.perf_counter() - started) * 1000, 2)
+            }
+        }
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import os
+from typing import Dict, Any, List, Optional
+
+from langchain_openai import ChatOpenAI
+from langchain.schema import HumanMessage
+
+from agent.streaming import StreamingEventHandler
+from services.chat_history import TokenCounter
+from services.extraction_cache import ExtractionCache
+
+MAP_PROMPT = "请提取以下文件片段中的关键信息、数据、结论和值得注意的细节，用简洁的要点表示：\n\n{chunk}"
+COMBINE_PROMPT = "请将以下多段文件摘要合并为一份不重复的要点摘要，保留所有关键数据：\n\n{summaries}"
+REDUCE_PROMPT = "以下是一个文件各部分的摘要（按原文顺序）：\n\n{summaries}\n\n请基于这些摘要完成用户要求：{request}"
+MERGE_PROMPT = "以下是对多个文件分别进行的分析结果：\n\n{analyses}\n\n请综合这些结果，完成用户要求：{request}"
+DIRECT_PROMPT = "请分析以下文件内容：\n\n{content}\n\n用户要求：{request}"
+
+class TokenBudgetExceeded(Exception):
+    """单次请求的令牌预算已用完"""
+
+class FileAnalyzer:
+    """大文件map-reduce分析：按令牌切分，并发摘要各片段（摘要按内容哈希缓存），再归并为最终回答"""
+
+    def __init__(self, llm: ChatOpenAI, token_counter: Optional[TokenCounter] = None):
+        self.llm = llm
+        self.tokens = token_counter or TokenCounter()
+        self.chunk_tokens = int(os.getenv("FILE_CHUNK_TOKENS", "2000"))
+        self.direct_tokens = int(os.getenv("FILE_DIRECT_TOKENS", "3000"))
+        self.summary_tokens = int(os.getenv("FILE_SUMMARY_TOKENS", "300"))
+        self.reduce_input_tokens = int(os.getenv("FILE_REDUCE_INPUT_TOKENS", "6000"))
+        self.token_budget = int(os.getenv("FILE_TOKEN_BUDGET", "60000"))
+        self.concurrency = int(os.getenv("FILE_MAP_CONCURRENCY", "4"))
+        # Chunk summaries are request-independent, so they are reused across questions
+        self.map_llm = ChatOpenAI(
+            model=os.getenv("FILE_MAP_MODEL", "gpt-4o"),
+            temperature=0.2,
+            max_tokens=self.summary_tokens,
+            openai_api_key=os.getenv("OPENAI_API_KEY")
+        )
+        self.cache = ExtractionCache(
+            cache_dir=os.getenv("FILE_SUMMARY_CACHE_DIR", "cache/chunk_summaries"),
+            max_bytes=int(os.getenv("FILE_SUMMARY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        )
+
+    def split(self, content: str) -> List[str]:
+        """按段落累积切分到约chunk_tokens个令牌，超长段落按比例截断"""
+        chunks: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+        for paragraph in content.split("\n"):
+            tokens = self.tokens.count(paragraph) + 1
+            if tokens > self.chunk_tokens:
+                # Oversized paragraph (e.g. minified JSON): cut it by character share
+                step = max(1, len(paragraph) * self.chunk_tokens // tokens)
+                pieces = [paragraph[i:i + step] for i in range(0, len(paragraph), step)]
+            else:
+                pieces = [paragraph]
+            for piece in pieces:
+                piece_tokens = self.tokens.count(piece) + 1
+                if current and current_tokens + piece_tokens > self.chunk_tokens:
+                    chunks.append("\n".join(current))
+                    current, current_tokens = [], 0
+                current.append(piece)
+                current_tokens += piece_tokens
+        if current and any(line.strip() for line in current):
+            chunks.append("\n".join(current))
+        return chunks
+
+    def _spend(self, state: Dict[str, Any], prompt: str, output_tokens: int):
+        """预扣一次调用的令牌（输入加输出上限），超出预算时拒绝"""
+        self._spend_all(state, [prompt], output_tokens)
+
+    def _spend_all(self, state: Dict[str, Any], prompts: List[str], output_tokens: int):
+        """一次性预扣一组调用的令牌，预算不够时全部拒绝"""
+        cost = sum(self.tokens.count(prompt) + output_tokens for prompt in prompts)
+        if state["tokens_used"] + cost > self.token_budget:
+            raise TokenBudgetExceeded(f"令牌预算不足（已用 {state['tokens_used']}，预算 {self.token_budget}）")
+        state["tokens_used"] += cost
+
+    async def _complete(self, llm: ChatOpenAI, prompt: str, callbacks=None) -> str:
+        response = await llm.agenerate([[HumanMessage(content=prompt)]], callbacks=callbacks)
+        return response.generations[0][0].text.strip()
+
+    async def _summarize_chunk(self, chunk: str, state: Dict[str, Any], semaphore: asyncio.Semaphore) -> Optional[str]:
+        key = self.cache.make_key(hashlib.sha256(chunk.encode("utf-8")).hexdigest(), f"summary:{self.map_llm.model_name}")
+        cached = await self.cache.get(key)
+        if cached is not None:
+            state["cached_chunks"] += 1
+            return cached["summary"]
+
+        prompt = MAP_PROMPT.format(chunk=chunk)
+        async with semaphore:
+            try:
+                self._spend(state, prompt, self.summary_tokens)
+            except TokenBudgetExceeded:
+                state["truncated"] = True
+                return None
+            summary = await self._complete(self.map_llm, prompt)
+        await self.cache.put(key, {"summary": summary})
+        return summary
+
+    async def _collapse(self, summaries: List[str], state: Dict[str, Any]) -> List[str]:
+        """摘要总量超过归并输入上限时，分组合并直到放得下"""
+        while len(summaries) > 1 and self.tokens.count("\n\n".join(summaries)) > self.reduce_input_tokens:
+            groups: List[List[str]] = [[]]
+            group_tokens = 0
+            for summary in summaries:
+                tokens = self.tokens.count(summary)
+                if groups[-1] and group_tokens + tokens > self.reduce_input_tokens:
+                    groups.append([])
+                    group_tokens = 0
+                groups[-1].append(summary)
+                group_tokens += tokens
+            if len(groups) == len(summaries):
+                break
+
+            prompts = [COMBINE_PROMPT.format(summaries="\n\n".join(group)) for group in groups]
+            self._spend_all(state, prompts, self.summary_tokens)
+            summaries = list(await asyncio.gather(*(self._complete(self.map_llm, prompt) for prompt in prompts)))
+        return summaries
+
+    def _fit(self, summaries: List[str]) -> List[str]:
+        """按原文顺序保留放得进归并输入上限的摘要"""
+        fitted: List[str] = []
+        total = 0
+        for summary in summaries:
+            total += self.tokens.count(summary)
+            if fitted and total > self.reduce_input_tokens:
+                break
+            fitted.append(summary)
+        return fitted
+
+    async def analyze(
+        self,
+        content: str,
+        request: str,
+        handler: Optional[StreamingEventHandler] = None
+    ) -> Dict[str, Any]:
+        """分析文件内容；小文件直接单次调用，大文件走map-reduce"""
+        callbacks = [handler] if handler else None
+        state = {"tokens_used": 0, "cached_chunks": 0, "failed_chunks": 0, "truncated": False}
+
+        if self.tokens.count(content) <= self.direct_tokens:
+            prompt = DIRECT_PROMPT.format(content=content, request=request)
+            self._spend(state, prompt, 0)
+            analysis = await self._complete(self.llm, prompt, callbacks)
+            return {"analysis": analysis, "strategy": "direct", "chunks": 1, **state}
+
+        chunks = self.split(content)
+        # Keep room for the final reduce call, which answers the actual question
+        reduce_reserve = self.reduce_input_tokens + self.tokens.count(request) + 1000
+        state["tokens_used"] += reduce_reserve
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        completed = 0
+
+        async def summarize(chunk: str) -> Optional[str]:
+            nonlocal completed
+            try:
+                return await self._summarize_chunk(chunk, state, semaphore)
+            finally:
+                completed += 1
+                if handler:
+                    await handler.emit({"type": "progress", "stage": "map", "completed": completed, "total": len(chunks)})
+
+        # A failed chunk must not sink the whole analysis; the reduce runs over the chunks that succeeded
+        results = await asyncio.gather(*(summarize(chunk) for chunk in chunks), return_exceptions=True)
+        failures = [result for result in results if isinstance(result, BaseException)]
+        state["failed_chunks"] = len(failures)
+        if failures:
+            print(f"Warning: {len(failures)}/{len(chunks)} chunk summaries failed: {failures[0]}")
+        # Summaries stay in document order regardless of completion order
+        kept = [result for result in results if isinstance(result, str) and result]
+        if not kept:
+            if failures:
+                raise failures[0]
+            raise TokenBudgetExceeded(f"令牌预算不足以分析该文件（预算 {self.token_budget}）")
+
+        analyzed = len(kept)
+        if handler:
+            await handler.emit({"type": "progress", "stage": "reduce", "summaries": len(kept)})
+        # The reserve stays held while collapsing, so combine calls cannot eat into the final answer
+        try:
+            kept = await self._collapse(kept, state)
+        except TokenBudgetExceeded:
+            kept = self._fit(kept)
+            analyzed = len(kept)
+            state["truncated"] = True
+        state["tokens_used"] -= reduce_reserve
+
+        prompt = REDUCE_PROMPT.format(summaries="\n\n".join(kept), request=request)
+        self._spend(state, prompt, 0)
+        analysis = await self._complete(self.llm, prompt, callbacks)
+        notes = []
+        if state["truncated"]:
+            notes.append("受令牌预算限制")
+        if failures:
+            notes.append(f"{len(failures)} 个片段摘要失败")
+        if notes:
+            analysis += f"\n\n（注：{'，'.join(notes)}，仅分析了 {analyzed}/{len(chunks)} 个片段）"
+        return {"analysis": analysis, "strategy": "map_reduce", "chunks": len(chunks), **state}
+
+    async def merge(
+        self,
+        analyses: List[str],
+        request: str,
+        handler: Optional[StreamingEventHandler] = None
+    ) -> Dict[str, Any]:
+        """将多份独立分析结果归并为一个回答（总量过大时先分组合并）"""
+        callbacks = [handler] if handler else None
+        state = {"tokens_used": 0, "cached_chunks": 0, "truncated": False}
+        analyses = await self._collapse(analyses, state)
+        prompt = MERGE_PROMPT.format(analyses="\n\n".join(analyses), request=request)
+        self._spend(state, prompt, 0)
+        analysis = await self._complete(self.llm, prompt, callbacks)
+        return {"analysis": analysis, "tokens_used": state["tokens_used"]}
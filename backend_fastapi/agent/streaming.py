@@ -0,0 +1,33 @@
+import asyncio
+from typing import Dict, Any
+
+from langchain.callbacks.base import AsyncCallbackHandler
+
+class StreamingEventHandler(AsyncCallbackHandler):
+    """将LLM令牌和工具调用事件写入异步队列，供SSE/WebSocket推送"""
+
+    def __init__(self, queue: "asyncio.Queue[Dict[str, Any]]"):
+        self.queue = queue
+
+    async def emit(self, event: Dict[str, Any]):
+        """推送自定义事件"""
+        await self.queue.put(event)
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        # Function-call chunks arrive as empty tokens; only forward visible text
+        if token:
+            # run_id tells apart tokens from concurrent calls (e.g. report sections)
+            await self.queue.put({"type": "token", "content": token, "run_id": str(kwargs.get("run_id", ""))})
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        await self.queue.put({
+            "type": "tool_start",
+            "tool": (serialized or {}).get("name", "unknown"),
+            "input": input_str
+        })
+
+    async def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        await self.queue.put({"type": "tool_end", "output": str(output)[:500]})
+
+    async def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        await self.queue.put({"type": "tool_error", "error": str(error)})
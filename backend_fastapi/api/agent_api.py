@@ -1,17 +1,16 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from agent.agent_executor import AgentExecutor
-from services.file_reader import FileReader
+from services.chart_generator import ChartGenerator
+from services.file_reader import FileReader, RemoteFileTooLargeError
 from services.mcp_client import MCPClient
+from services.status_monitor import ServerStatusMonitor
+from dependencies import get_agent_executor, get_chart_generator, get_file_reader, get_mcp_client, get_status_monitor
+import os
 
 router = APIRouter()
 
-# Initialize services
-agent_executor = AgentExecutor()
-file_reader = FileReader()
-mcp_client = MCPClient()
-
 class AgentRequest(BaseModel):
     user_input: str
     session_id: str = "default"
@@ -34,7 +33,10 @@ class DocumentAnalysisRequest(BaseModel):
     session_id: str = "default"
 
 @router.post("/execute")
-async def execute_agent(request: AgentRequest):
+async def execute_agent(
+    request: AgentRequest,
+    agent_executor: AgentExecutor = Depends(get_agent_executor)
+):
     """执行智能体任务"""
     try:
         result = await agent_executor.execute(request.user_input, request.session_id)
@@ -43,55 +45,68 @@ async def execute_agent(request: AgentRequest):
         raise HTTPException(status_code=500, detail=f"Agent execution failed: {str(e)}")
 
 @router.post("/process-remote-file")
-async def process_remote_file(request: FileProcessingRequest):
+async def process_remote_file(
+    request: FileProcessingRequest,
+    agent_executor: AgentExecutor = Depends(get_agent_executor),
+    file_reader: FileReader = Depends(get_file_reader),
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """处理远程文件"""
     try:
-        # Read file from remote server
-        file_content = await file_reader.read_remote_file(f"{request.server_name}:{request.file_path}")
-        
-        # Process with MCP if available
+        # Download once: the local copy feeds both the agent prompt and local extraction
+        file_reference = f"{request.server_name}:{request.file_path}"
+        download = await file_reader.download_remote_file(file_reference)
         try:
-            # First process document with MCP
-            mcp_result = await mcp_client.process_document(
-                document_path=request.file_path,
-                document_type="auto"
-            )
+            file_content = await file_reader.read_downloaded_file(download, request.file_path)
             
-            # Then analyze with agent
-            analysis_prompt = f"分析以下文件内容并提供{request.processing_type}：\n\n{file_content}"
-            agent_result = await agent_executor.execute(analysis_prompt, request.session_id)
+            # Process with MCP if available
+            try:
+                # First process document with MCP; it gets the remote path, local parsing uses the download
+                mcp_result = await mcp_client.process_document(
+                    document_path=request.file_path,
+                    document_type="auto",
+                    session_id=request.session_id,
+                    content_hash=download["sha256"],
+                    local_path=download["path"]
+                )
+            except Exception as mcp_error:
+                mcp_result = None
+                mcp_error_message = str(mcp_error)
+        finally:
+            if os.path.exists(download["path"]):
+                os.unlink(download["path"])
             
-            return {
-                "success": True,
-                "file_path": request.file_path,
-                "server": request.server_name,
-                "mcp_processing": mcp_result,
-                "agent_analysis": agent_result,
-                "session_id": request.session_id
-            }
-            
-        except Exception as mcp_error:
+        # Then analyze with agent
+        analysis_prompt = f"分析以下文件内容并提供{request.processing_type}：\n\n{file_content}"
+        agent_result = await agent_executor.execute(analysis_prompt, request.session_id)
+        
+        response = {
+            "success": True,
+            "file_path": request.file_path,
+            "server": request.server_name,
+            "agent_analysis": agent_result,
+            "session_id": request.session_id
+        }
+        if mcp_result is not None:
+            response["mcp_processing"] = mcp_result
+        else:
             # Fallback to agent-only processing
-            analysis_prompt = f"分析以下文件内容并提供{request.processing_type}：\n\n{file_content}"
-            agent_result = await agent_executor.execute(analysis_prompt, request.session_id)
-            
-            return {
-                "success": True,
-                "file_path": request.file_path,
-                "server": request.server_name,
-                "agent_analysis": agent_result,
-                "mcp_error": str(mcp_error),
-                "session_id": request.session_id
-            }
+            response["mcp_error"] = mcp_error_message
+        return response
             
+    except RemoteFileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件处理失败: {str(e)}")
 
 @router.post("/mcp-query")
-async def mcp_query(request: MCPQueryRequest):
+async def mcp_query(
+    request: MCPQueryRequest,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """使用MCP协议查询"""
     try:
-        result = await mcp_client.query(request.query, request.context)
+        result = await mcp_client.query(request.query, request.context, request.session_id)
         return {
             "success": True,
             "query": request.query,
@@ -102,13 +117,18 @@ async def mcp_query(request: MCPQueryRequest):
         raise HTTPException(status_code=500, detail=f"MCP查询失败: {str(e)}")
 
 @router.post("/analyze-documents")
-async def analyze_documents(request: DocumentAnalysisRequest):
+async def analyze_documents(
+    request: DocumentAnalysisRequest,
+    agent_executor: AgentExecutor = Depends(get_agent_executor),
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """分析多个文档"""
     try:
         # Use MCP for document analysis
         analysis_result = await mcp_client.analyze_documents(
             document_ids=request.document_ids,
-            analysis_type=request.analysis_type
+            analysis_type=request.analysis_type,
+            session_id=request.session_id
         )
         
         # Enhance with agent processing
@@ -129,30 +149,53 @@ async def analyze_documents(request: DocumentAnalysisRequest):
         raise HTTPException(status_code=500, detail=f"文档分析失败: {str(e)}")
 
 @router.get("/servers/status")
-async def get_servers_status():
-    """获取所有远程服务器状态"""
+async def get_servers_status(status_monitor: ServerStatusMonitor = Depends(get_status_monitor)):
+    """获取所有远程服务器状态（来自后台探测缓存）"""
     try:
-        server_status = {}
-        
-        # Check configured servers
-        for server_name in ["server1", "server2"]:
-            status = file_reader.get_server_status(server_name)
-            server_status[server_name] = status
-        
-        # Check MCP server
-        mcp_status = await mcp_client.health_check()
-        server_status["mcp_server"] = mcp_status
-        
-        return {
-            "servers": server_status,
-            "timestamp": "2025-01-27T12:00:00Z"
-        }
+        return await status_monitor.get_or_refresh()
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"状态检查失败: {str(e)}")
 
+@router.post("/servers/status/refresh")
+async def refresh_servers_status(status_monitor: ServerStatusMonitor = Depends(get_status_monitor)):
+    """立即重新探测所有服务器"""
+    try:
+        return await status_monitor.refresh()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"状态检查失败: {str(e)}")
+
+@router.get("/files/cache/stats")
+async def get_file_cache_stats(file_reader: FileReader = Depends(get_file_reader)):
+    """获取远程文件缓存命中统计"""
+    return file_reader.get_cache_stats()
+
+@router.get("/charts/cache/stats")
+async def get_chart_cache_stats(chart_generator: ChartGenerator = Depends(get_chart_generator)):
+    """获取图表响应缓存命中统计"""
+    return chart_generator.get_cache_stats()
+
+@router.get("/files/preview")
+async def preview_remote_file(
+    file_reference: str,
+    head_bytes: Optional[int] = None,
+    tail_bytes: Optional[int] = None,
+    file_reader: FileReader = Depends(get_file_reader)
+):
+    """通过Range请求预览远程文件的开头和结尾"""
+    try:
+        return await file_reader.preview_remote_file(file_reference, head_bytes, tail_bytes)
+    except RemoteFileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"文件预览失败: {str(e)}")
+
 @router.get("/servers/{server_name}/files")
-async def list_remote_files(server_name: str, directory: str = "/"):
+async def list_remote_files(
+    server_name: str,
+    directory: str = "/",
+    file_reader: FileReader = Depends(get_file_reader)
+):
     """列出远程服务器文件"""
     try:
         files = await file_reader.list_remote_files(server_name, directory)
@@ -168,7 +211,8 @@ async def list_remote_files(server_name: str, directory: str = "/"):
 async def search_remote_files(
     server_name: str,
     query: str,
-    file_types: Optional[List[str]] = None
+    file_types: Optional[List[str]] = None,
+    file_reader: FileReader = Depends(get_file_reader)
 ):
     """搜索远程服务器文件"""
     try:
@@ -185,11 +229,13 @@ async def search_remote_files(
 async def create_knowledge_graph(
     documents: List[str],
     topic: str,
-    session_id: str = "default"
+    session_id: str = "default",
+    agent_executor: AgentExecutor = Depends(get_agent_executor),
+    mcp_client: MCPClient = Depends(get_mcp_client)
 ):
     """创建知识图谱"""
     try:
-        kg_result = await mcp_client.create_knowledge_graph(documents, topic)
+        kg_result = await mcp_client.create_knowledge_graph(documents, topic, session_id)
         
         # Enhance with agent insights
         insight_prompt = f"基于知识图谱为主题'{topic}'提供深度分析和应用建议"
@@ -210,11 +256,13 @@ async def create_knowledge_graph(
 async def semantic_search(
     query: str,
     filters: Optional[Dict[str, Any]] = None,
-    session_id: str = "default"
+    session_id: str = "default",
+    agent_executor: AgentExecutor = Depends(get_agent_executor),
+    mcp_client: MCPClient = Depends(get_mcp_client)
 ):
     """语义搜索"""
     try:
-        search_results = await mcp_client.semantic_search(query, filters)
+        search_results = await mcp_client.semantic_search(query, filters, session_id)
         
         # Process results with agent
         results_summary = search_results.get("results", [])
@@ -1,14 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import Optional, List, Dict, Any
 from agent.agent_executor import AgentExecutor
+from services.chat_history import ChatHistoryStore
+from services.report_generator import DEFAULT_TEMPLATE, list_templates
+from dependencies import get_agent_executor, get_chat_history
 import asyncio
+import json
 
 router = APIRouter()
 
-# Initialize agent executor
-agent_executor = AgentExecutor()
-
 class ChatRequest(BaseModel):
     session_id: str
     user_input: str
@@ -33,10 +35,13 @@ class BulkAnalysisRequest(BaseModel):
     analysis_prompt: str
 
 @router.post("/", response_model=ChatResponse)
-async def chat_with_agent(request: ChatRequest):
+async def chat_with_agent(
+    request: ChatRequest,
+    agent_executor: AgentExecutor = Depends(get_agent_executor)
+):
     """与智能体进行对话"""
     try:
-        result = await agent_executor.execute(request.user_input, request.session_id)
+        result = await agent_executor.execute(request.user_input, request.session_id, options=request.options)
         
         if result.get("success"):
             return ChatResponse(
@@ -52,8 +57,61 @@ async def chat_with_agent(request: ChatRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"聊天处理失败: {str(e)}")
 
+async def _sse_events(agent_executor: AgentExecutor, request: ChatRequest):
+    """将智能体事件编码为SSE"""
+    async for event in agent_executor.execute_stream(request.user_input, request.session_id, request.options):
+        yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+@router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    agent_executor: AgentExecutor = Depends(get_agent_executor)
+):
+    """SSE流式对话：逐个推送路由、工具事件和LLM令牌"""
+    return StreamingResponse(
+        _sse_events(agent_executor, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _stream_to_websocket(websocket: WebSocket, agent_executor: AgentExecutor, request: ChatRequest):
+    async for event in agent_executor.execute_stream(request.user_input, request.session_id, request.options):
+        await websocket.send_json(event)
+
+@router.websocket("/ws")
+async def chat_websocket(
+    websocket: WebSocket,
+    agent_executor: AgentExecutor = Depends(get_agent_executor)
+):
+    """WebSocket流式对话，客户端断开或发送任意消息时取消当前生成"""
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                request = ChatRequest(**await websocket.receive_json())
+            except (ValidationError, ValueError) as e:
+                await websocket.send_json({"type": "error", "error": f"请求格式错误: {str(e)}"})
+                continue
+
+            stream_task = asyncio.create_task(_stream_to_websocket(websocket, agent_executor, request))
+            watch_task = asyncio.create_task(websocket.receive_json())
+            done, _ = await asyncio.wait({stream_task, watch_task}, return_when=asyncio.FIRST_COMPLETED)
+
+            if watch_task in done:
+                stream_task.cancel()
+                watch_task.result()  # re-raises WebSocketDisconnect
+                await websocket.send_json({"type": "cancelled", "session_id": request.session_id})
+            else:
+                watch_task.cancel()
+                stream_task.result()
+    except WebSocketDisconnect:
+        pass
+
 @router.post("/analyze-file")
-async def analyze_file(request: FileAnalysisRequest):
+async def analyze_file(
+    request: FileAnalysisRequest,
+    agent_executor: AgentExecutor = Depends(get_agent_executor)
+):
     """分析单个文件"""
     try:
         prompt = f"请对文件 {request.file_reference} 进行 {request.analysis_type} 分析"
@@ -73,46 +131,63 @@ async def analyze_file(request: FileAnalysisRequest):
         raise HTTPException(status_code=500, detail=f"文件分析失败: {str(e)}")
 
 @router.post("/bulk-analysis")
-async def bulk_analysis(request: BulkAnalysisRequest):
-    """批量分析多个文件"""
-    try:
-        files_str = ", ".join(request.file_references)
-        prompt = f"请分析以下文件：{files_str}。分析要求：{request.analysis_prompt}"
-        
-        result = await agent_executor.execute(prompt, request.session_id)
-        
-        if result.get("success"):
-            return {
-                "session_id": request.session_id,
-                "analysis": result.get("result"),
-                "file_count": len(request.file_references),
-                "files_analyzed": request.file_references
-            }
-        else:
-            raise HTTPException(status_code=500, detail=result.get("error"))
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"批量分析失败: {str(e)}")
+async def bulk_analysis(
+    request: BulkAnalysisRequest,
+    agent_executor: AgentExecutor = Depends(get_agent_executor)
+):
+    """批量分析多个文件（并发读取和分析，返回合并结果及每个文件的耗时和状态）"""
+    if not request.file_references:
+        raise HTTPException(status_code=400, detail="未提供文件")
+    result = await agent_executor.execute_bulk(
+        request.file_references,
+        request.analysis_prompt,
+        request.session_id
+    )
+    if not result.get("success"):
+        raise HTTPException(status_code=502, detail=result.get("error"))
 
-@router.get("/sessions/{session_id}/history")
-async def get_session_history(session_id: str):
-    """获取会话历史"""
-    # This would typically query a database
-    # For now, return a placeholder
+    metadata = result["metadata"]
     return {
-        "session_id": session_id,
-        "history": [],
-        "message": "Session history feature not yet implemented"
+        "session_id": request.session_id,
+        "analysis": result["result"],
+        "file_count": len(request.file_references),
+        "files_analyzed": [f["file_reference"] for f in metadata["files"] if f["success"]],
+        "files_failed": [f["file_reference"] for f in metadata["files"] if not f["success"]],
+        "files": metadata["files"],
+        "tokens_used": metadata["tokens_used"],
+        "timing": metadata["timing"]
     }
 
+@router.get("/sessions/stats")
+async def get_sessions_stats(chat_history: ChatHistoryStore = Depends(get_chat_history)):
+    """获取内存会话统计"""
+    return chat_history.get_stats()
+
+@router.get("/sessions/{session_id}/history")
+async def get_session_history(
+    session_id: str,
+    limit: int = 100,
+    before_seq: Optional[int] = None,
+    chat_history: ChatHistoryStore = Depends(get_chat_history)
+):
+    """获取会话历史"""
+    try:
+        return await chat_history.get_history(session_id, limit, before_seq)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取会话历史失败: {str(e)}")
+
 @router.delete("/sessions/{session_id}")
-async def clear_session(session_id: str):
+async def clear_session(
+    session_id: str,
+    chat_history: ChatHistoryStore = Depends(get_chat_history)
+):
     """清除会话"""
     try:
-        # Clear any session-specific data
+        deleted = await chat_history.clear(session_id)
         return {
             "session_id": session_id,
             "status": "cleared",
+            "deleted_messages": deleted,
             "message": "会话已清除"
         }
     except Exception as e:
@@ -123,22 +198,23 @@ async def generate_custom_report(
     topic: str,
     session_id: str,
     format: str = "html",
-    template: Optional[str] = None
+    template: Optional[str] = None,
+    agent_executor: AgentExecutor = Depends(get_agent_executor)
 ):
-    """生成自定义报告"""
+    """生成自定义报告；template为报告模板名称（见 /report-templates）"""
+    if template and template not in list_templates():
+        raise HTTPException(status_code=400, detail=f"报告模板不存在: {template}（可用模板：{', '.join(list_templates())}）")
     try:
         prompt = f"生成关于 {topic} 的专业报告"
-        if template:
-            prompt += f"，使用模板：{template}"
-            
-        result = await agent_executor.execute(prompt, session_id)
+        result = await agent_executor.execute(prompt, session_id, options={"template": template})
         
         if result.get("success"):
             return {
                 "session_id": session_id,
                 "report_path": result.get("result"),
                 "topic": topic,
-                "format": format
+                "format": format,
+                "template": template or DEFAULT_TEMPLATE
             }
         else:
             raise HTTPException(status_code=500, detail=result.get("error"))
@@ -146,11 +222,17 @@ async def generate_custom_report(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"报告生成失败: {str(e)}")
 
+@router.get("/report-templates")
+async def get_report_templates():
+    """列出可用的报告模板"""
+    return {"templates": list_templates(), "default": DEFAULT_TEMPLATE}
+
 @router.post("/generate-chart")
 async def generate_custom_chart(
     data_description: str,
     session_id: str,
-    chart_type: str = "auto"
+    chart_type: str = "auto",
+    agent_executor: AgentExecutor = Depends(get_agent_executor)
 ):
     """生成自定义图表"""
     try:
@@ -1,33 +1,66 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from services.mcp_client import MCPClient
-import tempfile
+from services.chart_generator import ChartGenerator
+from services.report_generator import ReportGenerator, ReportTemplateError
+from services.extraction_cache import get_extraction_cache
+from services.tabular_analytics import TableError, get_tabular_analytics
+from services.upload_storage import save_upload, UploadTooLargeError
+from services.concurrency import get_host_limiter, iterate_completed
+from dependencies import get_mcp_client, get_chart_generator, get_report_generator
+import json
 import os
+import time
 
 router = APIRouter()
 
-# Initialize MCP client for file extraction
-mcp_client = MCPClient()
-
 class FileExtractionRequest(BaseModel):
     file_url: str
     extraction_type: str = "text"
     session_id: str = "default"
     options: Optional[Dict[str, Any]] = None
 
+class TableAnalysisSpec(BaseModel):
+    value: Optional[str] = None  # numeric column; omitted for row counts
+    agg: str = "sum"  # sum / mean / count / min / max
+    group_by: Optional[str] = None
+    time_column: Optional[str] = None
+    freq: str = "month"  # day / week / month / quarter / year
+    limit: Optional[int] = None  # top N groups, or the most recent N periods
+    ascending: bool = False
+
+class TableAnalysisRequest(TableAnalysisSpec):
+    file_path: str  # relative to one of TABLE_DATA_DIRS
+    sheet: Optional[str] = None
+    chart_type: Optional[str] = None  # also build a chart from the result
+
+class TableReportRequest(BaseModel):
+    file_path: str
+    topic: str
+    session_id: str = "default"
+    sheet: Optional[str] = None
+    analyses: List[TableAnalysisSpec] = []
+    template: Optional[str] = None  # report template name
+
 class BatchExtractionRequest(BaseModel):
     file_urls: List[str]
     extraction_type: str = "text"
     session_id: str = "default"
+    stream: Optional[str] = None  # "ndjson" or "sse" to stream per-file results
 
 @router.post("/extract-url")
-async def extract_from_url(request: FileExtractionRequest):
+async def extract_from_url(
+    request: FileExtractionRequest,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """从URL提取文件内容"""
     try:
         result = await mcp_client.extract_file(
             request.file_url, 
-            request.extraction_type
+            request.extraction_type,
+            request.session_id
         )
         
         return {
@@ -44,27 +77,28 @@ async def extract_from_url(request: FileExtractionRequest):
 async def extract_from_upload(
     file: UploadFile = File(...),
     extraction_type: str = "text",
-    session_id: str = "default"
+    session_id: str = "default",
+    mcp_client: MCPClient = Depends(get_mcp_client)
 ):
     """从上传的文件提取内容"""
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{file.filename}") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        # Stream the upload to a uniquely named temp file, hashing as we go
+        saved = await save_upload(file)
+        temp_file_path = saved["path"]
         
         try:
             # Extract content using MCP
             result = await mcp_client.extract_file(
                 temp_file_path,
-                extraction_type
+                extraction_type,
+                session_id,
+                content_hash=saved["sha256"]
             )
             
             return {
                 "success": True,
                 "filename": file.filename,
-                "file_size": len(content),
+                "file_size": saved["size"],
                 "extraction_type": extraction_type,
                 "result": result,
                 "session_id": session_id
@@ -74,50 +108,190 @@ async def extract_from_upload(
             if os.path.exists(temp_file_path):
                 os.unlink(temp_file_path)
                 
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文件上传提取失败: {str(e)}")
 
+async def _extract_one(mcp_client: MCPClient, index: int, file_url: str, request: BatchExtractionRequest) -> Dict[str, Any]:
+    """在并发限制下提取单个文件"""
+    limiter = get_host_limiter("extract_batch", "BATCH_MAX_CONCURRENCY", "BATCH_PER_HOST_CONCURRENCY")
+    async with limiter.limit(file_url):
+        started = time.perf_counter()
+        try:
+            result = await mcp_client.extract_file(
+                file_url,
+                request.extraction_type,
+                request.session_id
+            )
+            return {
+                "index": index,
+                "file_url": file_url,
+                "success": True,
+                "result": result,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+            }
+        except Exception as e:
+            return {
+                "index": index,
+                "file_url": file_url,
+                "success": False,
+                "error": str(e),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+            }
+
+def _batch_summary(request: BatchExtractionRequest, succeeded: int, failed: int) -> Dict[str, Any]:
+    return {
+        "success": True,
+        "total_files": len(request.file_urls),
+        "successful_extractions": succeeded,
+        "failed_extractions": failed,
+        "session_id": request.session_id
+    }
+
+async def _stream_batch(mcp_client: MCPClient, request: BatchExtractionRequest):
+    """按完成顺序逐条输出提取结果，最后输出汇总"""
+    succeeded = failed = 0
+    jobs = [_extract_one(mcp_client, i, url, request) for i, url in enumerate(request.file_urls)]
+    async for _, item in iterate_completed(jobs):
+        if item["success"]:
+            succeeded += 1
+        else:
+            failed += 1
+        yield _format_event("result", item, request.stream)
+    yield _format_event("summary", _batch_summary(request, succeeded, failed), request.stream)
+
+def _format_event(event: str, data: Dict[str, Any], stream: str) -> str:
+    payload = json.dumps(data, ensure_ascii=False)
+    if stream == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return json.dumps({"type": event, **data}, ensure_ascii=False) + "\n"
+
 @router.post("/extract-batch")
-async def extract_batch(request: BatchExtractionRequest):
-    """批量提取多个文件"""
+async def extract_batch(
+    request: BatchExtractionRequest,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
+    """批量提取多个文件（有界并发，可选NDJSON/SSE流式返回）"""
+    if request.stream in ("ndjson", "sse"):
+        media_type = "text/event-stream" if request.stream == "sse" else "application/x-ndjson"
+        return StreamingResponse(_stream_batch(mcp_client, request), media_type=media_type)
+
     try:
         results = []
         errors = []
         
-        for file_url in request.file_urls:
-            try:
-                result = await mcp_client.extract_file(
-                    file_url,
-                    request.extraction_type
-                )
+        items = [None] * len(request.file_urls)
+        jobs = [_extract_one(mcp_client, i, url, request) for i, url in enumerate(request.file_urls)]
+        async for index, item in iterate_completed(jobs):
+            items[index] = item
+
+        # Keep the response in request order
+        for item in items:
+            if item["success"]:
                 results.append({
-                    "file_url": file_url,
+                    "file_url": item["file_url"],
                     "success": True,
-                    "result": result
+                    "result": item["result"]
                 })
-            except Exception as e:
+            else:
                 errors.append({
-                    "file_url": file_url,
-                    "error": str(e)
+                    "file_url": item["file_url"],
+                    "error": item["error"]
                 })
         
         return {
-            "success": True,
-            "total_files": len(request.file_urls),
-            "successful_extractions": len(results),
-            "failed_extractions": len(errors),
+            **_batch_summary(request, len(results), len(errors)),
             "results": results,
-            "errors": errors,
-            "session_id": request.session_id
+            "errors": errors
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"批量提取失败: {str(e)}")
 
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """获取提取缓存命中统计"""
+    return get_extraction_cache().get_stats()
+
+@router.get("/engine/stats")
+async def get_engine_stats(mcp_client: MCPClient = Depends(get_mcp_client)):
+    """获取本地/MCP/缓存各提取路径的使用统计"""
+    return mcp_client.get_extraction_stats()
+
+@router.post("/tables/analyze")
+async def analyze_table(
+    request: TableAnalysisRequest,
+    chart_generator: ChartGenerator = Depends(get_chart_generator)
+):
+    """对上传的CSV/XLSX表格做分组或时间序列聚合，可选直接生成图表"""
+    analytics = get_tabular_analytics()
+    try:
+        path = analytics.resolve(request.file_path)
+        result = await analytics.analyze(path, sheet=request.sheet, **request.model_dump(include=set(TableAnalysisSpec.model_fields)))
+    except TableError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"表格分析失败: {str(e)}")
+
+    if request.chart_type:
+        chart_data = {k: v for k, v in result.items() if k in ("title", "categories", "values", "series_name")}
+        result["chart"] = json.loads(await chart_generator.generate_from_data(chart_data, request.chart_type))
+    return result
+
+@router.get("/tables/profile")
+async def profile_table(file_path: str, sheet: Optional[str] = None):
+    """按列汇总表格（类型、合计、均值、极值、高频取值）"""
+    analytics = get_tabular_analytics()
+    try:
+        return await analytics.profile(analytics.resolve(file_path), sheet)
+    except TableError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"表格汇总失败: {str(e)}")
+
+@router.post("/tables/report")
+async def report_from_table(
+    request: TableReportRequest,
+    report_generator: ReportGenerator = Depends(get_report_generator)
+):
+    """基于表格的实际统计结果生成报告"""
+    analytics = get_tabular_analytics()
+    try:
+        path = analytics.resolve(request.file_path)
+        data: Dict[str, Any] = {"profile": await analytics.profile(path, request.sheet)}
+        if request.analyses:
+            analyses = [await analytics.analyze(path, sheet=request.sheet, **spec.model_dump()) for spec in request.analyses]
+            data["analyses"] = [{k: v for k, v in a.items() if k != "metadata"} for a in analyses]
+    except TableError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        report_path = await report_generator.generate(
+            request.topic, request.session_id, data=data, template=request.template
+        )
+    except ReportTemplateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"报告生成失败: {str(e)}")
+    return {
+        "session_id": request.session_id,
+        "report_path": report_path,
+        "topic": request.topic,
+        "rows": data["profile"]["rows"],
+        "analyses": len(request.analyses)
+    }
+
+@router.get("/tables/stats")
+async def get_table_stats():
+    """获取表格列缓存统计"""
+    return get_tabular_analytics().get_stats()
+
 @router.get("/supported-formats")
-async def get_supported_formats():
+async def get_supported_formats(mcp_client: MCPClient = Depends(get_mcp_client)):
     """获取支持的文件格式"""
     return {
+        "local_formats": mcp_client.local_extractor.supported_extensions(),
         "text_formats": [
             "txt", "md", "csv", "json", "xml", "html", 
             "py", "js", "ts", "java", "cpp", "c", "go", "rs"
@@ -137,14 +311,16 @@ async def get_supported_formats():
 async def analyze_extracted_content(
     content: str,
     analysis_type: str = "summary",
-    session_id: str = "default"
+    session_id: str = "default",
+    mcp_client: MCPClient = Depends(get_mcp_client)
 ):
     """分析提取的内容"""
     try:
         # Use MCP for advanced analysis
         analysis_result = await mcp_client.query(
             f"请对以下内容进行{analysis_type}分析：\n\n{content[:2000]}",  # Limit content length
-            context={"analysis_type": analysis_type, "content_length": len(content)}
+            context={"analysis_type": analysis_type, "content_length": len(content)},
+            session_id=session_id
         )
         
         return {
@@ -159,11 +335,14 @@ async def analyze_extracted_content(
         raise HTTPException(status_code=500, detail=f"内容分析失败: {str(e)}")
 
 @router.get("/extraction-status/{session_id}")
-async def get_extraction_status(session_id: str):
+async def get_extraction_status(
+    session_id: str,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """获取提取任务状态"""
     try:
         # Query session status from MCP
-        context = await mcp_client.retrieve_context(f"extraction_status_{session_id}")
+        context = await mcp_client.retrieve_context(f"extraction_status_{session_id}", session_id)
         
         if context:
             return {
@@ -183,13 +362,17 @@ async def get_extraction_status(session_id: str):
         raise HTTPException(status_code=500, detail=f"状态查询失败: {str(e)}")
 
 @router.delete("/sessions/{session_id}")
-async def clear_extraction_session(session_id: str):
+async def clear_extraction_session(
+    session_id: str,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """清除提取会话"""
     try:
         # Clear session data
         await mcp_client.store_context(
             f"extraction_status_{session_id}",
-            {"status": "cleared", "timestamp": "cleared"}
+            {"status": "cleared", "timestamp": "cleared"},
+            session_id
         )
         
         return {
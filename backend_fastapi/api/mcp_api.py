@@ -1,15 +1,14 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from services.mcp_client import MCPClient
+from services.upload_storage import save_upload, UploadTooLargeError
+from dependencies import get_mcp_client
 import json
 import os
 
 router = APIRouter()
 
-# Initialize MCP client
-mcp_client = MCPClient()
-
 class MCPRequest(BaseModel):
     query: str
     context: Optional[Dict[str, Any]] = None
@@ -24,6 +23,7 @@ class ContextStoreRequest(BaseModel):
     key: str
     data: Dict[str, Any]
     session_id: str = "default"
+    ttl: Optional[float] = None  # seconds; 0 keeps the entry until deleted
 
 class KnowledgeGraphRequest(BaseModel):
     documents: List[str]
@@ -31,10 +31,13 @@ class KnowledgeGraphRequest(BaseModel):
     session_id: str = "default"
 
 @router.post("/query")
-async def mcp_query(request: MCPRequest):
+async def mcp_query(
+    request: MCPRequest,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """MCP查询接口"""
     try:
-        result = await mcp_client.query(request.query, request.context)
+        result = await mcp_client.query(request.query, request.context, request.session_id)
         return {
             "success": True,
             "query": request.query,
@@ -45,10 +48,13 @@ async def mcp_query(request: MCPRequest):
         raise HTTPException(status_code=500, detail=f"MCP查询失败: {str(e)}")
 
 @router.post("/documents/process")
-async def process_document(request: DocumentProcessRequest):
+async def process_document(
+    request: DocumentProcessRequest,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """处理文档"""
     try:
-        result = await mcp_client.process_document(request.document_path, request.document_type)
+        result = await mcp_client.process_document(request.document_path, request.document_type, request.session_id)
         return {
             "success": True,
             "document_path": request.document_path,
@@ -61,22 +67,21 @@ async def process_document(request: DocumentProcessRequest):
 @router.post("/documents/upload")
 async def upload_document(
     file: UploadFile = File(...),
-    session_id: str = "default"
+    session_id: str = "default",
+    mcp_client: MCPClient = Depends(get_mcp_client)
 ):
     """上传并处理文档"""
     try:
-        # Save uploaded file temporarily
-        upload_dir = "temp_uploads"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        file_path = os.path.join(upload_dir, file.filename)
-        
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Stream the upload to a uniquely named temp file, hashing as we go
+        saved = await save_upload(file)
+        file_path = saved["path"]
         
         # Process with MCP
-        result = await mcp_client.process_document(file_path)
+        result = await mcp_client.process_document(
+            file_path,
+            session_id=session_id,
+            content_hash=saved["sha256"]
+        )
         
         # Clean up temporary file
         os.remove(file_path)
@@ -84,10 +89,13 @@ async def upload_document(
         return {
             "success": True,
             "filename": file.filename,
+            "file_size": saved["size"],
             "result": result,
             "session_id": session_id
         }
         
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         # Clean up on error
         if 'file_path' in locals() and os.path.exists(file_path):
@@ -98,11 +106,17 @@ async def upload_document(
 async def semantic_search(
     query: str,
     filters: Optional[Dict[str, Any]] = None,
-    session_id: str = "default"
+    session_id: str = "default",
+    rerank: Optional[bool] = None,
+    similarity_threshold: Optional[float] = None,
+    max_results: int = 20,
+    mcp_client: MCPClient = Depends(get_mcp_client)
 ):
     """语义搜索"""
     try:
-        result = await mcp_client.semantic_search(query, filters)
+        result = await mcp_client.semantic_search(
+            query, filters, session_id, rerank, similarity_threshold, max_results
+        )
         return {
             "success": True,
             "query": query,
@@ -112,11 +126,20 @@ async def semantic_search(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"语义搜索失败: {str(e)}")
 
+@router.get("/search/index/stats")
+async def get_search_index_stats(mcp_client: MCPClient = Depends(get_mcp_client)):
+    """获取本地全文索引和向量索引统计"""
+    return mcp_client.get_search_stats()
+
 @router.get("/documents/{document_id}/insights")
-async def get_document_insights(document_id: str, session_id: str = "default"):
+async def get_document_insights(
+    document_id: str,
+    session_id: str = "default",
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """获取文档洞察"""
     try:
-        result = await mcp_client.get_document_insights(document_id)
+        result = await mcp_client.get_document_insights(document_id, session_id)
         return {
             "success": True,
             "document_id": document_id,
@@ -127,10 +150,13 @@ async def get_document_insights(document_id: str, session_id: str = "default"):
         raise HTTPException(status_code=500, detail=f"获取文档洞察失败: {str(e)}")
 
 @router.post("/knowledge-graph/create")
-async def create_knowledge_graph(request: KnowledgeGraphRequest):
+async def create_knowledge_graph(
+    request: KnowledgeGraphRequest,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """创建知识图谱"""
     try:
-        result = await mcp_client.create_knowledge_graph(request.documents, request.topic)
+        result = await mcp_client.create_knowledge_graph(request.documents, request.topic, request.session_id)
         return {
             "success": True,
             "topic": request.topic,
@@ -145,11 +171,12 @@ async def create_knowledge_graph(request: KnowledgeGraphRequest):
 async def analyze_documents(
     document_ids: List[str],
     analysis_type: str = "comprehensive",
-    session_id: str = "default"
+    session_id: str = "default",
+    mcp_client: MCPClient = Depends(get_mcp_client)
 ):
     """分析文档"""
     try:
-        result = await mcp_client.analyze_documents(document_ids, analysis_type)
+        result = await mcp_client.analyze_documents(document_ids, analysis_type, session_id)
         return {
             "success": True,
             "document_ids": document_ids,
@@ -160,11 +187,19 @@ async def analyze_documents(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文档分析失败: {str(e)}")
 
+@router.get("/context/stats")
+async def get_context_stats(mcp_client: MCPClient = Depends(get_mcp_client)):
+    """获取本地上下文存储统计"""
+    return mcp_client.get_context_stats()
+
 @router.post("/context/store")
-async def store_context(request: ContextStoreRequest):
+async def store_context(
+    request: ContextStoreRequest,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """存储上下文"""
     try:
-        success = await mcp_client.store_context(request.key, request.data)
+        success = await mcp_client.store_context(request.key, request.data, request.session_id, request.ttl)
         return {
             "success": success,
             "key": request.key,
@@ -174,10 +209,14 @@ async def store_context(request: ContextStoreRequest):
         raise HTTPException(status_code=500, detail=f"上下文存储失败: {str(e)}")
 
 @router.get("/context/{key}")
-async def retrieve_context(key: str, session_id: str = "default"):
+async def retrieve_context(
+    key: str,
+    session_id: str = "default",
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """检索上下文"""
     try:
-        result = await mcp_client.retrieve_context(key)
+        result = await mcp_client.retrieve_context(key, session_id)
         if result is None:
             raise HTTPException(status_code=404, detail="上下文未找到")
         
@@ -192,14 +231,32 @@ async def retrieve_context(key: str, session_id: str = "default"):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"上下文检索失败: {str(e)}")
 
+@router.delete("/context/{key}")
+async def delete_context(
+    key: str,
+    session_id: str = "default",
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
+    """删除上下文"""
+    try:
+        await mcp_client.delete_context(key, session_id)
+        return {
+            "success": True,
+            "key": key,
+            "session_id": session_id
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"上下文删除失败: {str(e)}")
+
 @router.post("/context/summary")
 async def get_context_summary(
     context_keys: List[str],
-    session_id: str = "default"
+    session_id: str = "default",
+    mcp_client: MCPClient = Depends(get_mcp_client)
 ):
     """获取上下文摘要"""
     try:
-        result = await mcp_client.get_context_summary(context_keys)
+        result = await mcp_client.get_context_summary(context_keys, session_id)
         return {
             "success": True,
             "context_keys": context_keys,
@@ -210,7 +267,7 @@ async def get_context_summary(
         raise HTTPException(status_code=500, detail=f"上下文摘要生成失败: {str(e)}")
 
 @router.get("/health")
-async def health_check():
+async def health_check(mcp_client: MCPClient = Depends(get_mcp_client)):
     """健康检查"""
     try:
         result = await mcp_client.health_check()
@@ -218,8 +275,21 @@ async def health_check():
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
 
+@router.get("/pool/stats")
+async def get_pool_stats(mcp_client: MCPClient = Depends(get_mcp_client)):
+    """获取MCP连接池统计"""
+    return mcp_client.get_pool_stats()
+
+@router.get("/sessions/stats")
+async def get_session_stats(mcp_client: MCPClient = Depends(get_mcp_client)):
+    """获取MCP会话映射统计"""
+    return mcp_client.get_session_stats()
+
 @router.post("/sessions/initialize")
-async def initialize_session(client_info: Optional[Dict[str, Any]] = None):
+async def initialize_session(
+    client_info: Optional[Dict[str, Any]] = None,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """初始化MCP会话"""
     try:
         session_id = await mcp_client.initialize_session()
@@ -232,10 +302,13 @@ async def initialize_session(client_info: Optional[Dict[str, Any]] = None):
         raise HTTPException(status_code=500, detail=f"会话初始化失败: {str(e)}")
 
 @router.delete("/sessions/{session_id}")
-async def close_session(session_id: str):
+async def close_session(
+    session_id: str,
+    mcp_client: MCPClient = Depends(get_mcp_client)
+):
     """关闭MCP会话"""
     try:
-        await mcp_client.close_session()
+        await mcp_client.close_session(session_id)
         return {
             "success": True,
             "session_id": session_id,
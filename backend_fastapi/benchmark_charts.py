@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+图表生成基准测试：规则编译 vs LLM生成
+
+用法:
+    python benchmark_charts.py                 # 只测规则编译
+    python benchmark_charts.py --llm 3         # 同时对每种数据调用LLM 3次（需要OPENAI_API_KEY）
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from services.chart_builder import build_chart
+
+SAMPLES = {
+    "bar": {
+        "title": "各区县规上企业数量",
+        "categories": ["高新区", "经开区", "滨江区", "城东区", "城西区", "南湖区"],
+        "values": [320, 285, 198, 176, 142, 97]
+    },
+    "line": {
+        "title": "季度产值趋势（亿元）",
+        "categories": ["2023Q1", "2023Q2", "2023Q3", "2023Q4", "2024Q1", "2024Q2", "2024Q3", "2024Q4"],
+        "series": {"电子信息": [120, 132, 141, 158, 150, 166, 175, 190], "装备制造": [98, 101, 110, 115, 109, 118, 124, 131]}
+    },
+    "pie": {"title": "产业结构", "电子信息": 38.5, "装备制造": 24.1, "新材料": 15.2, "生物医药": 12.7, "其他": 9.5},
+    "scatter": {
+        "title": "研发投入与营收增速",
+        "x": [1.2, 2.5, 3.1, 4.8, 5.5, 6.2, 7.9, 8.4],
+        "y": [3.5, 6.1, 5.8, 9.2, 11.0, 10.4, 14.8, 15.3]
+    }
+}
+
+def bench_rules(iterations: int) -> dict:
+    """规则编译：每种数据重复编译并序列化为JSON"""
+    timings = {}
+    for chart_type, data in SAMPLES.items():
+        started = time.perf_counter()
+        for _ in range(iterations):
+            json.dumps(build_chart(data, chart_type), ensure_ascii=False)
+        timings[chart_type] = (time.perf_counter() - started) / iterations * 1000
+    return timings
+
+async def bench_llm(runs: int) -> dict:
+    """LLM生成：关闭规则编译和响应缓存后调用generate_from_data"""
+    os.environ["CHART_RULE_BUILDER"] = "false"
+    os.environ["CHART_CACHE_ENABLED"] = "false"
+    from services.chart_generator import ChartGenerator
+
+    generator = ChartGenerator()
+    timings = {}
+    for chart_type, data in SAMPLES.items():
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            await generator.generate_from_data(data, chart_type)
+            samples.append((time.perf_counter() - started) * 1000)
+        timings[chart_type] = statistics.median(samples)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="图表生成基准测试")
+    parser.add_argument("--iterations", type=int, default=2000, help="规则编译重复次数")
+    parser.add_argument("--llm", type=int, default=0, help="每种数据调用LLM的次数（0表示跳过）")
+    args = parser.parse_args()
+
+    print("📊 图表生成基准测试")
+    print("=" * 50)
+
+    rules = bench_rules(args.iterations)
+    llm = {}
+    if args.llm:
+        if not os.getenv("OPENAI_API_KEY"):
+            print("⚠️ 未配置OPENAI_API_KEY，跳过LLM基准")
+        else:
+            llm = asyncio.run(bench_llm(args.llm))
+
+    for chart_type, rule_ms in rules.items():
+        line = f"{chart_type:<8} 规则编译 {rule_ms:8.3f} ms"
+        if chart_type in llm:
+            line += f" | LLM {llm[chart_type]:9.1f} ms | 加速 {llm[chart_type] / rule_ms:,.0f}x"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+报告渲染基准测试：每次新建Template vs 共享Environment缓存的模板
+
+用法:
+    python benchmark_report_render.py                    # 默认模板，每种方式渲染500次
+    python benchmark_report_render.py --template minimal --iterations 2000
+"""
+
+import argparse
+import os
+import time
+
+from jinja2 import Template
+
+from services.report_generator import ReportGenerator, TEMPLATE_DIR
+
+REPORT_DATA = {
+    "title": "长三角新能源汽车产业集群分析报告",
+    "executive_summary": "本报告从产业规模、创新能力和产业链协同三个维度对集群进行评估。" * 3,
+    "sections": [
+        {
+            "title": f"第{i + 1}部分",
+            "content": "集群企业数量稳步增长，龙头企业带动效应明显，配套企业本地化率持续提升。" * 4,
+            "subsections": [
+                {"title": f"{i + 1}.{j + 1} 细分分析", "content": "核心零部件国产化进程加快，研发投入保持两位数增长。" * 2}
+                for j in range(3)
+            ]
+        }
+        for i in range(6)
+    ],
+    "recommendations": [f"建议{i + 1}：完善产业链配套与公共服务平台建设" for i in range(5)],
+    "conclusion": "集群整体处于快速成长期，具备建设世界级产业集群的基础。"
+}
+
+def bench(label: str, render, iterations: int) -> float:
+    render()  # warm up
+    started = time.perf_counter()
+    for _ in range(iterations):
+        render()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<16} {elapsed / iterations * 1000:8.3f} ms/次 | {iterations / elapsed:8.0f} 次/秒")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="报告渲染基准测试")
+    parser.add_argument("--template", default="default", help="报告模板名称")
+    parser.add_argument("--iterations", type=int, default=500, help="每种方式的渲染次数")
+    args = parser.parse_args()
+
+    with open(os.path.join(TEMPLATE_DIR, f"{args.template}.html"), encoding="utf-8") as f:
+        source = f.read()
+    generator = ReportGenerator()
+
+    print("📄 报告渲染基准测试")
+    print("=" * 50)
+    # The old code path: parse and compile the template source for every report
+    uncached = bench(
+        "每次编译",
+        lambda: Template(source).render(report_data=REPORT_DATA, current_time="2025年01月01日 00:00"),
+        args.iterations
+    )
+    cached = bench(
+        "共享Environment",
+        lambda: generator._create_html_report(REPORT_DATA, args.template),
+        args.iterations
+    )
+    print(f"加速 {uncached / cached:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import threading
+from typing import Dict, Any, Callable, List
+
+from agent.agent_executor import AgentExecutor
+from services.chart_generator import ChartGenerator
+from services.chat_history import ChatHistoryStore
+from services.file_reader import FileReader
+from services.mcp_client import MCPClient
+from services.report_generator import ReportGenerator
+from services.status_monitor import ServerStatusMonitor
+
+class ServiceContainer:
+    """进程级服务容器：每个服务在首次使用时构建一次，供所有路由共享"""
+
+    def __init__(self):
+        self._services: Dict[str, Any] = {}
+        # Re-entrant because building the agent builds the services it wraps
+        self._lock = threading.RLock()
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        service = self._services.get(name)
+        if service is None:
+            with self._lock:
+                service = self._services.get(name)
+                if service is None:
+                    service = factory()
+                    self._services[name] = service
+        return service
+
+    def is_built(self, name: str) -> bool:
+        return name in self._services
+
+    def built_services(self) -> List[str]:
+        """已构建的服务列表"""
+        return list(self._services)
+
+    def mcp_client(self) -> MCPClient:
+        return self._get("mcp_client", MCPClient)
+
+    def file_reader(self) -> FileReader:
+        return self._get("file_reader", FileReader)
+
+    def chart_generator(self) -> ChartGenerator:
+        return self._get("chart_generator", ChartGenerator)
+
+    def report_generator(self) -> ReportGenerator:
+        return self._get("report_generator", ReportGenerator)
+
+    def chat_history(self) -> ChatHistoryStore:
+        return self._get("chat_history", ChatHistoryStore)
+
+    def status_monitor(self) -> ServerStatusMonitor:
+        return self._get("status_monitor", lambda: ServerStatusMonitor(self.file_reader(), self.mcp_client()))
+
+    def agent_executor(self) -> AgentExecutor:
+        return self._get("agent_executor", lambda: AgentExecutor(
+            chart_generator=self.chart_generator(),
+            report_generator=self.report_generator(),
+            file_reader=self.file_reader(),
+            mcp_client=self.mcp_client(),
+            chat_history=self.chat_history()
+        ))
+
+    async def aclose(self):
+        """关闭已构建服务持有的后台任务和连接"""
+        if self.is_built("status_monitor"):
+            await self.status_monitor().stop()
+        if self.is_built("chat_history"):
+            await self.chat_history().aclose()
+        if self.is_built("mcp_client"):
+            await self.mcp_client().aclose()
+
+container = ServiceContainer()
+
+# FastAPI dependencies
+def get_mcp_client() -> MCPClient:
+    return container.mcp_client()
+
+def get_file_reader() -> FileReader:
+    return container.file_reader()
+
+def get_chart_generator() -> ChartGenerator:
+    return container.chart_generator()
+
+def get_report_generator() -> ReportGenerator:
+    return container.report_generator()
+
+def get_chat_history() -> ChatHistoryStore:
+    return container.chat_history()
+
+def get_status_monitor() -> ServerStatusMonitor:
+    return container.status_monitor()
+
+def get_agent_executor() -> AgentExecutor:
+    return container.agent_executor()
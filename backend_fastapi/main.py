@@ -1,17 +1,36 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from api.chat_api import router as chat_router
 from api.agent_api import router as agent_router
 from api.mcp_api import router as mcp_router
 from api.file_extractor_api import router as file_extractor_router
+from dependencies import container
+import asyncio
 import uvicorn
 import os
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：管理MCP连接池和服务器状态探测，重量级服务按需构建"""
+    await container.mcp_client().start()
+    container.status_monitor().start()
+
+    warmup = None
+    if os.getenv("SERVICE_WARMUP", "false").lower() == "true":
+        # Build the LangChain agent off the event loop so /health answers immediately
+        warmup = asyncio.create_task(asyncio.to_thread(container.agent_executor))
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    await container.aclose()
+
 app = FastAPI(
     title="产业集群智能体 FastAPI Backend",
     description="Advanced AI-powered industrial cluster management system",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -39,7 +58,7 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "fastapi-backend"}
+    return {"status": "healthy", "service": "fastapi-backend", "loaded_services": container.built_services()}
 
 if __name__ == "__main__":
     uvicorn.run(
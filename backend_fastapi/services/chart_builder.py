@@ -0,0 +1,184 @@
+import math
+from numbers import Number
+from typing import Dict, Any, List, Optional, Tuple
+
+# House palette, starting with the primary blue used by the fallback chart
+PALETTE = ["#3b82f6", "#10b981", "#f59e0b", "#ef4444", "#8b5cf6", "#06b6d4", "#ec4899", "#84cc16"]
+SUPPORTED_TYPES = ("bar", "line", "pie", "scatter")
+
+_CATEGORY_KEYS = ("categories", "labels", "x", "xAxis", "names")
+_VALUE_KEYS = ("values", "data", "y", "counts")
+_TITLE_KEYS = ("title", "name")
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, Number) and not isinstance(value, bool) and not (isinstance(value, float) and math.isnan(value))
+
+def _numeric_list(values: Any) -> bool:
+    # Exact int/float checks first: the Number ABC check dominates on long series
+    return isinstance(values, list) and bool(values) and all(
+        v is None or (v.__class__ in (int, float) and v == v) or _is_number(v) for v in values
+    )
+
+def _first(data: Dict[str, Any], keys: Tuple[str, ...]) -> Any:
+    for key in keys:
+        if key in data:
+            return data[key]
+    return None
+
+def _series_from_records(records: List[Dict[str, Any]]) -> Optional[Tuple[List[Any], List[Tuple[str, List[Any]]]]]:
+    """记录列表：第一个非数值字段作为类别，其余数值字段各成一个系列"""
+    if not records or not all(isinstance(r, dict) for r in records):
+        return None
+    fields = list(records[0])
+    category = next((f for f in fields if not _is_number(records[0][f])), None)
+    numeric = [f for f in fields if f != category and all(_is_number(r.get(f)) or r.get(f) is None for r in records)]
+    if category is None or not numeric:
+        return None
+    categories = [r.get(category) for r in records]
+    return categories, [(f, [r.get(f) for r in records]) for f in numeric]
+
+def normalize_series(data: Any) -> Optional[Tuple[List[Any], List[Tuple[str, List[Any]]]]]:
+    """把常见的数据结构统一为 (类别列表, [(系列名, 数值列表)])，无法识别时返回None"""
+    if isinstance(data, list):
+        return _series_from_records(data)
+    if not isinstance(data, dict) or not data:
+        return None
+
+    categories = _first(data, _CATEGORY_KEYS)
+    series = data.get("series")
+    if isinstance(categories, list) and categories:
+        if isinstance(series, list) and series and all(isinstance(s, dict) for s in series):
+            # {"categories": [...], "series": [{"name": ..., "data": [...]}]}
+            pairs = [(str(s.get("name", f"系列{i + 1}")), s.get("data")) for i, s in enumerate(series)]
+        elif isinstance(series, dict):
+            # {"categories": [...], "series": {"2023": [...], "2024": [...]}}
+            pairs = [(str(name), values) for name, values in series.items()]
+        else:
+            values = _first(data, _VALUE_KEYS)
+            pairs = [(str(data.get("series_name", data.get("value_name", "数值"))), values)]
+        if all(_numeric_list(values) and len(values) == len(categories) for _, values in pairs):
+            return categories, pairs
+        return None
+
+    records = _first(data, ("records", "rows", "items", "data"))
+    if isinstance(records, list):
+        return _series_from_records(records)
+
+    # {"一季度": 120, "二季度": 200, ...}
+    plain = {k: v for k, v in data.items() if k not in _TITLE_KEYS}
+    if plain and all(_is_number(v) for v in plain.values()):
+        return list(plain), [(str(data.get("name", "数值")), list(plain.values()))]
+    return None
+
+def _base(title: str, trigger: str) -> Dict[str, Any]:
+    return {
+        "title": {"text": title, "left": "center"},
+        "tooltip": {"trigger": trigger},
+        "color": PALETTE
+    }
+
+def _grid() -> Dict[str, Any]:
+    return {"left": "3%", "right": "4%", "bottom": "3%", "top": "15%", "containLabel": True}
+
+def build_chart(data: Any, chart_type: str = "bar", title: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """将结构化数据直接编译为ECharts配置（不调用LLM）；不支持的图表类型或数据结构返回None"""
+    chart_type = chart_type.strip().lower()
+    if chart_type not in SUPPORTED_TYPES:
+        return None
+    if title is None and isinstance(data, dict) and isinstance(data.get("title"), str):
+        title = data["title"]
+    title = title or "数据分析图表"
+
+    if chart_type == "scatter":
+        return _build_scatter(data, title)
+
+    normalized = normalize_series(data)
+    if normalized is None:
+        return None
+    categories, series = normalized
+    categories = [str(c) for c in categories]
+
+    if chart_type == "pie":
+        name, values = series[0]
+        option = _base(title, "item")
+        option["tooltip"]["formatter"] = "{b}: {c} ({d}%)"
+        option["legend"] = {"orient": "vertical", "left": "left", "top": "middle"}
+        option["series"] = [{
+            "name": name,
+            "type": "pie",
+            "radius": ["35%", "65%"],
+            "center": ["55%", "55%"],
+            "data": [{"name": c, "value": v} for c, v in zip(categories, values)],
+            "label": {"formatter": "{b}\n{d}%"},
+            "emphasis": {"itemStyle": {"shadowBlur": 10, "shadowColor": "rgba(0, 0, 0, 0.3)"}}
+        }]
+        return option
+
+    option = _base(title, "axis")
+    if len(series) > 1:
+        option["legend"] = {"top": "8%", "data": [name for name, _ in series]}
+    option["grid"] = _grid()
+    option["xAxis"] = {"type": "category", "data": categories, "boundaryGap": chart_type == "bar"}
+    option["yAxis"] = {"type": "value"}
+    option["series"] = []
+    for index, (name, values) in enumerate(series):
+        item: Dict[str, Any] = {
+            "name": name,
+            "type": chart_type,
+            "data": values,
+            "itemStyle": {"color": PALETTE[index % len(PALETTE)]}
+        }
+        if chart_type == "line":
+            item["smooth"] = True
+            item["symbolSize"] = 6
+        else:
+            item["barMaxWidth"] = 48
+        option["series"].append(item)
+    if len(categories) > 12:
+        option["xAxis"]["axisLabel"] = {"rotate": 45}
+    return option
+
+def scatter_series(data: Any) -> Optional[List[Tuple[str, List[List[Any]]]]]:
+    """散点数据：[[x, y], ...]、{"x": [...], "y": [...]}、{"series": {名称: [[x, y], ...]}}
+    或 {"series": [{"name": 名称, "data": [[x, y], ...]}]}"""
+    def is_points(values: Any) -> bool:
+        return isinstance(values, list) and bool(values) and all(
+            isinstance(p, (list, tuple)) and len(p) >= 2 and _is_number(p[0]) and _is_number(p[1]) for p in values
+        )
+
+    if is_points(data):
+        return [("数据", [list(p[:2]) for p in data])]
+    if not isinstance(data, dict):
+        return None
+    if _numeric_list(data.get("x")) and _numeric_list(data.get("y")) and len(data["x"]) == len(data["y"]):
+        return [(str(data.get("name", "数据")), [[x, y] for x, y in zip(data["x"], data["y"])])]
+    series = data.get("series")
+    if isinstance(series, dict) and series and all(is_points(v) for v in series.values()):
+        return [(str(name), [list(p[:2]) for p in points]) for name, points in series.items()]
+    if isinstance(series, list) and series and all(isinstance(s, dict) and is_points(s.get("data")) for s in series):
+        return [(str(s.get("name", f"系列{i + 1}")), [list(p[:2]) for p in s["data"]]) for i, s in enumerate(series)]
+    if is_points(data.get("data")):
+        return [(str(data.get("name", "数据")), [list(p[:2]) for p in data["data"]])]
+    return None
+
+def _build_scatter(data: Any, title: str) -> Optional[Dict[str, Any]]:
+    series = scatter_series(data)
+    if series is None:
+        return None
+    option = _base(title, "item")
+    if len(series) > 1:
+        option["legend"] = {"top": "8%", "data": [name for name, _ in series]}
+    option["grid"] = _grid()
+    option["xAxis"] = {"type": "value", "scale": True, "name": data.get("x_name", "") if isinstance(data, dict) else ""}
+    option["yAxis"] = {"type": "value", "scale": True, "name": data.get("y_name", "") if isinstance(data, dict) else ""}
+    option["series"] = [
+        {
+            "name": name,
+            "type": "scatter",
+            "data": points,
+            "symbolSize": 10,
+            "itemStyle": {"color": PALETTE[index % len(PALETTE)], "opacity": 0.8}
+        }
+        for index, (name, points) in enumerate(series)
+    ]
+    return option
@@ -1,21 +1,16 @@
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
+import hashlib
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import asyncio
 
-class ChartGenerator:
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.3,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
+from services.chart_builder import build_chart
+from services.downsampling import downsample_chart_data
+from services.llm_cache import LLMResponseCache, canonical_json, normalize_prompt
 
-    async def generate(self, prompt: str) -> str:
-        """异步生成图表配置"""
-        system_message = SystemMessage(content="""
+CHART_SYSTEM_PROMPT = """
 你是专业的数据可视化专家。请根据用户描述生成符合ECharts规范的JSON配置。
 
 要求：
@@ -33,29 +28,60 @@ class ChartGenerator:
   "yAxis": {"type": "value"},
   "series": [{"name": "数据系列", "type": "bar", "data": [100, 200]}]
 }
-""")
+"""
 
+class ChartGenerator:
+    def __init__(self):
+        self.llm = ChatOpenAI(
+            model="gpt-4o",
+            temperature=0.3,
+            streaming=True,  # tokens only reach callbacks when a streaming handler is attached
+            openai_api_key=os.getenv("OPENAI_API_KEY")
+        )
+        # Dashboards request the same charts repeatedly, so answers are cached per prompt/data
+        self.cache = LLMResponseCache(
+            cache_dir=os.getenv("CHART_CACHE_DIR", "cache/charts"),
+            ttl=float(os.getenv("CHART_CACHE_TTL", "86400")),
+            memory_entries=int(os.getenv("CHART_CACHE_MEMORY_ENTRIES", "512")),
+            max_bytes=int(os.getenv("CHART_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+            enabled=os.getenv("CHART_CACHE_ENABLED", "true").lower() == "true"
+        )
+        # Structured data is compiled to ECharts locally; the LLM only handles free-text prompts
+        self.rule_builder = os.getenv("CHART_RULE_BUILDER", "true").lower() == "true"
+        # Larger series are downsampled so the payload stays small enough for the browser
+        self.point_budget = int(os.getenv("CHART_POINT_BUDGET", "2000"))
+        self.downsample_method = os.getenv("CHART_DOWNSAMPLE_METHOD", "lttb").lower()
+        # Any change to the model, its settings or the instructions invalidates cached charts
+        self._model_settings = (
+            self.llm.model_name,
+            self.llm.temperature,
+            hashlib.sha256(CHART_SYSTEM_PROMPT.encode("utf-8")).hexdigest()
+        )
+
+    async def generate(self, prompt: str, callbacks: Optional[List[Any]] = None) -> str:
+        """异步生成图表配置（按归一化提示词缓存）；callbacks接收模型令牌，命中缓存时不产生令牌"""
+        key = self.cache.make_key("prompt", normalize_prompt(prompt), self._model_settings)
+        return await self.cache.get_or_create(key, lambda: self._generate(prompt, callbacks))
+
+    async def _generate(self, prompt: str, callbacks: Optional[List[Any]] = None) -> Tuple[str, bool]:
+        """调用模型生成图表配置，返回 (配置, 是否可缓存)"""
+        system_message = SystemMessage(content=CHART_SYSTEM_PROMPT)
         human_message = HumanMessage(content=f"请为以下需求生成ECharts配置：{prompt}")
         
-        response = await self.llm.agenerate([[system_message, human_message]])
+        response = await self.llm.agenerate([[system_message, human_message]], callbacks=callbacks)
         chart_config = response.generations[0][0].text
 
         try:
             # Validate JSON
             json.loads(chart_config)
-            return chart_config
+            return chart_config, True
         except json.JSONDecodeError:
-            # If not valid JSON, return a fallback configuration
-            return self._get_fallback_chart()
+            # If not valid JSON, return a fallback configuration (not cached, so the next request retries)
+            return self._get_fallback_chart(), False
 
-    def generate_sync(self, prompt: str) -> str:
-        """同步版本的图表生成"""
-        try:
-            loop = asyncio.get_event_loop()
-            return loop.run_until_complete(self.generate(prompt))
-        except RuntimeError:
-            # If no event loop is running, create a new one
-            return asyncio.run(self.generate(prompt))
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取图表缓存统计"""
+        return self.cache.get_stats()
 
     def _get_fallback_chart(self) -> str:
         """备用图表配置"""
@@ -83,12 +109,40 @@ class ChartGenerator:
         }
         return json.dumps(fallback, ensure_ascii=False, indent=2)
 
-    async def generate_from_data(self, data: Dict[str, Any], chart_type: str = "bar") -> str:
-        """根据数据生成图表"""
+    async def generate_from_data(
+        self,
+        data: Dict[str, Any],
+        chart_type: str = "bar",
+        point_budget: Optional[int] = None
+    ) -> str:
+        """根据数据生成图表：超出点数预算先降采样，可识别的结构化数据直接编译，其余交给LLM（按图表类型和规范化数据缓存）"""
+        budget = point_budget or self.point_budget
+        sampling = None
+        if budget > 0:
+            data, sampling = await asyncio.to_thread(
+                downsample_chart_data, data, chart_type, budget, self.downsample_method
+            )
+
+        if self.rule_builder:
+            chart = build_chart(data, chart_type)
+            if chart is not None:
+                return self._with_sampling(chart, sampling)
+
         prompt = f"""
 基于以下数据生成{chart_type}图表：
 {json.dumps(data, ensure_ascii=False, indent=2)}
 
 请创建一个专业的数据可视化图表配置。
 """
-        return await self.generate(prompt)
\ No newline at end of file
+        key = self.cache.make_key("data", chart_type.strip().lower(), canonical_json(data), self._model_settings)
+        chart_config = await self.cache.get_or_create(key, lambda: self._generate(prompt))
+        if sampling is None:
+            return chart_config
+        return self._with_sampling(json.loads(chart_config), sampling)
+
+    @staticmethod
+    def _with_sampling(chart: Any, sampling: Optional[Dict[str, Any]]) -> str:
+        """在图表配置的metadata中记录降采样信息（ECharts会忽略未知字段）"""
+        if sampling is not None and isinstance(chart, dict):
+            chart.setdefault("metadata", {})["downsampling"] = sampling
+        return json.dumps(chart, ensure_ascii=False, indent=2)
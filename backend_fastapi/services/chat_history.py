@@ -0,0 +1,279 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Awaitable, Callable
+
+_CJK_CHAR = re.compile(r"[一-鿿㐀-䶿　-〿＀-￯]")
+
+class TokenCounter:
+    """令牌计数：CHAT_TOKEN_COUNTER=tiktoken时使用tiktoken，否则按中文单字、其余约4字符一个令牌估算"""
+
+    def __init__(self):
+        self._encoding = None
+        if os.getenv("CHAT_TOKEN_COUNTER", "estimate").lower() == "tiktoken":
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"Warning: tiktoken unavailable, estimating tokens instead: {e}")
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        cjk = len(_CJK_CHAR.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+class _Session:
+    __slots__ = ("messages", "summary", "summary_upto", "last_used")
+
+    def __init__(self, ring_size: int):
+        self.messages: deque = deque(maxlen=ring_size)
+        self.summary = ""
+        self.summary_upto = 0
+        self.last_used = time.monotonic()
+
+class ChatHistoryStore:
+    """会话历史：SQLite持久化全部消息，内存中每个会话只保留最近N条（环形缓冲），
+    空闲会话按LRU淘汰后可从磁盘重新加载；按令牌预算生成“滚动摘要 + 最近对话”上下文窗口"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv("CHAT_HISTORY_PATH", "cache/chat_history.db")
+        self.ring_size = int(os.getenv("CHAT_HISTORY_RING_SIZE", "50"))
+        self.max_sessions = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+        self.idle_ttl = float(os.getenv("CHAT_SESSION_IDLE_TTL", "1800"))
+        self.context_tokens = int(os.getenv("CHAT_CONTEXT_TOKENS", "2000"))
+        self.summary_min_messages = int(os.getenv("CHAT_SUMMARY_MIN_MESSAGES", "4"))
+        self.tokens = TokenCounter()
+
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._summarizing: Dict[str, asyncio.Task] = {}
+        self._stats = {"loaded": 0, "evicted": 0, "summaries": 0}
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_messages ("
+            " session_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " role TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (session_id, seq)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_summaries ("
+            " session_id TEXT PRIMARY KEY,"
+            " summary TEXT NOT NULL,"
+            " summary_upto INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL"
+            ")"
+        )
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _load_session(self, session_id: str) -> _Session:
+        """从磁盘加载最近N条消息和摘要"""
+        session = _Session(self.ring_size)
+        rows = self._query(
+            "SELECT seq, role, content, tokens, created_at FROM chat_messages "
+            "WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, self.ring_size)
+        )
+        for seq, role, content, tokens, created_at in reversed(rows):
+            session.messages.append({"seq": seq, "role": role, "content": content, "tokens": tokens, "created_at": created_at})
+        summary = self._query(
+            "SELECT summary, summary_upto FROM chat_summaries WHERE session_id = ?", (session_id,)
+        )
+        if summary:
+            session.summary, session.summary_upto = summary[0]
+        self._stats["loaded"] += 1
+        return session
+
+    async def _session(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = await asyncio.to_thread(self._load_session, session_id)
+            # Another coroutine may have loaded it while we were reading
+            session = self._sessions.setdefault(session_id, session)
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        self._evict()
+        return session
+
+    def _evict(self):
+        """淘汰空闲过期和超出容量的内存会话（磁盘数据保留）"""
+        now = time.monotonic()
+        for key in [k for k, s in self._sessions.items() if now - s.last_used > self.idle_ttl]:
+            del self._sessions[key]
+            self._stats["evicted"] += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._stats["evicted"] += 1
+
+    async def append(self, session_id: str, role: str, content: str) -> Dict[str, Any]:
+        """追加一条消息"""
+        session = await self._session(session_id)
+        last_seq = session.messages[-1]["seq"] if session.messages else session.summary_upto
+        message = {
+            "seq": last_seq + 1,
+            "role": role,
+            "content": content,
+            "tokens": self.tokens.count(content),
+            "created_at": time.time()
+        }
+        session.messages.append(message)
+
+        def insert():
+            with self._db_lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO chat_messages (session_id, seq, role, content, tokens, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, message["seq"], role, content, message["tokens"], message["created_at"])
+                )
+
+        await asyncio.to_thread(insert)
+        return message
+
+    async def get_window(self, session_id: str, budget: Optional[int] = None) -> Dict[str, Any]:
+        """按令牌预算选取上下文：滚动摘要加上能放下的最近消息"""
+        budget = budget or self.context_tokens
+        session = await self._session(session_id)
+        remaining = budget - (self.tokens.count(session.summary) if session.summary else 0)
+
+        recent: List[Dict[str, Any]] = []
+        for message in reversed(session.messages):
+            if message["seq"] <= session.summary_upto or message["tokens"] > remaining:
+                break
+            recent.append(message)
+            remaining -= message["tokens"]
+        recent.reverse()
+
+        return {
+            "summary": session.summary,
+            "messages": [{"role": m["role"], "content": m["content"]} for m in recent],
+            "tokens": budget - remaining,
+            "first_seq": recent[0]["seq"] if recent else None
+        }
+
+    def schedule_summary(self, session_id: str, summarize: Callable[[str, List[Dict[str, Any]]], Awaitable[str]]):
+        """后台滚动摘要：把已滑出上下文窗口的消息合并进摘要（不阻塞当前回复）"""
+        task = self._summarizing.get(session_id)
+        if task is not None and not task.done():
+            return
+        task = asyncio.create_task(self._summarize(session_id, summarize))
+        self._summarizing[session_id] = task
+        task.add_done_callback(lambda _: self._summarizing.pop(session_id, None))
+
+    async def _summarize(self, session_id: str, summarize: Callable[[str, List[Dict[str, Any]]], Awaitable[str]]):
+        """把摘要未覆盖、且已不在上下文窗口内的消息并入摘要。消息从磁盘按批读取，
+        因此已滑出内存环形缓冲的消息同样会被摘要，不会丢失"""
+        window = await self.get_window(session_id)
+        session = await self._session(session_id)
+        if window["first_seq"] is not None:
+            cutoff = window["first_seq"]
+        else:
+            # Not even the latest message fits the budget: everything before it is overflow
+            cutoff = session.messages[-1]["seq"] if session.messages else session.summary_upto + 1
+
+        while True:
+            rows = await asyncio.to_thread(
+                self._query,
+                "SELECT seq, role, content, tokens, created_at FROM chat_messages "
+                "WHERE session_id = ? AND seq > ? AND seq < ? ORDER BY seq LIMIT ?",
+                (session_id, session.summary_upto, cutoff, self.ring_size)
+            )
+            overflow = [
+                {"seq": seq, "role": role, "content": content, "tokens": tokens, "created_at": created_at}
+                for seq, role, content, tokens, created_at in rows
+            ]
+            if len(overflow) < self.summary_min_messages:
+                return
+
+            try:
+                summary = await summarize(session.summary, overflow)
+            except Exception as e:
+                print(f"Chat summary failed for {session_id}: {e}")
+                return
+            if self._sessions.get(session_id) is not session:
+                # Session was cleared or evicted while we were summarizing
+                return
+
+            session.summary = summary
+            session.summary_upto = overflow[-1]["seq"]
+            self._stats["summaries"] += 1
+
+            def save():
+                with self._db_lock:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO chat_summaries (session_id, summary, summary_upto, updated_at) VALUES (?, ?, ?, ?)",
+                        (session_id, summary, session.summary_upto, time.time())
+                    )
+
+            await asyncio.to_thread(save)
+
+    async def get_history(self, session_id: str, limit: int = 100, before_seq: Optional[int] = None) -> Dict[str, Any]:
+        """分页读取完整历史（按时间正序）"""
+        before_seq = before_seq if before_seq is not None else 2 ** 62
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT seq, role, content, created_at FROM chat_messages "
+            "WHERE session_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (session_id, before_seq, limit)
+        )
+        summary = await asyncio.to_thread(
+            self._query, "SELECT summary FROM chat_summaries WHERE session_id = ?", (session_id,)
+        )
+        return {
+            "session_id": session_id,
+            "history": [
+                {"seq": seq, "role": role, "content": content, "created_at": created_at}
+                for seq, role, content, created_at in reversed(rows)
+            ],
+            "summary": summary[0][0] if summary else ""
+        }
+
+    async def clear(self, session_id: str) -> int:
+        """删除会话的内存状态和持久化数据，返回删除的消息数"""
+        self._sessions.pop(session_id, None)
+        task = self._summarizing.pop(session_id, None)
+        if task is not None:
+            task.cancel()
+
+        def delete() -> int:
+            with self._db_lock:
+                self._conn.execute("BEGIN")
+                deleted = self._conn.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,)).rowcount
+                self._conn.execute("DELETE FROM chat_summaries WHERE session_id = ?", (session_id,))
+                self._conn.execute("COMMIT")
+            return deleted
+
+        return await asyncio.to_thread(delete)
+
+    async def aclose(self):
+        """等待进行中的摘要任务"""
+        if self._summarizing:
+            await asyncio.gather(*self._summarizing.values(), return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取内存会话统计"""
+        return {
+            **self._stats,
+            "active_sessions": len(self._sessions),
+            "buffered_messages": sum(len(s.messages) for s in self._sessions.values()),
+            "ring_size": self.ring_size,
+            "max_sessions": self.max_sessions,
+            "context_tokens": self.context_tokens
+        }
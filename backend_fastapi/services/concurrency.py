@@ -0,0 +1,74 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Awaitable, Iterable, Tuple
+from urllib.parse import urlparse
+
+class HostLimiter:
+    """全局并发上限加按主机并发上限"""
+
+    def __init__(self, max_concurrency: int, per_host_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._active = 0
+
+    @staticmethod
+    def host_of(source: str) -> str:
+        """URL取主机名，本地路径和server:path统一按来源前缀分组"""
+        netloc = urlparse(source).netloc
+        if netloc:
+            return netloc
+        if ":" in source and not os.path.isabs(source):
+            return source.split(":", 1)[0]
+        return "local"
+
+    @asynccontextmanager
+    async def limit(self, source: str):
+        """获取全局和主机并发名额"""
+        host = self.host_of(source)
+        host_semaphore = self._hosts.setdefault(host, asyncio.Semaphore(self.per_host_concurrency))
+        async with host_semaphore:
+            async with self._global:
+                self._active += 1
+                try:
+                    yield
+                finally:
+                    self._active -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取并发使用情况"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "per_host_concurrency": self.per_host_concurrency,
+            "active": self._active,
+            "hosts": len(self._hosts)
+        }
+
+async def iterate_completed(
+    jobs: Iterable[Awaitable[Any]]
+) -> AsyncIterator[Tuple[int, Any]]:
+    """并发运行任务，按完成顺序产出 (序号, 结果)；中途退出时取消剩余任务"""
+    indexes = {asyncio.ensure_future(job): index for index, job in enumerate(jobs)}
+
+    pending = set(indexes)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=indexes.get):
+                yield indexes[task], task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+_limiters: Dict[str, HostLimiter] = {}
+
+def get_host_limiter(name: str, max_env: str, per_host_env: str, max_default: int = 8, per_host_default: int = 4) -> HostLimiter:
+    """按名称获取进程内共享的并发限制器"""
+    if name not in _limiters:
+        _limiters[name] = HostLimiter(
+            int(os.getenv(max_env, str(max_default))),
+            int(os.getenv(per_host_env, str(per_host_default)))
+        )
+    return _limiters[name]
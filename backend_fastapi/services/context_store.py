@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+# Marks a pending delete in the write buffer
+_DELETED = object()
+
+class ContextStore:
+    """本地上下文键值存储：SQLite WAL持久化，按会话命名空间隔离，支持TTL；
+    写入先进入缓冲区批量提交，读取经过内存LRU缓存"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv("CONTEXT_STORE_PATH", "cache/context.db")
+        self.default_ttl = float(os.getenv("CONTEXT_DEFAULT_TTL", "86400"))
+        self.cache_size = int(os.getenv("CONTEXT_CACHE_SIZE", "1024"))
+        self.flush_interval = float(os.getenv("CONTEXT_FLUSH_INTERVAL", "0.05"))
+        self.flush_batch = int(os.getenv("CONTEXT_FLUSH_BATCH", "100"))
+        self.flush_retry_delay = float(os.getenv("CONTEXT_FLUSH_RETRY_DELAY", "1"))
+        self.purge_interval = float(os.getenv("CONTEXT_PURGE_INTERVAL", "300"))
+
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._pending: Dict[Tuple[str, str], Tuple[Any, Optional[float]]] = {}
+        self._inflight: Dict[Tuple[str, str], Tuple[Any, Optional[float]]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_wakeup: Optional[asyncio.Event] = None
+        self._last_purge = time.time()
+        self._stats = {
+            "reads": 0, "cache_hits": 0, "writes": 0, "flushes": 0, "rows_flushed": 0, "expired": 0, "flush_errors": 0
+        }
+        self._last_flush_error: Optional[str] = None
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS context ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_context_expires ON context (expires_at)")
+
+    def _expiry(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl and ttl > 0 else None
+
+    @staticmethod
+    def _expired(expires_at: Optional[float]) -> bool:
+        return expires_at is not None and expires_at <= time.time()
+
+    def _remember(self, item: Tuple[str, str], value: Any, expires_at: Optional[float]):
+        self._cache[item] = (value, expires_at)
+        self._cache.move_to_end(item)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _ensure_flusher(self):
+        """首次写入时在当前事件循环中启动批量提交任务"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_wakeup = asyncio.Event()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """后台批量提交；提交失败时记录错误并稍后重试，任务本身不退出"""
+        while True:
+            await self._flush_wakeup.wait()
+            # Let concurrent writers pile into the same transaction
+            await asyncio.sleep(self.flush_interval)
+            self._flush_wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # flush() has put the batch back into the buffer; retry it later
+                self._stats["flush_errors"] += 1
+                self._last_flush_error = str(e)
+                print(f"Warning: context store flush failed, retrying in {self.flush_retry_delay}s: {e}")
+                await asyncio.sleep(self.flush_retry_delay)
+                self._flush_wakeup.set()
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        """读取值：待提交写入 -> 内存缓存 -> SQLite"""
+        self._stats["reads"] += 1
+        item = (namespace, key)
+        entry = self._pending.get(item) or self._inflight.get(item) or self._cache.get(item)
+        if entry is not None:
+            value, expires_at = entry
+            if value is _DELETED:
+                return None
+            if not self._expired(expires_at):
+                self._stats["cache_hits"] += 1
+                if item in self._cache:
+                    self._cache.move_to_end(item)
+                return value
+            self._cache.pop(item, None)
+            self._stats["expired"] += 1
+            return None
+
+        row = await asyncio.to_thread(self._select, namespace, key)
+        if row is None:
+            return None
+        value, expires_at = json.loads(row[0]), row[1]
+        if self._expired(expires_at):
+            self._stats["expired"] += 1
+            return None
+        self._remember(item, value, expires_at)
+        return value
+
+    def _select(self, namespace: str, key: str) -> Optional[tuple]:
+        with self._db_lock:
+            return self._conn.execute(
+                "SELECT value, expires_at FROM context WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        """写入值（进入缓冲区，由后台任务批量提交）；ttl为0表示永不过期"""
+        item = (namespace, key)
+        expires_at = self._expiry(ttl)
+        self._pending[item] = (value, expires_at)
+        self._remember(item, value, expires_at)
+        self._stats["writes"] += 1
+        await self._schedule_flush()
+
+    async def delete(self, namespace: str, key: str):
+        """删除值"""
+        item = (namespace, key)
+        self._pending[item] = (_DELETED, None)
+        self._cache.pop(item, None)
+        await self._schedule_flush()
+
+    async def _schedule_flush(self):
+        if len(self._pending) >= self.flush_batch:
+            await self.flush()
+        else:
+            self._ensure_flusher()
+            self._flush_wakeup.set()
+
+    async def flush(self):
+        """在一个事务中提交所有缓冲的写入（串行执行，保证写入顺序）"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._inflight, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write_batch, self._inflight)
+            except BaseException:
+                # Put the batch back unless newer writes superseded it
+                self._pending = {**self._inflight, **self._pending}
+                raise
+            finally:
+                rows = len(self._inflight)
+                self._inflight = {}
+            self._stats["flushes"] += 1
+            self._stats["rows_flushed"] += rows
+
+        if time.time() - self._last_purge >= self.purge_interval:
+            self._last_purge = time.time()
+            await asyncio.to_thread(self.purge_expired)
+
+    def _write_batch(self, pending: Dict[Tuple[str, str], Tuple[Any, Optional[float]]]):
+        now = time.time()
+        upserts = [
+            (namespace, key, json.dumps(value, ensure_ascii=False, default=str), expires_at, now)
+            for (namespace, key), (value, expires_at) in pending.items()
+            if value is not _DELETED
+        ]
+        deletes = [item for item, (value, _) in pending.items() if value is _DELETED]
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO context (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (namespace, key) DO UPDATE SET "
+                    "value = excluded.value, expires_at = excluded.expires_at, updated_at = excluded.updated_at",
+                    upserts
+                )
+                self._conn.executemany("DELETE FROM context WHERE namespace = ? AND key = ?", deletes)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def purge_expired(self) -> int:
+        """删除已过期的记录"""
+        with self._db_lock:
+            cursor = self._conn.execute(
+                "DELETE FROM context WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )
+        self._stats["expired"] += cursor.rowcount
+        return cursor.rowcount
+
+    async def keys(self, namespace: str) -> List[str]:
+        """列出命名空间中未过期的键"""
+        await self.flush()
+
+        def select() -> List[str]:
+            with self._db_lock:
+                rows = self._conn.execute(
+                    "SELECT key FROM context WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?) ORDER BY key",
+                    (namespace, time.time())
+                ).fetchall()
+            return [row[0] for row in rows]
+
+        return await asyncio.to_thread(select)
+
+    async def clear_namespace(self, namespace: str) -> int:
+        """删除命名空间（会话）下的所有键"""
+        await self.flush()
+        for item in [item for item in self._cache if item[0] == namespace]:
+            del self._cache[item]
+
+        def delete() -> int:
+            with self._db_lock:
+                return self._conn.execute("DELETE FROM context WHERE namespace = ?", (namespace,)).rowcount
+
+        return await asyncio.to_thread(delete)
+
+    async def close(self):
+        """停止后台提交任务并提交剩余写入（之后的写入会重新启动提交任务）"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取读写和缓存命中统计"""
+        return {
+            **self._stats,
+            "cache_hit_rate": round(self._stats["cache_hits"] / self._stats["reads"], 4) if self._stats["reads"] else 0.0,
+            "cached_entries": len(self._cache),
+            "pending_writes": len(self._pending),
+            "last_flush_error": self._last_flush_error,
+            "db_path": self.db_path
+        }
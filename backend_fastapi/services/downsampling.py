@@ -0,0 +1,185 @@
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from services.chart_builder import normalize_series, scatter_series
+
+METHODS = ("lttb", "minmax")
+
+def _as_float(values: Any) -> np.ndarray:
+    """None等缺失值转为NaN"""
+    return np.asarray(values, dtype=np.float64)
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets：保留视觉形状的降采样，返回选中点的下标（x需递增）。
+    桶间依赖上一个选中点，因此按桶循环，桶内三角形面积用NumPy一次算完"""
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:max(threshold, 1)])
+
+    y = np.where(np.isnan(y), np.nanmean(y) if np.any(~np.isnan(y)) else 0.0, y)
+    # First and last points are always kept; the rest is split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Average point of each bucket, used as the third triangle vertex for the bucket before it
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    avg_x = np.append(sums_x / sizes, x[n - 1])
+    avg_y = np.append(sums_y / sizes, y[n - 1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        bx, by = x[start:end], y[start:end]
+        cx, cy = avg_x[bucket + 1], avg_y[bucket + 1]
+        areas = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[bucket + 1] = a
+    return selected
+
+def minmax_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """最小/最大值分桶：每个桶保留最小和最大值点（完全向量化，保留峰谷），返回点数不超过threshold"""
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 4:
+        # Too small for a min/max pair besides the endpoints
+        return lttb_indices(np.arange(n, dtype=np.float64), y, threshold)
+
+    # First and last points are always kept, so two slots go to them
+    interior = y[1:n - 1]
+    buckets = (threshold - 2) // 2
+    size = -(-len(interior) // buckets)
+    rows = -(-len(interior) // size)
+    padded = np.full(rows * size, np.nan)
+    padded[:len(interior)] = interior
+    grid = padded.reshape(rows, size)
+    # Missing values never win either comparison
+    low = np.argmin(np.where(np.isnan(grid), np.inf, grid), axis=1)
+    high = np.argmax(np.where(np.isnan(grid), -np.inf, grid), axis=1)
+    offsets = np.arange(rows) * size + 1
+    indices = np.concatenate([offsets + low, offsets + high, [0, n - 1]])
+    return np.unique(indices)
+
+def _select(x: np.ndarray, y: np.ndarray, budget: int, method: str) -> np.ndarray:
+    if method == "minmax":
+        return minmax_indices(y, budget)
+    return lttb_indices(x, y, budget)
+
+def _allocate(sizes: List[int], budget: int) -> List[int]:
+    """把点数预算分给各系列（合计不超过预算）：点少的系列保留全部，余量均分给其余系列"""
+    allocation = [0] * len(sizes)
+    remaining = budget
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    for position, index in enumerate(order):
+        allocation[index] = min(sizes[index], remaining // (len(order) - position))
+        remaining -= allocation[index]
+    return allocation
+
+def _shared_indices(x: np.ndarray, columns: List[np.ndarray], budget: int, method: str) -> np.ndarray:
+    """共享类别轴的多系列降采样：取各系列选点的并集，使并集不超过预算且尽量用满。
+    先二分出并集仍在预算内的最大单系列点数，再逐个系列加点填充剩余预算"""
+    selections: Dict[Tuple[int, int], np.ndarray] = {}
+
+    def select(column: int, threshold: int) -> np.ndarray:
+        if (column, threshold) not in selections:
+            selections[column, threshold] = _select(x, columns[column], threshold, method)
+        return selections[column, threshold]
+
+    def union(threshold: int) -> np.ndarray:
+        return np.unique(np.concatenate([select(i, threshold) for i in range(len(columns))]))
+
+    # Per-series thresholds summing to the budget always fit; search upwards from there
+    low, high = max(1, budget // len(columns)), budget
+    while low < high:
+        middle = (low + high + 1) // 2
+        if len(union(middle)) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+
+    keep = union(low)
+    threshold = low
+    added = True
+    while added and len(keep) < budget:
+        threshold += 1
+        added = False
+        for column in range(len(columns)):
+            candidate = np.union1d(keep, select(column, threshold))
+            if len(candidate) <= budget:
+                keep, added = candidate, added or len(candidate) > len(keep)
+    return keep
+
+def downsample_chart_data(
+    data: Any,
+    chart_type: str,
+    budget: int,
+    method: str = "lttb"
+) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """点数超过预算时对图表数据降采样，返回 (新数据, 降采样说明)；无需降采样时原样返回"""
+    if method not in METHODS:
+        raise ValueError(f"不支持的降采样方法: {method}")
+    chart_type = chart_type.strip().lower()
+    started = time.perf_counter()
+
+    if chart_type == "scatter":
+        series = scatter_series(data)
+        if series is None:
+            return data, None
+        original = sum(len(points) for _, points in series)
+        if original <= budget:
+            return data, None
+        # With fewer than three points a series loses its shape, so the smallest series are dropped instead
+        kept = sorted(range(len(series)), key=lambda i: len(series[i][1]), reverse=True)[:max(1, budget // 3)]
+        kept.sort()
+        dropped = len(series) - len(kept)
+        allocation = _allocate([len(series[i][1]) for i in kept], budget)
+        # A list keeps series that share a name apart
+        reduced: List[Dict[str, Any]] = []
+        for index, threshold in zip(kept, allocation):
+            name, points = series[index]
+            array = np.asarray(points, dtype=np.float64)
+            array = array[np.argsort(array[:, 0], kind="stable")]
+            keep = _select(array[:, 0], array[:, 1], threshold, method)
+            reduced.append({"name": name, "data": array[keep].tolist()})
+        result: Dict[str, Any] = {"series": reduced}
+        points = sum(len(s["data"]) for s in reduced)
+    elif chart_type in ("line", "bar"):
+        normalized = normalize_series(data)
+        if normalized is None:
+            return data, None
+        categories, series = normalized
+        original = len(categories)
+        if original <= budget:
+            return data, None
+        # Categories are shared, so keep the union of what each series needs
+        x = np.arange(original, dtype=np.float64)
+        keep = _shared_indices(x, [_as_float(values) for _, values in series], budget, method)
+        dropped = 0
+        result = {
+            "categories": [categories[i] for i in keep],
+            "series": [{"name": name, "data": [values[i] for i in keep]} for name, values in series]
+        }
+        points = len(keep)
+    else:
+        return data, None
+
+    if isinstance(data, dict):
+        for key in ("title", "x_name", "y_name"):
+            if key in data:
+                result[key] = data[key]
+    sampling = {
+        "method": method,
+        "budget": budget,
+        "original_points": original,
+        "points": points,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+    if dropped:
+        sampling["dropped_series"] = dropped
+    return result, sampling
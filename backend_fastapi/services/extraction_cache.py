@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import aiofiles
+import httpx
+
+from services.upload_storage import resolve_server_file
+
+class ExtractionCache:
+    """基于内容哈希的磁盘提取结果缓存（按字节预算LRU淘汰）"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or os.getenv("EXTRACTION_CACHE_DIR", "cache/extractions")
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+        self.enabled = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bypassed": 0}
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """启动时从磁盘重建LRU索引（按修改时间排序）"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name[:-5], stat.st_size))
+
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    @staticmethod
+    def make_key(fingerprint: str, extraction_type: str) -> str:
+        """由内容指纹和提取类型生成缓存键"""
+        return hashlib.sha256(f"{fingerprint}:{extraction_type}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+        """分块计算文件的SHA-256"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    async def fingerprint(self, source: str, content_hash: Optional[str] = None) -> Optional[str]:
+        """计算来源指纹：上传/下载到本机的文件用内容哈希，URL用URL+ETag/Last-Modified"""
+        if content_hash:
+            return f"sha256:{content_hash}"
+
+        # Client-supplied paths are never read; only files the server itself wrote are hashed
+        if resolve_server_file(source):
+            content_hash = await asyncio.to_thread(self.hash_file, source)
+            return f"sha256:{content_hash}"
+
+        if source.startswith(("http://", "https://")):
+            try:
+                async with httpx.AsyncClient(timeout=10.0, follow_redirects=True) as client:
+                    response = await client.head(source)
+                validator = response.headers.get("etag") or response.headers.get("last-modified")
+                if response.status_code == 200 and validator:
+                    return f"url:{source}#{validator}"
+            except httpx.HTTPError:
+                pass
+
+        # Without a content hash or validator we cannot tell if the source changed
+        return None
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存结果"""
+        if key not in self._entries:
+            self._stats["misses"] += 1
+            return None
+
+        path = self._path(key)
+        try:
+            async with aiofiles.open(path, "r", encoding="utf-8") as f:
+                result = json.loads(await f.read())
+        except (OSError, ValueError):
+            self._drop(key)
+            self._stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        os.utime(path, None)
+        self._stats["hits"] += 1
+        return result
+
+    async def put(self, key: str, result: Dict[str, Any]):
+        """写入缓存结果（原子替换）"""
+        data = json.dumps(result, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+        async with aiofiles.open(temp_path, "w", encoding="utf-8") as f:
+            await f.write(data)
+        os.replace(temp_path, path)
+
+        self._total_bytes -= self._entries.pop(key, 0)
+        self._entries[key] = size
+        self._total_bytes += size
+        self._stats["stores"] += 1
+        self._evict()
+
+    def _drop(self, key: str):
+        self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """超出字节预算时淘汰最久未使用的条目"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._stats["evictions"] += 1
+
+    def record_bypass(self):
+        """记录无法缓存的请求"""
+        self._stats["bypassed"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "enabled": self.enabled
+        }
+
+_extraction_cache: Optional[ExtractionCache] = None
+
+def get_extraction_cache() -> ExtractionCache:
+    """获取进程内共享的提取缓存"""
+    global _extraction_cache
+    if _extraction_cache is None:
+        _extraction_cache = ExtractionCache()
+    return _extraction_cache
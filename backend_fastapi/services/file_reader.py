@@ -2,10 +2,24 @@ import httpx
 import aiofiles
 import os
 import asyncio
-from typing import Dict, Any, Optional
+import hashlib
+import io
+import re
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, AsyncIterator
 from urllib.parse import urlparse
 import mimetypes
 import json
+from services.resilience import get_breaker, call_with_resilience
+from services.remote_file_cache import RemoteFileCache
+
+class RemoteFileTooLargeError(Exception):
+    """远程文件超过下载大小限制"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"远程文件大小超过限制（最大 {max_bytes} 字节）")
 
 class FileReader:
     def __init__(self):
@@ -24,6 +38,116 @@ class FileReader:
             }
         }
 
+        # Per-operation timeouts (seconds), overridable via REMOTE_TIMEOUT_<NAME>
+        self.timeouts = {
+            name: float(os.getenv(f"REMOTE_TIMEOUT_{name.upper()}", default))
+            for name, default in {
+                "read": "30",
+                "list": "30",
+                "search": "30",
+                "upload": "60",
+                "status": "10"
+            }.items()
+        }
+        self.max_retries = int(os.getenv("REMOTE_MAX_RETRIES", "2"))
+        self.cache = RemoteFileCache()
+
+        # Streaming limits: downloads go to disk up to max_download_bytes; text returned as a string is capped separately
+        self.max_download_bytes = int(os.getenv("REMOTE_MAX_DOWNLOAD_BYTES", str(256 * 1024 * 1024)))
+        self.max_text_bytes = int(os.getenv("REMOTE_MAX_TEXT_BYTES", str(16 * 1024 * 1024)))
+        self.chunk_size = int(os.getenv("REMOTE_STREAM_CHUNK_SIZE", str(64 * 1024)))
+        self.preview_bytes = int(os.getenv("REMOTE_PREVIEW_BYTES", "4096"))
+        self.download_dir = os.getenv("REMOTE_DOWNLOAD_DIR", "temp_downloads")
+
+    def _breaker_for(self, url: str):
+        """按主机获取熔断器"""
+        return get_breaker(f"remote:{urlparse(url).netloc}")
+
+    async def _fetch(self, method: str, url: str, timeout: float, idempotent: bool = True, **kwargs) -> httpx.Response:
+        """带熔断保护的远程请求，幂等请求自动抖动重试"""
+        async def send() -> httpx.Response:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                return await client.request(method, url, **kwargs)
+
+        return await call_with_resilience(
+            send,
+            breaker=self._breaker_for(url),
+            retries=self.max_retries if idempotent else 0
+        )
+
+    @asynccontextmanager
+    async def _open_stream(
+        self,
+        url: str,
+        timeout: float,
+        headers: Optional[Dict[str, str]] = None,
+        auth: Optional[tuple] = None
+    ) -> AsyncIterator[httpx.Response]:
+        """以流式模式发送GET请求（熔断保护、幂等重试），退出时关闭响应"""
+        client = httpx.AsyncClient(timeout=timeout)
+        opened = []
+
+        async def send() -> httpx.Response:
+            request = client.build_request("GET", url, headers=headers)
+            response = await client.send(request, auth=auth, stream=True)
+            opened.append(response)
+            return response
+
+        try:
+            response = await call_with_resilience(
+                send,
+                breaker=self._breaker_for(url),
+                retries=self.max_retries
+            )
+            yield response
+        finally:
+            # Retried attempts leave their streams open as well
+            for response in opened:
+                await response.aclose()
+            await client.aclose()
+
+    async def _spool(self, response: httpx.Response, sink=None, digest=None, limit: Optional[int] = None) -> int:
+        """将响应体分块写入sink（为None时只计数），超过上限（默认下载上限）时中止"""
+        limit = limit if limit is not None else self.max_download_bytes
+        declared = response.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > limit:
+            raise RemoteFileTooLargeError(limit)
+
+        size = 0
+        async for chunk in response.aiter_bytes(self.chunk_size):
+            size += len(chunk)
+            if size > limit:
+                raise RemoteFileTooLargeError(limit)
+            if digest is not None:
+                digest.update(chunk)
+            if sink is not None:
+                result = sink.write(chunk)
+                if asyncio.iscoroutine(result):
+                    await result
+        return size
+
+    @staticmethod
+    def _is_textual(content_type: str) -> bool:
+        return "application/json" in content_type or "text/" in content_type or "application/xml" in content_type
+
+    @classmethod
+    def _format_text(cls, body: bytes, content_type: str) -> str:
+        """文本响应转为字符串，JSON重新格式化"""
+        text = cls._decode(body, content_type)
+        if "application/json" in content_type:
+            return json.dumps(json.loads(text), ensure_ascii=False, indent=2)
+        return text
+
+    @staticmethod
+    def _decode(body: bytes, content_type: str) -> str:
+        """按Content-Type声明的字符集解码，默认UTF-8"""
+        match = re.search(r"charset=([\w.-]+)", content_type, re.IGNORECASE)
+        encoding = match.group(1) if match else "utf-8"
+        try:
+            return body.decode(encoding, errors="replace")
+        except LookupError:
+            return body.decode("utf-8", errors="replace")
+
     async def read_remote_file(self, file_reference: str) -> str:
         """异步读取远程文件"""
         try:
@@ -39,13 +163,199 @@ class FileReader:
         except Exception as e:
             raise Exception(f"读取远程文件失败: {str(e)}")
 
-    def read_remote_file_sync(self, file_reference: str) -> str:
-        """同步版本的远程文件读取"""
+    async def _read_resource(self, url: str, headers: Optional[Dict[str, str]] = None, auth: Optional[tuple] = None) -> Dict[str, Any]:
+        """读取远程资源：新鲜缓存直接返回，否则发送条件请求（304时复用缓存）；
+        文本内容不超过max_text_bytes时读入内存，二进制内容只统计大小不保留内容"""
+        headers = dict(headers or {})
+        identity = headers.get("Authorization") or (auth[0] if auth else "")
+        key = f"{url}|{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:16]}"
+
+        entry = self.cache.lookup(key)
+        if entry is not None and self.cache.is_fresh(entry):
+            self.cache.record_hit()
+            return {"content_type": entry["content_type"], "size": len(entry["body"]), "body": entry["body"]}
+
+        headers.update(self.cache.conditional_headers(entry))
+        async with self._open_stream(url, self.timeouts["read"], headers=headers, auth=auth) as response:
+            if response.status_code == 304 and entry is not None:
+                self.cache.record_revalidated(entry)
+                return {"content_type": entry["content_type"], "size": len(entry["body"]), "body": entry["body"]}
+
+            self.cache.record_miss()
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+
+            if not self._is_textual(content_type):
+                declared = response.headers.get("content-length")
+                if declared and declared.isdigit():
+                    return {"content_type": content_type, "size": int(declared), "body": None}
+                size = await self._spool(response)
+                return {"content_type": content_type, "size": size, "body": None}
+
+            # The body is returned as one string, so it is bounded by the text cap rather than the download cap
+            buffer = io.BytesIO()
+            size = await self._spool(response, buffer, limit=self.max_text_bytes)
+            body = buffer.getvalue()
+            self.cache.store(key, body, response.headers)
+            return {"content_type": content_type, "size": size, "body": body}
+
+    async def _read_range(
+        self,
+        url: str,
+        range_header: str,
+        limit: int,
+        tail: bool = False,
+        headers: Optional[Dict[str, str]] = None,
+        auth: Optional[tuple] = None
+    ) -> Dict[str, Any]:
+        """按Range请求读取部分内容；服务器不支持Range时流式读取并只保留所需部分"""
+        async with self._open_stream(
+            url, self.timeouts["read"], headers={**(headers or {}), "Range": range_header}, auth=auth
+        ) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("content-type", "")
+            total = None
+            content_range = response.headers.get("content-range", "")
+            if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+                total = int(content_range.rsplit("/", 1)[1])
+
+            buffer = bytearray()
+            if response.status_code == 206:
+                async for chunk in response.aiter_bytes(self.chunk_size):
+                    buffer.extend(chunk)
+                    if len(buffer) >= limit:
+                        break
+                return {"data": bytes(buffer[:limit]), "content_type": content_type, "total_size": total, "range_supported": True}
+
+            # Full body returned: keep only the leading (or trailing) bytes while streaming
+            size = 0
+            async for chunk in response.aiter_bytes(self.chunk_size):
+                size += len(chunk)
+                buffer.extend(chunk)
+                if tail:
+                    del buffer[:-limit]
+                elif len(buffer) >= limit:
+                    break
+                if size > self.max_download_bytes:
+                    raise RemoteFileTooLargeError(self.max_download_bytes)
+            data = bytes(buffer[-limit:] if tail else buffer[:limit])
+            return {"data": data, "content_type": content_type, "total_size": size if tail else total, "range_supported": False}
+
+    def _resolve(self, file_reference: str) -> tuple:
+        """将文件引用解析为 (URL, 请求头, 认证)"""
+        server_config, file_path = self._parse_file_reference(file_reference)
+        if not server_config:
+            return file_reference, {}, None
+        return self._server_request(server_config, file_path)
+
+    def _server_request(self, server_config: Dict[str, str], file_path: str) -> tuple:
+        """构造远程服务器文件URL和认证信息"""
+        auth_token = server_config.get("auth_token")
+        username = server_config.get("username")
+        password = server_config.get("password")
+
+        headers = {}
+        auth = None
+
+        # Set up authentication
+        if auth_token:
+            headers["Authorization"] = f"Bearer {auth_token}"
+        elif username and password:
+            auth = (username, password)
+
+        # Construct full URL
+        if not file_path.startswith("/"):
+            file_path = "/" + file_path
+        return f"{server_config['base_url']}/api/files{file_path}", headers, auth
+
+    async def read_range(self, file_reference: str, start: int, length: int) -> Dict[str, Any]:
+        """读取远程文件从start开始的length字节"""
+        if start < 0 or length <= 0:
+            raise ValueError("start必须非负且length必须为正数")
+        url, headers, auth = self._resolve(file_reference)
+
+        if start == 0:
+            return await self._read_range(url, f"bytes=0-{length - 1}", length, headers=headers, auth=auth)
+
+        result = await self._read_range(
+            url, f"bytes={start}-{start + length - 1}", start + length, headers=headers, auth=auth
+        )
+        # The server ignored the Range header and sent the file from byte 0
+        if not result["range_supported"]:
+            result["data"] = result["data"][start:]
+        return result
+
+    async def preview_remote_file(
+        self,
+        file_reference: str,
+        head_bytes: Optional[int] = None,
+        tail_bytes: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """通过Range请求获取远程文件的开头和结尾预览，无需下载整个文件"""
+        head_bytes = head_bytes if head_bytes is not None else self.preview_bytes
+        tail_bytes = tail_bytes if tail_bytes is not None else self.preview_bytes
+        url, headers, auth = self._resolve(file_reference)
+
+        preview: Dict[str, Any] = {"file_reference": file_reference, "head": "", "tail": ""}
+        if head_bytes > 0:
+            head = await self._read_range(url, f"bytes=0-{head_bytes - 1}", head_bytes, headers=headers, auth=auth)
+            preview.update({
+                "head": self._decode(head["data"], head["content_type"]),
+                "content_type": head["content_type"],
+                "total_size": head["total_size"],
+                "range_supported": head["range_supported"]
+            })
+        if tail_bytes > 0:
+            tail = await self._read_range(url, f"bytes=-{tail_bytes}", tail_bytes, tail=True, headers=headers, auth=auth)
+            preview["tail"] = self._decode(tail["data"], tail["content_type"])
+            preview.setdefault("content_type", tail["content_type"])
+            if preview.get("total_size") is None:
+                preview["total_size"] = tail["total_size"]
+            preview.setdefault("range_supported", tail["range_supported"])
+        return preview
+
+    async def download_remote_file(self, file_reference: str, download_dir: Optional[str] = None) -> Dict[str, Any]:
+        """将远程文件流式下载到本地临时文件（同时计算SHA-256），供提取服务直接读取；调用方负责删除"""
+        url, headers, auth = self._resolve(file_reference)
+        download_dir = download_dir or self.download_dir
+        os.makedirs(download_dir, exist_ok=True)
+
+        name = re.sub(r"[^\w.-]", "_", os.path.basename(urlparse(url).path) or "download")[-100:]
+        file_path = os.path.join(download_dir, f"{uuid.uuid4().hex}_{name}")
+
+        digest = hashlib.sha256()
         try:
-            loop = asyncio.get_event_loop()
-            return loop.run_until_complete(self.read_remote_file(file_reference))
-        except RuntimeError:
-            return asyncio.run(self.read_remote_file(file_reference))
+            async with self._open_stream(url, self.timeouts["read"], headers=headers, auth=auth) as response:
+                response.raise_for_status()
+                content_type = response.headers.get("content-type", "")
+                async with aiofiles.open(file_path, "wb") as out:
+                    size = await self._spool(response, out, digest)
+        except BaseException:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+
+        return {
+            "path": file_path,
+            "size": size,
+            "sha256": digest.hexdigest(),
+            "content_type": content_type
+        }
+
+    async def read_downloaded_file(self, download: Dict[str, Any], label: str) -> str:
+        """把download_remote_file下载的文件转为文本（格式与read_remote_file一致），避免再次请求远程服务器"""
+        content_type = download["content_type"]
+        if not self._is_textual(content_type):
+            return f"[Binary file: {label}, Size: {download['size']} bytes, Type: {content_type}]"
+        if download["size"] > self.max_text_bytes:
+            raise RemoteFileTooLargeError(self.max_text_bytes)
+        async with aiofiles.open(download["path"], "rb") as f:
+            body = await f.read()
+        return self._format_text(body, content_type)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取远程文件缓存统计"""
+        return self.cache.get_stats()
 
     def _parse_file_reference(self, file_reference: str) -> tuple:
         """解析文件引用"""
@@ -67,55 +377,25 @@ class FileReader:
 
     async def _read_from_remote_server(self, server_config: Dict[str, str], file_path: str) -> str:
         """从配置的远程服务器读取文件"""
-        base_url = server_config["base_url"]
-        auth_token = server_config.get("auth_token")
-        username = server_config.get("username")
-        password = server_config.get("password")
-
-        headers = {}
-        auth = None
-
-        # Set up authentication
-        if auth_token:
-            headers["Authorization"] = f"Bearer {auth_token}"
-        elif username and password:
-            auth = (username, password)
-
-        # Construct full URL
-        if not file_path.startswith("/"):
-            file_path = "/" + file_path
-        url = f"{base_url}/api/files{file_path}"
-
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, headers=headers, auth=auth)
-            response.raise_for_status()
-            
-            content_type = response.headers.get("content-type", "")
-            
-            if "application/json" in content_type:
-                data = response.json()
-                return json.dumps(data, ensure_ascii=False, indent=2)
-            elif "text/" in content_type or "application/xml" in content_type:
-                return response.text
-            else:
-                # For binary files, return base64 or description
-                return f"[Binary file: {file_path}, Size: {len(response.content)} bytes, Type: {content_type}]"
+        url, headers, auth = self._server_request(server_config, file_path)
+        resource = await self._read_resource(url, headers=headers, auth=auth)
+        content_type = resource["content_type"]
+        
+        if self._is_textual(content_type):
+            return self._format_text(resource["body"], content_type)
+        else:
+            # Binary bodies are never buffered; report their size only
+            return f"[Binary file: {file_path}, Size: {resource['size']} bytes, Type: {content_type}]"
 
     async def _read_from_url(self, url: str) -> str:
         """从URL直接读取文件"""
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            
-            content_type = response.headers.get("content-type", "")
-            
-            if "application/json" in content_type:
-                data = response.json()
-                return json.dumps(data, ensure_ascii=False, indent=2)
-            elif "text/" in content_type:
-                return response.text
-            else:
-                return f"[Binary content from {url}, Size: {len(response.content)} bytes]"
+        resource = await self._read_resource(url)
+        content_type = resource["content_type"]
+        
+        if resource["body"] is not None:
+            return self._format_text(resource["body"], content_type)
+        else:
+            return f"[Binary content from {url}, Size: {resource['size']} bytes]"
 
     async def list_remote_files(self, server_name: str = "server1", directory: str = "/") -> Dict[str, Any]:
         """列出远程服务器的文件"""
@@ -133,10 +413,9 @@ class FileReader:
         url = f"{base_url}/api/files/list"
         params = {"path": directory}
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            return response.json()
+        response = await self._fetch("GET", url, self.timeouts["list"], headers=headers, params=params)
+        response.raise_for_status()
+        return response.json()
 
     async def upload_to_remote(self, server_name: str, local_file_path: str, remote_path: str) -> Dict[str, Any]:
         """上传文件到远程服务器"""
@@ -162,30 +441,29 @@ class FileReader:
         
         data = {"path": remote_path}
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(url, headers=headers, files=files, data=data)
-            response.raise_for_status()
-            return response.json()
+        response = await self._fetch(
+            "POST", url, self.timeouts["upload"], idempotent=False, headers=headers, files=files, data=data
+        )
+        response.raise_for_status()
+        return response.json()
 
-    def get_server_status(self, server_name: str = "server1") -> Dict[str, Any]:
-        """获取远程服务器状态"""
+    async def check_server_status(self, server_name: str = "server1") -> Dict[str, Any]:
+        """异步获取远程服务器状态（不阻塞事件循环）"""
         if server_name not in self.remote_servers:
             return {"status": "error", "message": f"未知的服务器: {server_name}"}
             
+        base_url = self.remote_servers[server_name]["base_url"]
+        breaker_state = self._breaker_for(base_url).get_state()
         try:
-            server_config = self.remote_servers[server_name]
-            base_url = server_config["base_url"]
-            
-            # Try to ping the server
-            with httpx.Client(timeout=10.0) as client:
-                response = client.get(f"{base_url}/health")
-                if response.status_code == 200:
-                    return {"status": "online", "server": server_name, "url": base_url}
-                else:
-                    return {"status": "error", "server": server_name, "message": f"Server returned {response.status_code}"}
-                    
+            async with httpx.AsyncClient(timeout=self.timeouts["status"]) as client:
+                response = await client.get(f"{base_url}/health")
+            if response.status_code == 200:
+                return {"status": "online", "server": server_name, "url": base_url, "circuit_breaker": breaker_state}
+            else:
+                return {"status": "error", "server": server_name, "message": f"Server returned {response.status_code}", "circuit_breaker": breaker_state}
+                
         except Exception as e:
-            return {"status": "offline", "server": server_name, "error": str(e)}
+            return {"status": "offline", "server": server_name, "error": str(e), "circuit_breaker": breaker_state}
 
     async def search_files(self, server_name: str, query: str, file_types: list = None) -> Dict[str, Any]:
         """在远程服务器搜索文件"""
@@ -206,7 +484,6 @@ class FileReader:
         if file_types:
             params["types"] = ",".join(file_types)
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            return response.json()
\ No newline at end of file
+        response = await self._fetch("GET", url, self.timeouts["search"], headers=headers, params=params)
+        response.raise_for_status()
+        return response.json()
\ No newline at end of file
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Awaitable, Callable, Optional, Tuple
+
+from services.extraction_cache import ExtractionCache
+
+_WHITESPACE = re.compile(r"\s+")
+# Trailing punctuation rarely changes what is being asked for
+_TRAILING_PUNCTUATION = re.compile(r"[\s。．.!！?？,，;；:：]+$")
+
+def normalize_prompt(prompt: str) -> str:
+    """归一化提示词：全半角统一、折叠空白、英文小写、去掉结尾标点"""
+    text = unicodedata.normalize("NFKC", prompt).strip().lower()
+    text = _WHITESPACE.sub(" ", text)
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+def canonical_json(data: Any) -> str:
+    """规范化JSON：键排序、紧凑分隔符，使等价数据得到相同的键"""
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+
+class LLMResponseCache:
+    """LLM响应缓存：内存LRU层加磁盘层，按TTL过期；相同请求并发时只调用一次模型"""
+
+    def __init__(self, cache_dir: str, ttl: float, memory_entries: int, max_bytes: int, enabled: bool = True):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.enabled = enabled
+        self.disk = ExtractionCache(cache_dir=cache_dir, max_bytes=max_bytes)
+        self._memory: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "expired": 0}
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """由提示词、数据和模型设置生成缓存键"""
+        return hashlib.sha256(canonical_json(parts).encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, value: Any, expires_at: float):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Any]:
+        """按内存 -> 磁盘顺序读取未过期的值"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.time():
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return value
+            del self._memory[key]
+            self._stats["expired"] += 1
+
+        stored = await self.disk.get(key)
+        if stored is not None:
+            if stored["expires_at"] > time.time():
+                self._remember(key, stored["value"], stored["expires_at"])
+                self._stats["disk_hits"] += 1
+                return stored["value"]
+            self._stats["expired"] += 1
+        return None
+
+    async def put(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        await self.disk.put(key, {"value": value, "expires_at": expires_at})
+
+    async def get_or_create(
+        self,
+        key: str,
+        create: Callable[[], Awaitable[Tuple[Any, bool]]]
+    ) -> Any:
+        """命中则返回缓存值，否则调用create生成；create返回 (值, 是否可缓存)"""
+        if not self.enabled:
+            value, _ = await create()
+            return value
+
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The request that was generating it went away; generate it ourselves
+                return await self.get_or_create(key, create)
+
+        self._stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value, cacheable = await create()
+            if cacheable:
+                await self.put(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; don't warn about an unretrieved exception otherwise
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各层命中统计"""
+        # Coalesced requests were served without their own model call
+        hits = self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["coalesced"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "max_memory_entries": self.memory_entries,
+            "disk_entries": self.disk.get_stats()["entries"],
+            "disk_bytes": self.disk.get_stats()["total_bytes"],
+            "ttl": self.ttl,
+            "enabled": self.enabled
+        }
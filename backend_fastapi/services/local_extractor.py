@@ -0,0 +1,242 @@
+import asyncio
+import csv
+import io
+import json
+import mimetypes
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from services.upload_storage import resolve_server_file
+
+try:
+    from pypdf import PdfReader  # PDF text extraction is optional
+    PDF_AVAILABLE = True
+except ImportError:
+    PDF_AVAILABLE = False
+
+TEXT_EXTENSIONS = {
+    "txt", "md", "markdown", "log", "xml", "html", "htm",
+    "py", "js", "ts", "java", "cpp", "c", "h", "go", "rs", "yaml", "yml", "ini", "sql"
+}
+TABLE_EXTENSIONS = {"csv", "tsv"}
+DOCUMENT_EXTENSIONS = {"json", "xlsx", "docx", "pdf"}
+
+# Extraction types the local engine can answer; "images" always goes to MCP
+LOCAL_EXTRACTION_TYPES = {"text", "metadata", "full", "structured", "auto"}
+
+def _extension(path: str) -> str:
+    return os.path.splitext(path)[1].lower().lstrip(".")
+
+def _decode(data: bytes) -> str:
+    """优先UTF-8，失败时按GB18030解码（兼容中文Windows导出的文件）"""
+    for encoding in ("utf-8-sig", "gb18030"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace")
+
+def _read_text(path: str) -> str:
+    with open(path, "rb") as f:
+        return _decode(f.read())
+
+def _extract_text(path: str) -> Dict[str, Any]:
+    text = _read_text(path)
+    if _extension(path) in ("html", "htm"):
+        try:
+            from bs4 import BeautifulSoup
+            text = BeautifulSoup(text, "html.parser").get_text("\n", strip=True)
+        except ImportError:
+            pass
+    return {"content": text, "structured": None, "metadata": {}}
+
+def _extract_table(path: str) -> Dict[str, Any]:
+    text = _read_text(path)
+    delimiter = "\t" if _extension(path) == "tsv" else ","
+    if delimiter == ",":
+        try:
+            delimiter = csv.Sniffer().sniff(text[:4096], delimiters=",;\t|").delimiter
+        except csv.Error:
+            pass
+
+    rows = list(csv.reader(io.StringIO(text), delimiter=delimiter))
+    columns = rows[0] if rows else []
+    records = [dict(zip(columns, row)) for row in rows[1:]]
+    return {
+        "content": text,
+        "structured": {"columns": columns, "rows": records},
+        "metadata": {"row_count": len(records), "column_count": len(columns)}
+    }
+
+def _extract_json(path: str) -> Dict[str, Any]:
+    data = json.loads(_read_text(path))
+    return {
+        "content": json.dumps(data, ensure_ascii=False, indent=2),
+        "structured": data,
+        "metadata": {"json_type": type(data).__name__}
+    }
+
+def _extract_xlsx(path: str) -> Dict[str, Any]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets: Dict[str, List[List[Any]]] = {}
+        parts = []
+        for sheet in workbook.worksheets:
+            rows = [
+                ["" if value is None else value for value in row]
+                for row in sheet.iter_rows(values_only=True)
+            ]
+            sheets[sheet.title] = rows
+            lines = ["\t".join(str(value) for value in row) for row in rows]
+            parts.append(f"## {sheet.title}\n" + "\n".join(lines))
+    finally:
+        workbook.close()
+
+    return {
+        "content": "\n\n".join(parts),
+        "structured": {
+            name: {"columns": rows[0] if rows else [], "rows": rows[1:]}
+            for name, rows in sheets.items()
+        },
+        "metadata": {"sheet_names": list(sheets), "sheet_count": len(sheets)}
+    }
+
+def _extract_docx(path: str) -> Dict[str, Any]:
+    from docx import Document
+
+    document = Document(path)
+    paragraphs = [p.text for p in document.paragraphs if p.text.strip()]
+    tables = [
+        [[cell.text for cell in row.cells] for row in table.rows]
+        for table in document.tables
+    ]
+    parts = list(paragraphs)
+    for table in tables:
+        parts.append("\n".join("\t".join(row) for row in table))
+    return {
+        "content": "\n".join(parts),
+        "structured": {"paragraphs": paragraphs, "tables": tables},
+        "metadata": {"paragraph_count": len(paragraphs), "table_count": len(tables)}
+    }
+
+def _extract_pdf(path: str) -> Dict[str, Any]:
+    reader = PdfReader(path)
+    pages = [page.extract_text() or "" for page in reader.pages]
+    return {
+        "content": "\n\n".join(pages),
+        "structured": {"pages": pages},
+        "metadata": {"page_count": len(pages)}
+    }
+
+def extract_local(path: str, extraction_type: str = "text") -> Dict[str, Any]:
+    """在当前进程中提取本地文件（进程池工作函数，必须可序列化）"""
+    extension = _extension(path)
+    if extension in TABLE_EXTENSIONS:
+        extracted = _extract_table(path)
+    elif extension == "json":
+        extracted = _extract_json(path)
+    elif extension == "xlsx":
+        extracted = _extract_xlsx(path)
+    elif extension == "docx":
+        extracted = _extract_docx(path)
+    elif extension == "pdf":
+        extracted = _extract_pdf(path)
+    else:
+        extracted = _extract_text(path)
+
+    content = extracted["content"]
+    metadata = {
+        "file_name": os.path.basename(path),
+        "file_type": extension,
+        "mime_type": mimetypes.guess_type(path)[0],
+        "file_size": os.path.getsize(path),
+        "char_count": len(content),
+        "line_count": content.count("\n") + 1 if content else 0,
+        **extracted["metadata"]
+    }
+
+    result: Dict[str, Any] = {
+        "success": True,
+        "extraction_type": extraction_type,
+        "file_type": extension,
+        "metadata": metadata
+    }
+    if extraction_type != "metadata":
+        result["content"] = content
+    if extraction_type in ("structured", "full") and extracted["structured"] is not None:
+        result["structured"] = extracted["structured"]
+    return result
+
+class LocalExtractor:
+    """本地快速提取引擎：常见格式在进程池中解析，其余格式交给MCP服务"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.enabled = os.getenv("LOCAL_EXTRACTION_ENABLED", "true").lower() == "true"
+        self.max_workers = max_workers or int(os.getenv("LOCAL_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.max_bytes = int(os.getenv("LOCAL_EXTRACTION_MAX_BYTES", str(100 * 1024 * 1024)))
+        # Small plain-text files parse faster in a thread than the process round-trip costs
+        self.inline_bytes = int(os.getenv("LOCAL_EXTRACTION_INLINE_BYTES", str(256 * 1024)))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._stats = {"local": 0, "inline": 0, "failed": 0, "unsupported": 0}
+
+    @staticmethod
+    def supported_extensions() -> List[str]:
+        extensions = TEXT_EXTENSIONS | TABLE_EXTENSIONS | DOCUMENT_EXTENSIONS
+        if not PDF_AVAILABLE:
+            extensions = extensions - {"pdf"}
+        return sorted(extensions)
+
+    def supports(self, path: str, extraction_type: str = "text") -> bool:
+        """判断文件能否在本地提取（只处理上传或下载到本机的文件，其他路径一律交给MCP）"""
+        if not self.enabled or extraction_type not in LOCAL_EXTRACTION_TYPES:
+            return False
+        if resolve_server_file(path) is None or os.path.getsize(path) > self.max_bytes:
+            return False
+        return _extension(path) in self.supported_extensions()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    async def extract(self, path: str, extraction_type: str = "text") -> Optional[Dict[str, Any]]:
+        """本地提取；不支持或解析失败时返回None，由调用方回退到MCP"""
+        if not self.supports(path, extraction_type):
+            self._stats["unsupported"] += 1
+            return None
+
+        extension = _extension(path)
+        inline = extension in TEXT_EXTENSIONS | TABLE_EXTENSIONS | {"json"} and os.path.getsize(path) <= self.inline_bytes
+        try:
+            if inline:
+                result = await asyncio.to_thread(extract_local, path, extraction_type)
+                self._stats["inline"] += 1
+            else:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._get_pool(), extract_local, path, extraction_type)
+                self._stats["local"] += 1
+        except Exception as e:
+            print(f"Local extraction failed for {path}, falling back to MCP: {e}")
+            self._stats["failed"] += 1
+            return None
+        return result
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取本地提取统计"""
+        return {
+            **self._stats,
+            "enabled": self.enabled,
+            "max_workers": self.max_workers,
+            "pool_started": self._pool is not None,
+            "pdf_available": PDF_AVAILABLE,
+            "supported_extensions": self.supported_extensions()
+        }
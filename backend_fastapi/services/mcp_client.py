@@ -1,9 +1,25 @@
 import asyncio
-import json
 import os
 from typing import Dict, Any, List, Optional
 import httpx
+import time
+from collections import OrderedDict
 from datetime import datetime
+from services.extraction_cache import get_extraction_cache
+from services.local_extractor import LocalExtractor
+from services.search_index import get_search_index, reciprocal_rank_fusion
+from services.vector_index import get_vector_index
+from services.context_store import ContextStore
+from services.resilience import CircuitOpenError, get_breaker, get_breaker_states, call_with_resilience
+
+try:
+    import h2  # noqa: F401  (HTTP/2 support is optional)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Status codes the MCP server uses for unknown or expired sessions
+SESSION_EXPIRED_STATUS = (401, 410)
 
 class MCPClient:
     """Model Context Protocol Client for document processing and knowledge management"""
@@ -14,9 +30,144 @@ class MCPClient:
         self.api_key = os.getenv("MCP_API_KEY", "6a270c05-42b5-4572-9116-05b7f75a42f6")
         self.profile = os.getenv("MCP_PROFILE", "itchy-silverfish-GpwjDM")
         self.session_id = None
-        self.context_store = {}
+        # Context lives in a local store; the remote context API is an optional replica
+        self.context_store = ContextStore()
+        self.context_replication = os.getenv("CONTEXT_REMOTE_REPLICATION", "false").lower() == "true"
+        self._replication_tasks: set = set()
+        self._replication_stats = {"replicated": 0, "failed": 0, "remote_reads": 0}
+
+        # Connection pool settings (shared by all requests of this client)
+        self.max_connections = int(os.getenv("MCP_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(os.getenv("MCP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        self.keepalive_expiry = float(os.getenv("MCP_KEEPALIVE_EXPIRY", "30"))
+        self.http2 = os.getenv("MCP_HTTP2", "false").lower() == "true"
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # Per-endpoint timeouts (seconds), overridable via MCP_TIMEOUT_<NAME>
+        self.timeouts = {
+            name: float(os.getenv(f"MCP_TIMEOUT_{name.upper()}", default))
+            for name, default in {
+                "session": "30",
+                "query": "60",
+                "extract": "120",
+                "search": "30",
+                "insights": "30",
+                "knowledge_graph": "180",
+                "analyze": "120",
+                "context": "30",
+                "health": "10"
+            }.items()
+        }
+        self.max_retries = int(os.getenv("MCP_MAX_RETRIES", "2"))
+        self.breaker = get_breaker("mcp_server")
+
+        # Request session_id -> MCP session mapping (LRU, idle entries expire)
+        self.max_sessions = int(os.getenv("MCP_MAX_SESSIONS", "256"))
+        self.session_idle_ttl = float(os.getenv("MCP_SESSION_IDLE_TTL", "1800"))
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending_sessions: Dict[str, asyncio.Future] = {}
+        self._session_stats = {"hits": 0, "initialized": 0, "deduplicated": 0, "evicted": 0, "expired": 0}
+        # Common formats are parsed locally; MCP handles everything else
+        self.local_extractor = LocalExtractor()
+        self._extraction_stats = {"cache": 0, "local": 0, "mcp": 0}
+
+        # Extracted documents feed local full-text and vector indexes; the remote service optionally reranks
+        self.search_index = get_search_index()
+        self.vector_index = get_vector_index()
+        self.search_backend = os.getenv("SEARCH_BACKEND", "hybrid").lower()  # bm25, vector or hybrid
+        self.search_rerank = os.getenv("SEARCH_REMOTE_RERANK", "false").lower() == "true"
+        self._pool_stats = {
+            "requests": 0,
+            "errors": 0,
+            "in_flight": 0,
+            "clients_created": 0,
+            "total_latency_ms": 0.0
+        }
 
-    async def initialize_session(self) -> str:
+    async def start(self) -> httpx.AsyncClient:
+        """创建长连接HTTP连接池"""
+        if self._client is None or self._client.is_closed:
+            http2 = self.http2 and HTTP2_AVAILABLE
+            if self.http2 and not HTTP2_AVAILABLE:
+                print("Warning: MCP_HTTP2 is enabled but the 'h2' package is not installed, using HTTP/1.1")
+
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                timeout=30.0,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                )
+            )
+            self._pool_stats["clients_created"] += 1
+        return self._client
+
+    async def aclose(self):
+        """关闭HTTP连接池和本地提取进程池，持久化本地索引和上下文"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.local_extractor.shutdown()
+        await asyncio.to_thread(self.search_index.persist)
+        await asyncio.to_thread(self.vector_index.persist)
+        if self._replication_tasks:
+            await asyncio.gather(*self._replication_tasks, return_exceptions=True)
+        await self.context_store.close()
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        timeout: float = 30.0,
+        idempotent: bool = False,
+        guarded: bool = True,
+        **kwargs
+    ) -> httpx.Response:
+        """通过共享连接池发送请求（熔断保护，幂等请求自动重试）"""
+        client = await self.start()
+
+        async def send() -> httpx.Response:
+            self._pool_stats["requests"] += 1
+            self._pool_stats["in_flight"] += 1
+            started = time.perf_counter()
+            try:
+                return await client.request(method, url, timeout=timeout, **kwargs)
+            except Exception:
+                self._pool_stats["errors"] += 1
+                raise
+            finally:
+                self._pool_stats["in_flight"] -= 1
+                self._pool_stats["total_latency_ms"] += (time.perf_counter() - started) * 1000
+
+        return await call_with_resilience(
+            send,
+            breaker=self.breaker if guarded else None,
+            retries=self.max_retries if idempotent else 0
+        )
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取连接池统计信息"""
+        stats = dict(self._pool_stats)
+        total_latency_ms = stats.pop("total_latency_ms")
+        stats["avg_latency_ms"] = round(total_latency_ms / stats["requests"], 2) if stats["requests"] else 0.0
+        stats.update({
+            "active": self._client is not None and not self._client.is_closed,
+            "http2": self.http2 and HTTP2_AVAILABLE,
+            "max_connections": self.max_connections,
+            "max_keepalive_connections": self.max_keepalive_connections,
+            "keepalive_expiry": self.keepalive_expiry
+        })
+
+        # httpcore does not expose pool state publicly; read it defensively
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is not None:
+            stats["open_connections"] = len(connections)
+            stats["idle_connections"] = sum(1 for conn in connections if conn.is_idle())
+        return stats
+
+    async def initialize_session(self, session_id: str = "default") -> str:
         """初始化MCP会话"""
         headers = self._get_headers()
         
@@ -26,26 +177,128 @@ class MCPClient:
             "profile": self.profile
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.mcp_server_url}/sessions",
-                headers=headers,
-                params=params,
-                json={"client_info": {"name": "产业集群智能体", "version": "1.0.0"}}
-            )
-            response.raise_for_status()
+        response = await self._request(
+            "POST",
+            f"{self.mcp_server_url}/sessions",
+            headers=headers,
+            params=params,
+            json={"client_info": {"name": "产业集群智能体", "version": "1.0.0"}},
+            timeout=self.timeouts["session"]
+        )
+        response.raise_for_status()
             
-            data = response.json()
-            self.session_id = data.get("session_id", "default_session")
-            return self.session_id
+        data = response.json()
+        mcp_session_id = data.get("session_id", "default_session")
+        self._remember_session(session_id, mcp_session_id)
+        self._session_stats["initialized"] += 1
+        return mcp_session_id
+
+    async def get_session(self, session_id: str = "default") -> str:
+        """获取请求会话对应的MCP会话，并发调用共享同一次初始化"""
+        entry = self._sessions.get(session_id)
+        if entry is not None:
+            if time.monotonic() - entry["last_used"] <= self.session_idle_ttl:
+                entry["last_used"] = time.monotonic()
+                self._sessions.move_to_end(session_id)
+                self._session_stats["hits"] += 1
+                return entry["mcp_session_id"]
+            self._forget_session(session_id)
+            self._session_stats["expired"] += 1
+
+        pending = self._pending_sessions.get(session_id)
+        if pending is not None:
+            self._session_stats["deduplicated"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.ensure_future(self.initialize_session(session_id))
+        self._pending_sessions[session_id] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._pending_sessions.get(session_id) is future:
+                del self._pending_sessions[session_id]
+
+    def _remember_session(self, session_id: str, mcp_session_id: str):
+        """记录会话映射并按LRU淘汰"""
+        self._sessions[session_id] = {
+            "mcp_session_id": mcp_session_id,
+            "created_at": time.monotonic(),
+            "last_used": time.monotonic()
+        }
+        self._sessions.move_to_end(session_id)
+        if session_id == "default":
+            self.session_id = mcp_session_id
+        self._evict_sessions()
+
+    def _forget_session(self, session_id: str):
+        """移除会话映射"""
+        self._sessions.pop(session_id, None)
+        if session_id == "default":
+            self.session_id = None
+
+    def _evict_sessions(self):
+        """淘汰空闲过期和超出容量的会话"""
+        now = time.monotonic()
+        for key in [k for k, v in self._sessions.items() if now - v["last_used"] > self.session_idle_ttl]:
+            self._forget_session(key)
+            self._session_stats["expired"] += 1
+        while len(self._sessions) > self.max_sessions:
+            oldest = next(iter(self._sessions))
+            self._forget_session(oldest)
+            self._session_stats["evicted"] += 1
+
+    def get_session_stats(self) -> Dict[str, Any]:
+        """获取会话映射统计信息"""
+        return {
+            **self._session_stats,
+            "active_sessions": len(self._sessions),
+            "pending_initializations": len(self._pending_sessions),
+            "max_sessions": self.max_sessions,
+            "idle_ttl": self.session_idle_ttl
+        }
 
-    async def query(self, query: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """使用MCP协议进行查询"""
-        if not self.session_id:
-            await self.initialize_session()
+    async def _session_request(
+        self,
+        method: str,
+        url: str,
+        session_id: str,
+        timeout: float = 30.0,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        idempotent: bool = False
+    ) -> httpx.Response:
+        """携带MCP会话发送请求，会话失效时重新初始化并重试一次"""
+        for attempt in range(2):
+            mcp_session_id = await self.get_session(session_id)
+
+            # The session travels in the JSON body for POSTs and in the query string otherwise
+            request_params = dict(params or {})
+            request_json = None
+            if json is not None:
+                request_json = {**json, "session_id": mcp_session_id}
+            else:
+                request_params["session_id"] = mcp_session_id
+
+            response = await self._request(
+                method,
+                url,
+                headers=self._get_headers(),
+                params=request_params,
+                json=request_json,
+                timeout=timeout,
+                idempotent=idempotent
+            )
+            if response.status_code not in SESSION_EXPIRED_STATUS or attempt:
+                return response
 
-        headers = self._get_headers()
-        
+            # Drop the stale mapping so the retry initializes a fresh session
+            if self._sessions.get(session_id, {}).get("mcp_session_id") == mcp_session_id:
+                self._forget_session(session_id)
+                self._session_stats["expired"] += 1
+        return response
+
+    async def query(self, query: str, context: Optional[Dict[str, Any]] = None, session_id: str = "default") -> Dict[str, Any]:
+        """使用MCP协议进行查询"""
         # Add required parameters for this specific MCP server
         params = {
             "api_key": self.api_key,
@@ -54,7 +307,6 @@ class MCPClient:
         
         payload = {
             "query": query,
-            "session_id": self.session_id,
             "context": context or {},
             "options": {
                 "include_sources": True,
@@ -63,33 +315,91 @@ class MCPClient:
             }
         }
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{self.mcp_server_url}/query",
-                headers=headers,
-                params=params,
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self._session_request(
+            "POST",
+            f"{self.mcp_server_url}/query",
+            session_id,
+            params=params,
+            json=payload,
+            timeout=self.timeouts["query"]
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def extract_file(
+        self,
+        file_url_or_path: str,
+        extraction_type: str = "text",
+        session_id: str = "default",
+        content_hash: Optional[str] = None,
+        local_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """提取文件内容：先查内容指纹缓存，常见格式的本地文件本地解析，其余交给file-extractor MCP服务；
+        local_path为来源已下载到本机的副本（本地解析用它，MCP仍收到原始引用）；
+        结果中的served_by标明由cache/local/mcp哪条路径返回"""
+        cache = get_extraction_cache()
+        cache_key = None
+        if cache.enabled:
+            fingerprint = await cache.fingerprint(file_url_or_path, content_hash)
+            if fingerprint:
+                cache_key = cache.make_key(fingerprint, extraction_type)
+                cached = await cache.get(cache_key)
+                if cached is not None:
+                    self._extraction_stats["cache"] += 1
+                    return {**cached, "served_by": "cache", "cached_from": cached.get("served_by")}
+            else:
+                cache.record_bypass()
+
+        result = await self.local_extractor.extract(local_path or file_url_or_path, extraction_type)
+        if result is not None:
+            self._extraction_stats["local"] += 1
+            result["served_by"] = "local"
+        else:
+            result = await self._extract_via_mcp(file_url_or_path, extraction_type, session_id)
+            self._extraction_stats["mcp"] += 1
+            if isinstance(result, dict):
+                result["served_by"] = "mcp"
+
+        if cache_key and isinstance(result, dict) and result.get("success", True):
+            await cache.put(cache_key, result)
+        if isinstance(result, dict) and result.get("served_by") != "cache":
+            await self._index_extraction(file_url_or_path, extraction_type, result, session_id)
+        return result
+
+    async def _index_extraction(self, source: str, extraction_type: str, result: Dict[str, Any], session_id: str):
+        """将提取出的文本加入本地全文索引和向量索引"""
+        content = result.get("content")
+        if not isinstance(content, str) or not content.strip() or not result.get("success", True):
+            return
+        metadata = result.get("metadata") if isinstance(result.get("metadata"), dict) else {}
+        document_metadata = {
+            "source": source,
+            "file_name": metadata.get("file_name") or os.path.basename(source),
+            "file_type": metadata.get("file_type") or os.path.splitext(source)[1].lower().lstrip("."),
+            "extraction_type": extraction_type,
+            "session_id": session_id
+        }
 
-    def query_sync(self, query: str) -> str:
-        """同步版本的MCP查询"""
-        try:
-            loop = asyncio.get_event_loop()
-            result = loop.run_until_complete(self.query(query))
-            return json.dumps(result, ensure_ascii=False, indent=2)
-        except RuntimeError:
-            result = asyncio.run(self.query(query))
-            return json.dumps(result, ensure_ascii=False, indent=2)
-
-    async def extract_file(self, file_url_or_path: str, extraction_type: str = "text") -> Dict[str, Any]:
-        """使用file-extractor MCP服务提取文件内容"""
-        if not self.session_id:
-            await self.initialize_session()
+        indexes = []
+        if self.search_backend != "vector":
+            indexes.append(self.search_index)
+        if self.search_backend != "bm25":
+            indexes.append(self.vector_index)
+        for index in indexes:
+            try:
+                await asyncio.to_thread(index.add_document, source, content, document_metadata)
+            except Exception as e:
+                print(f"Failed to index {source} in {type(index).__name__}: {e}")
 
-        headers = self._get_headers()
-        
+    def get_extraction_stats(self) -> Dict[str, Any]:
+        """获取各提取路径的请求数和本地引擎统计"""
+        return {
+            "served_by": dict(self._extraction_stats),
+            "local_engine": self.local_extractor.get_stats()
+        }
+
+    async def _extract_via_mcp(self, file_url_or_path: str, extraction_type: str, session_id: str) -> Dict[str, Any]:
+        """调用远程MCP提取接口"""
         params = {
             "api_key": self.api_key,
             "profile": self.profile
@@ -98,7 +408,6 @@ class MCPClient:
         payload = {
             "file_source": file_url_or_path,
             "extraction_type": extraction_type,
-            "session_id": self.session_id,
             "options": {
                 "preserve_formatting": True,
                 "extract_metadata": True,
@@ -107,85 +416,151 @@ class MCPClient:
             }
         }
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                f"{self.mcp_server_url}/extract",
-                headers=headers,
-                params=params,
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
-
-    async def process_document(self, document_path: str, document_type: str = "auto") -> Dict[str, Any]:
+        response = await self._session_request(
+            "POST",
+            f"{self.mcp_server_url}/extract",
+            session_id,
+            params=params,
+            json=payload,
+            timeout=self.timeouts["extract"],
+            idempotent=True
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def process_document(
+        self,
+        document_path: str,
+        document_type: str = "auto",
+        session_id: str = "default",
+        content_hash: Optional[str] = None,
+        local_path: Optional[str] = None
+    ) -> Dict[str, Any]:
         """处理文档并添加到知识库（使用file-extractor服务）"""
         try:
             # Use the file-extractor MCP service
-            return await self.extract_file(document_path, document_type)
+            return await self.extract_file(document_path, document_type, session_id, content_hash, local_path)
         except Exception as e:
             # Fallback to basic processing
             return {
                 "success": False,
                 "error": f"文档处理失败: {str(e)}",
                 "document_path": document_path,
-                "fallback_used": True
+                "fallback_used": True,
+                "circuit_open": isinstance(e, CircuitOpenError)
             }
 
-    async def semantic_search(self, query: str, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """语义搜索"""
-        if not self.session_id:
-            await self.initialize_session()
-
-        headers = self._get_headers()
-        
+    async def semantic_search(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        session_id: str = "default",
+        rerank: Optional[bool] = None,
+        similarity_threshold: Optional[float] = None,
+        max_results: int = 20
+    ) -> Dict[str, Any]:
+        """语义搜索：本地索引召回（BM25、向量或两者融合），可选由远程服务重排；本地索引为空时使用远程搜索。
+        相似度阈值缺省时本地按嵌入模型的默认值，远程为0.7"""
+        if not self.search_index.documents and not self.vector_index.documents:
+            result = await self._remote_semantic_search(query, filters, session_id, similarity_threshold, max_results)
+            if isinstance(result, dict):
+                result.setdefault("backend", "mcp")
+            return result
+
+        hits = await asyncio.to_thread(self._local_search, query, filters, similarity_threshold, max_results)
+        result = {"query": query, "results": hits, "total": len(hits), "backend": "local", "retrieval": self.search_backend}
+
+        if hits and (self.search_rerank if rerank is None else rerank):
+            try:
+                remote = await self._remote_semantic_search(
+                    query, filters, session_id, similarity_threshold, max_results, candidates=hits
+                )
+                order = [item.get("id") for item in remote.get("results", []) if isinstance(item, dict)]
+                rank = {item_id: position for position, item_id in enumerate(order)}
+                result["results"] = sorted(hits, key=lambda hit: rank.get(hit["id"], len(rank)))
+                result["backend"] = "local+mcp_rerank"
+            except Exception as e:
+                # Reranking is best-effort; the local order stands on its own
+                result["rerank_error"] = str(e)
+        return result
+
+    def _local_search(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        similarity_threshold: Optional[float],
+        max_results: int
+    ) -> List[Dict[str, Any]]:
+        """本地检索；混合模式下按倒数排名融合BM25和向量结果（相似度阈值只约束向量结果）"""
+        if self.search_backend == "bm25":
+            return self.search_index.search(query, max_results, filters)
+        vector_hits = self.vector_index.search(query, max_results, similarity_threshold, filters)
+        if self.search_backend == "vector":
+            return vector_hits
+
+        bm25_hits = self.search_index.search(query, max_results, filters)
+        return reciprocal_rank_fusion([(bm25_hits, "bm25_score"), (vector_hits, "similarity")], max_results)
+
+    async def _remote_semantic_search(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]],
+        session_id: str,
+        similarity_threshold: Optional[float] = None,
+        max_results: int = 20,
+        candidates: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """调用远程语义搜索（提供candidates时仅对候选结果重排）"""
         payload = {
             "query": query,
-            "session_id": self.session_id,
             "filters": filters or {},
             "search_options": {
-                "similarity_threshold": 0.7,
-                "max_results": 20,
+                "similarity_threshold": 0.7 if similarity_threshold is None else similarity_threshold,
+                "max_results": max_results,
                 "include_metadata": True,
                 "rerank": True
             }
         }
+        if candidates is not None:
+            payload["candidates"] = [{"id": hit["id"], "content": hit["content"]} for hit in candidates]
+
+        response = await self._session_request(
+            "POST",
+            f"{self.mcp_server_url}/api/search/semantic",
+            session_id,
+            json=payload,
+            timeout=self.timeouts["search"],
+            idempotent=True
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_search_stats(self) -> Dict[str, Any]:
+        """获取本地全文索引和向量索引统计"""
+        return {
+            "backend": self.search_backend,
+            "remote_rerank": self.search_rerank,
+            "bm25": self.search_index.get_stats(),
+            "vector": self.vector_index.get_stats()
+        }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.mcp_server_url}/api/search/semantic",
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
-
-    async def get_document_insights(self, document_id: str) -> Dict[str, Any]:
+    async def get_document_insights(self, document_id: str, session_id: str = "default") -> Dict[str, Any]:
         """获取文档洞察"""
-        if not self.session_id:
-            await self.initialize_session()
-
-        headers = self._get_headers()
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.mcp_server_url}/api/documents/{document_id}/insights",
-                headers=headers,
-                params={"session_id": self.session_id}
-            )
-            response.raise_for_status()
-            return response.json()
-
-    async def create_knowledge_graph(self, documents: List[str], topic: str) -> Dict[str, Any]:
+        response = await self._session_request(
+            "GET",
+            f"{self.mcp_server_url}/api/documents/{document_id}/insights",
+            session_id,
+            timeout=self.timeouts["insights"],
+            idempotent=True
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def create_knowledge_graph(self, documents: List[str], topic: str, session_id: str = "default") -> Dict[str, Any]:
         """创建知识图谱"""
-        if not self.session_id:
-            await self.initialize_session()
-
-        headers = self._get_headers()
-        
         payload = {
             "documents": documents,
             "topic": topic,
-            "session_id": self.session_id,
             "graph_options": {
                 "entity_types": ["PERSON", "ORGANIZATION", "LOCATION", "TECHNOLOGY", "CONCEPT"],
                 "relationship_types": ["PART_OF", "RELATED_TO", "DEVELOPS", "LOCATED_IN"],
@@ -193,26 +568,21 @@ class MCPClient:
             }
         }
 
-        async with httpx.AsyncClient(timeout=180.0) as client:
-            response = await client.post(
-                f"{self.mcp_server_url}/api/knowledge-graph/create",
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
-
-    async def analyze_documents(self, document_ids: List[str], analysis_type: str = "comprehensive") -> Dict[str, Any]:
+        response = await self._session_request(
+            "POST",
+            f"{self.mcp_server_url}/api/knowledge-graph/create",
+            session_id,
+            json=payload,
+            timeout=self.timeouts["knowledge_graph"]
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def analyze_documents(self, document_ids: List[str], analysis_type: str = "comprehensive", session_id: str = "default") -> Dict[str, Any]:
         """分析多个文档"""
-        if not self.session_id:
-            await self.initialize_session()
-
-        headers = self._get_headers()
-        
         payload = {
             "document_ids": document_ids,
             "analysis_type": analysis_type,
-            "session_id": self.session_id,
             "analysis_options": {
                 "extract_trends": True,
                 "identify_gaps": True,
@@ -221,25 +591,20 @@ class MCPClient:
             }
         }
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                f"{self.mcp_server_url}/api/documents/analyze",
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
-
-    async def get_context_summary(self, context_keys: List[str]) -> Dict[str, Any]:
+        response = await self._session_request(
+            "POST",
+            f"{self.mcp_server_url}/api/documents/analyze",
+            session_id,
+            json=payload,
+            timeout=self.timeouts["analyze"]
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def get_context_summary(self, context_keys: List[str], session_id: str = "default") -> Dict[str, Any]:
         """获取上下文摘要"""
-        if not self.session_id:
-            await self.initialize_session()
-
-        headers = self._get_headers()
-        
         payload = {
             "context_keys": context_keys,
-            "session_id": self.session_id,
             "summary_options": {
                 "max_length": 500,
                 "include_sources": True,
@@ -247,60 +612,95 @@ class MCPClient:
             }
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{self.mcp_server_url}/api/context/summary",
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
-
-    async def store_context(self, key: str, data: Dict[str, Any]) -> bool:
-        """存储上下文数据"""
-        if not self.session_id:
-            await self.initialize_session()
-
-        headers = self._get_headers()
-        
+        response = await self._session_request(
+            "POST",
+            f"{self.mcp_server_url}/api/context/summary",
+            session_id,
+            json=payload,
+            timeout=self.timeouts["context"],
+            idempotent=True
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def store_context(
+        self,
+        key: str,
+        data: Dict[str, Any],
+        session_id: str = "default",
+        ttl: Optional[float] = None
+    ) -> bool:
+        """存储上下文数据（本地存储，按会话隔离；开启复制时异步同步到远程）"""
+        await self.context_store.set(session_id, key, data, ttl)
+        if self.context_replication:
+            task = asyncio.create_task(self._replicate_context(key, data, session_id))
+            self._replication_tasks.add(task)
+            task.add_done_callback(self._replication_tasks.discard)
+        return True
+
+    async def _replicate_context(self, key: str, data: Dict[str, Any], session_id: str):
+        """将上下文写入远程存储（失败只记录，不影响本地写入）"""
         payload = {
             "key": key,
             "data": data,
-            "session_id": self.session_id,
             "metadata": {
                 "timestamp": datetime.now().isoformat(),
                 "source": "产业集群智能体"
             }
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
+        try:
+            response = await self._session_request(
+                "POST",
                 f"{self.mcp_server_url}/api/context/store",
-                headers=headers,
-                json=payload
+                session_id,
+                json=payload,
+                timeout=self.timeouts["context"],
+                idempotent=True
             )
             response.raise_for_status()
-            return response.json().get("success", False)
-
-    async def retrieve_context(self, key: str) -> Optional[Dict[str, Any]]:
-        """检索上下文数据"""
-        if not self.session_id:
-            await self.initialize_session()
-
-        headers = self._get_headers()
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(
-                f"{self.mcp_server_url}/api/context/{key}",
-                headers=headers,
-                params={"session_id": self.session_id}
-            )
+            self._replication_stats["replicated"] += 1
+        except Exception as e:
+            self._replication_stats["failed"] += 1
+            print(f"Context replication failed for {session_id}/{key}: {e}")
+
+    async def retrieve_context(self, key: str, session_id: str = "default") -> Optional[Dict[str, Any]]:
+        """检索上下文数据（本地未命中且开启复制时回源远程并写回本地）"""
+        data = await self.context_store.get(session_id, key)
+        if data is not None or not self.context_replication:
+            return data
+
+        response = await self._session_request(
+            "GET",
+            f"{self.mcp_server_url}/api/context/{key}",
+            session_id,
+            timeout=self.timeouts["context"],
+            idempotent=True
+        )
             
-            if response.status_code == 404:
-                return None
+        if response.status_code == 404:
+            return None
                 
-            response.raise_for_status()
-            return response.json()
+        response.raise_for_status()
+        data = response.json()
+        self._replication_stats["remote_reads"] += 1
+        await self.context_store.set(session_id, key, data)
+        return data
+
+    async def delete_context(self, key: str, session_id: str = "default"):
+        """删除上下文数据"""
+        await self.context_store.delete(session_id, key)
+
+    def get_context_stats(self) -> Dict[str, Any]:
+        """获取上下文存储和远程复制统计"""
+        return {
+            **self.context_store.get_stats(),
+            "replication": {
+                **self._replication_stats,
+                "enabled": self.context_replication,
+                "in_flight": len(self._replication_tasks)
+            }
+        }
 
     def _get_headers(self) -> Dict[str, str]:
         """获取请求头"""
@@ -325,30 +725,45 @@ class MCPClient:
                 "profile": self.profile
             }
             
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                # Test the main URL for basic connectivity
-                response = await client.get(self.mcp_server_url, params=params)
-                return {
-                    "status": "connected" if response.status_code in [200, 404, 405] else "error",
-                    "server": self.mcp_server_url, 
-                    "profile": self.profile,
-                    "response_code": response.status_code
-                }
+            # Test the main URL for basic connectivity
+            response = await self._request(
+                "GET",
+                self.mcp_server_url,
+                params=params,
+                timeout=self.timeouts["health"],
+                guarded=False
+            )
+            return {
+                "status": "connected" if response.status_code in [200, 404, 405] else "error",
+                "server": self.mcp_server_url, 
+                "profile": self.profile,
+                "response_code": response.status_code,
+                "pool": self.get_pool_stats(),
+                "circuit_breakers": get_breaker_states()
+            }
         except Exception as e:
-            return {"status": "connection_failed", "error": str(e), "server": self.mcp_server_url}
+            return {
+                "status": "connection_failed",
+                "error": str(e),
+                "server": self.mcp_server_url,
+                "pool": self.get_pool_stats(),
+                "circuit_breakers": get_breaker_states()
+            }
 
-    async def close_session(self):
+    async def close_session(self, session_id: str = "default"):
         """关闭MCP会话"""
-        if self.session_id:
+        entry = self._sessions.get(session_id)
+        if entry:
             headers = self._get_headers()
             
             try:
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    await client.delete(
-                        f"{self.mcp_server_url}/api/sessions/{self.session_id}",
-                        headers=headers
-                    )
+                await self._request(
+                    "DELETE",
+                    f"{self.mcp_server_url}/api/sessions/{entry['mcp_session_id']}",
+                    headers=headers,
+                    timeout=self.timeouts["health"]
+                )
             except Exception as e:
                 print(f"Warning: Failed to close MCP session: {e}")
             
-            self.session_id = None
\ No newline at end of file
+            self._forget_session(session_id)
@@ -0,0 +1,101 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+class RemoteFileCache:
+    """远程文件内容缓存：按ETag/Last-Modified条件请求重新验证，按字节预算LRU淘汰"""
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        max_entry_bytes: Optional[int] = None,
+        fresh_seconds: Optional[float] = None
+    ):
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("REMOTE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else int(os.getenv("REMOTE_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+        # Within this window a cached body is served without contacting the server
+        self.fresh_seconds = fresh_seconds if fresh_seconds is not None else float(os.getenv("REMOTE_CACHE_FRESH_SECONDS", "5"))
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_bytes = 0
+        self._stats = {"hits": 0, "revalidated": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """查找缓存条目（不计入统计）"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["validated_at"] <= self.fresh_seconds
+
+    def conditional_headers(self, entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """生成条件请求头"""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record_hit(self):
+        self._stats["hits"] += 1
+
+    def record_revalidated(self, entry: Dict[str, Any]):
+        """304响应：刷新验证时间"""
+        entry["validated_at"] = time.monotonic()
+        self._stats["revalidated"] += 1
+
+    def record_miss(self):
+        self._stats["misses"] += 1
+
+    def store(self, key: str, body: bytes, headers: Dict[str, str]) -> bool:
+        """缓存完整响应体；没有验证器、禁止缓存或超出单条上限时跳过"""
+        etag = headers.get("etag")
+        last_modified = headers.get("last-modified")
+        if not (etag or last_modified):
+            return False
+        if "no-store" in headers.get("cache-control", "").lower():
+            return False
+        if len(body) > self.max_entry_bytes:
+            return False
+
+        self._remove(key)
+        self._entries[key] = {
+            "body": body,
+            "content_type": headers.get("content-type", ""),
+            "etag": etag,
+            "last_modified": last_modified,
+            "validated_at": time.monotonic()
+        }
+        self._total_bytes += len(body)
+        self._stats["stores"] += 1
+
+        while self._total_bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+        return True
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= len(entry["body"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中/重新验证/未命中统计"""
+        lookups = self._stats["hits"] + self._stats["revalidated"] + self._stats["misses"]
+
+        def rate(count: int) -> float:
+            return round(count / lookups, 4) if lookups else 0.0
+
+        return {
+            **self._stats,
+            "hit_rate": rate(self._stats["hits"]),
+            "revalidate_rate": rate(self._stats["revalidated"]),
+            "miss_rate": rate(self._stats["misses"]),
+            "entries": len(self._entries),
+            "total_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes
+        }
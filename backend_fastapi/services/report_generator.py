@@ -4,25 +4,102 @@ import os
 import json
 import asyncio
 from datetime import datetime
-from jinja2 import Template
-from typing import Dict, Any, List
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, TemplateNotFound, select_autoescape
+from typing import Dict, Any, List, Optional
 import aiofiles
+import re
+
+from services.resilience import backoff_delay
+
+TEMPLATE_DIR = os.getenv(
+    "REPORT_TEMPLATE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates", "reports")
+)
+DEFAULT_TEMPLATE = os.getenv("REPORT_DEFAULT_TEMPLATE", "default")
+_TEMPLATE_NAME = re.compile(r"^[\w-]+$")
+
+def _create_environment() -> Environment:
+    """进程内共享的模板环境：编译后的模板缓存在内存，字节码缓存在磁盘（重启后免重新编译）"""
+    cache_dir = os.getenv("REPORT_TEMPLATE_CACHE_DIR", "cache/jinja")
+    os.makedirs(cache_dir, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(["html"]),
+        bytecode_cache=FileSystemBytecodeCache(cache_dir),
+        # Re-checking template mtimes on every render is only useful while editing templates
+        auto_reload=os.getenv("REPORT_TEMPLATE_AUTO_RELOAD", "false").lower() == "true",
+        cache_size=int(os.getenv("REPORT_TEMPLATE_CACHE_SIZE", "64"))
+    )
+
+_environment = _create_environment()
+
+class ReportTemplateError(ValueError):
+    """报告模板不存在或名称无效"""
+
+def list_templates() -> List[str]:
+    """列出模板目录中的报告模板名称"""
+    return sorted(name[:-5] for name in _environment.list_templates(extensions=["html"]) if "/" not in name)
+
+OUTLINE_PROMPT = """
+你是专业的产业分析报告撰写专家。请为报告拟定大纲，只返回JSON：
+{
+  "title": "报告标题",
+  "sections": [
+    {"title": "章节标题", "focus": "本章要点（一句话）"}
+  ]
+}
+正文章节覆盖行业概况、现状分析、问题识别、发展趋势等方面，4-6个；执行摘要、建议措施和结论不要列入正文章节。
+"""
+
+SECTION_PROMPT = """
+你是专业的产业分析报告撰写专家，正在撰写《{title}》中的一个章节。
+报告全部章节：{outline}
+请只撰写第{index}章“{section}”（要点：{focus}），不要重复其他章节的内容。
+返回JSON：{{"title": "章节标题", "content": "详细内容", "subsections": [{{"title": "子章节标题", "content": "子章节内容"}}]}}
+"""
+
+DATA_PROMPT = """
+以下是根据实际数据计算的统计结果，涉及数字时必须以此为准，不要编造数据：
+{data}
+"""
+
+SUMMARY_PROMPT = """
+你是专业的产业分析报告撰写专家，正在撰写《{title}》的首尾部分。
+报告正文章节：{outline}
+请返回JSON：{{"executive_summary": "执行摘要内容", "recommendations": ["建议1", "建议2", "建议3"], "conclusion": "结论内容"}}
+"""
 
 class ReportGenerator:
     def __init__(self):
         self.llm = ChatOpenAI(
             model="gpt-4o",
             temperature=0.5,
+            streaming=True,  # tokens only reach callbacks when a streaming handler is attached
             openai_api_key=os.getenv("OPENAI_API_KEY")
         )
+        # "outline" drafts an outline and writes sections concurrently; "single" is one large completion
+        self.mode = os.getenv("REPORT_GENERATION_MODE", "outline").lower()
+        self.section_concurrency = int(os.getenv("REPORT_SECTION_CONCURRENCY", "4"))
+        self.section_retries = int(os.getenv("REPORT_SECTION_RETRIES", "2"))
+        self.data_max_chars = int(os.getenv("REPORT_DATA_MAX_CHARS", "8000"))
+
+    async def generate(
+        self,
+        topic: str,
+        session_id: str = "default",
+        data: Optional[Dict[str, Any]] = None,
+        template: Optional[str] = None,
+        callbacks: Optional[List[Any]] = None
+    ) -> str:
+        """异步生成报告；data为实际数据的统计结果（如表格分析），报告中的数字以其为准；template为报告模板名称；callbacks接收模型令牌"""
+        # Fail fast on an unknown template before spending model calls
+        self.get_template(template)
 
-    async def generate(self, topic: str, session_id: str = "default") -> str:
-        """异步生成报告"""
         # Generate report content using AI
-        report_data = await self._generate_report_content(topic)
+        report_data = await self._generate_report_content(topic, data, callbacks)
         
         # Create HTML report
-        html_content = self._create_html_report(report_data)
+        html_content = self._create_html_report(report_data, template)
         
         # Save report to file
         filename = f"{self._sanitize_filename(topic)}_{session_id}_{int(datetime.now().timestamp())}.html"
@@ -34,16 +111,168 @@ class ReportGenerator:
         
         return f"/download/{filename}"
 
-    def generate_sync(self, topic: str) -> str:
-        """同步版本的报告生成"""
+    async def _generate_report_content(
+        self,
+        topic: str,
+        data: Optional[Dict[str, Any]] = None,
+        callbacks: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        """使用AI生成报告内容"""
+        facts = self._format_data(data)
+        if self.mode == "outline":
+            return await self._generate_outlined_content(topic, facts, callbacks)
+        return await self._generate_single_content(topic, facts, callbacks)
+
+    def _format_data(self, data: Optional[Dict[str, Any]]) -> str:
+        """把统计数据拼入提示词（超长时截断）"""
+        if not data:
+            return ""
+        text = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+        if len(text) > self.data_max_chars:
+            text = text[:self.data_max_chars] + "…（已截断）"
+        return DATA_PROMPT.format(data=text)
+
+    @staticmethod
+    def _parse_json(content: str) -> Optional[Any]:
+        """解析模型返回的JSON（兼容markdown代码块包裹）"""
+        content = re.sub(r"^```(?:json)?\s*|\s*```$", "", content.strip())
         try:
-            loop = asyncio.get_event_loop()
-            return loop.run_until_complete(self.generate(topic))
-        except RuntimeError:
-            return asyncio.run(self.generate(topic))
+            return json.loads(content)
+        except json.JSONDecodeError:
+            return None
 
-    async def _generate_report_content(self, topic: str) -> Dict[str, Any]:
-        """使用AI生成报告内容"""
+    async def _complete(self, system_prompt: str, user_prompt: str, callbacks: Optional[List[Any]] = None) -> str:
+        response = await self.llm.agenerate(
+            [[SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]],
+            callbacks=callbacks
+        )
+        return response.generations[0][0].text
+
+    async def _with_retries(self, name: str, make_call):
+        """失败时按退避重试单个生成任务，不影响其他并发任务"""
+        for attempt in range(self.section_retries + 1):
+            try:
+                return await make_call()
+            except Exception as e:
+                if attempt >= self.section_retries:
+                    raise
+                print(f"Report part '{name}' failed (attempt {attempt + 1}), retrying: {e}")
+                await asyncio.sleep(backoff_delay(
+                    attempt,
+                    float(os.getenv("RETRY_BASE_DELAY", "0.5")),
+                    float(os.getenv("RETRY_MAX_DELAY", "5"))
+                ))
+
+    async def _generate_outline(self, topic: str, facts: str = "", callbacks: Optional[List[Any]] = None) -> Dict[str, Any]:
+        """生成报告大纲：标题和正文章节列表"""
+        try:
+            content = await self._with_retries(
+                "outline", lambda: self._complete(OUTLINE_PROMPT + facts, f"报告主题：{topic}", callbacks)
+            )
+            outline = self._parse_json(content)
+        except Exception as e:
+            print(f"Report outline failed, using the default outline: {e}")
+            outline = None
+        if not isinstance(outline, dict) or not outline.get("sections"):
+            return {
+                "title": f"{topic} - 产业分析报告",
+                "sections": [{"title": title, "focus": ""} for title in ("行业概况", "现状分析", "问题识别", "发展趋势")]
+            }
+        outline.setdefault("title", f"{topic} - 产业分析报告")
+        return outline
+
+    async def _generate_section(
+        self,
+        outline: Dict[str, Any],
+        index: int,
+        semaphore: asyncio.Semaphore,
+        facts: str = "",
+        callbacks: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        section = outline["sections"][index]
+        prompt = SECTION_PROMPT.format(
+            title=outline["title"],
+            outline="、".join(s["title"] for s in outline["sections"]),
+            index=index + 1,
+            section=section["title"],
+            focus=section.get("focus", "")
+        ) + facts
+        async with semaphore:
+            content = await self._with_retries(
+                section["title"], lambda: self._complete(prompt, f"请撰写章节：{section['title']}", callbacks)
+            )
+        data = self._parse_json(content)
+        if not isinstance(data, dict) or "content" not in data:
+            # Unstructured prose is still usable as the section body
+            return {"title": section["title"], "content": content.strip(), "subsections": []}
+        data["title"] = section["title"]
+        data.setdefault("subsections", [])
+        return data
+
+    async def _generate_summary(
+        self,
+        outline: Dict[str, Any],
+        semaphore: asyncio.Semaphore,
+        facts: str = "",
+        callbacks: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        prompt = SUMMARY_PROMPT.format(
+            title=outline["title"],
+            outline="；".join(f"{s['title']}（{s.get('focus', '')}）" for s in outline["sections"])
+        ) + facts
+        async with semaphore:
+            content = await self._with_retries(
+                "summary", lambda: self._complete(prompt, "请撰写执行摘要、建议措施和结论", callbacks)
+            )
+        data = self._parse_json(content)
+        if not isinstance(data, dict):
+            raise ValueError("执行摘要返回格式错误")
+        return data
+
+    async def _generate_outlined_content(
+        self,
+        topic: str,
+        facts: str = "",
+        callbacks: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        """先生成大纲，再并发生成各章节和首尾部分，组装为与单次生成相同的report_data结构"""
+        outline = await self._generate_outline(topic, facts, callbacks)
+        semaphore = asyncio.Semaphore(self.section_concurrency)
+        # Sections stream concurrently; token events carry the run_id of the call they belong to
+        results = await asyncio.gather(
+            self._generate_summary(outline, semaphore, facts, callbacks),
+            *(self._generate_section(outline, i, semaphore, facts, callbacks) for i in range(len(outline["sections"]))),
+            return_exceptions=True
+        )
+        summary, sections = results[0], results[1:]
+
+        fallback = self._get_fallback_report_data(topic)
+        if isinstance(summary, Exception):
+            print(f"Report summary failed after retries: {summary}")
+            summary = fallback
+        report_sections = []
+        for section, result in zip(outline["sections"], sections):
+            if isinstance(result, Exception):
+                # Keep the report usable when a single section keeps failing
+                print(f"Report section '{section['title']}' failed after retries: {result}")
+                result = {"title": section["title"], "content": "（本章节生成失败，请稍后重新生成报告）", "subsections": []}
+            report_sections.append(result)
+
+        return {
+            "title": outline["title"],
+            "executive_summary": summary.get("executive_summary") or fallback["executive_summary"],
+            "sections": report_sections,
+            "recommendations": summary.get("recommendations") or fallback["recommendations"],
+            "conclusion": summary.get("conclusion") or fallback["conclusion"]
+        }
+
+    async def _generate_single_content(
+        self,
+        topic: str,
+        facts: str = "",
+        callbacks: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        """单次调用生成完整报告内容"""
         system_message = SystemMessage(content="""
 你是专业的产业分析报告撰写专家。请根据主题生成完整的分析报告内容。
 
@@ -74,9 +303,9 @@ class ReportGenerator:
 }
 """)
 
-        human_message = HumanMessage(content=f"请为以下主题生成详细的产业分析报告：{topic}")
+        human_message = HumanMessage(content=f"请为以下主题生成详细的产业分析报告：{topic}{facts}")
         
-        response = await self.llm.agenerate([[system_message, human_message]])
+        response = await self.llm.agenerate([[system_message, human_message]], callbacks=callbacks)
         content = response.generations[0][0].text
 
         try:
@@ -85,197 +314,20 @@ class ReportGenerator:
             # Return fallback structure if JSON parsing fails
             return self._get_fallback_report_data(topic)
 
-    def _create_html_report(self, report_data: Dict[str, Any]) -> str:
+    @staticmethod
+    def get_template(name: Optional[str] = None):
+        """按名称获取报告模板（编译结果由共享Environment缓存）"""
+        name = name or DEFAULT_TEMPLATE
+        if not _TEMPLATE_NAME.match(name):
+            raise ReportTemplateError(f"模板名称无效: {name}")
+        try:
+            return _environment.get_template(f"{name}.html")
+        except TemplateNotFound:
+            raise ReportTemplateError(f"报告模板不存在: {name}（可用模板：{', '.join(list_templates())}）")
+
+    def _create_html_report(self, report_data: Dict[str, Any], template: Optional[str] = None) -> str:
         """创建HTML格式的报告"""
-        template_str = """
-<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{{ report_data.title }}</title>
-    <style>
-        body {
-            font-family: "Microsoft YaHei", "PingFang SC", Arial, sans-serif;
-            line-height: 1.8;
-            max-width: 1000px;
-            margin: 0 auto;
-            padding: 40px 20px;
-            color: #333;
-            background-color: #fff;
-        }
-        .header {
-            text-align: center;
-            margin-bottom: 50px;
-            border-bottom: 3px solid #3b82f6;
-            padding-bottom: 30px;
-        }
-        h1 {
-            color: #1f2937;
-            font-size: 2.5em;
-            margin-bottom: 10px;
-            font-weight: bold;
-        }
-        .meta-info {
-            color: #6b7280;
-            font-size: 1.1em;
-            margin-top: 20px;
-        }
-        .executive-summary {
-            background: linear-gradient(135deg, #f3f4f6 0%, #e5e7eb 100%);
-            padding: 30px;
-            border-radius: 12px;
-            margin: 40px 0;
-            border-left: 5px solid #3b82f6;
-        }
-        .executive-summary h2 {
-            color: #1f2937;
-            margin-top: 0;
-            font-size: 1.5em;
-        }
-        .section {
-            margin: 40px 0;
-            padding: 25px;
-            background: #f9fafb;
-            border-radius: 8px;
-            border-left: 4px solid #10b981;
-        }
-        h2 {
-            color: #1f2937;
-            font-size: 1.4em;
-            margin-bottom: 20px;
-            border-bottom: 2px solid #e5e7eb;
-            padding-bottom: 10px;
-        }
-        h3 {
-            color: #374151;
-            font-size: 1.2em;
-            margin: 25px 0 15px 0;
-        }
-        .subsection {
-            margin: 20px 0;
-            padding: 15px;
-            background: white;
-            border-radius: 6px;
-            box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-        }
-        .recommendations {
-            background: linear-gradient(135deg, #ecfdf5 0%, #d1fae5 100%);
-            padding: 30px;
-            border-radius: 12px;
-            margin: 40px 0;
-            border-left: 5px solid #10b981;
-        }
-        .recommendations h2 {
-            color: #047857;
-            margin-top: 0;
-        }
-        .recommendation-list {
-            list-style: none;
-            padding: 0;
-        }
-        .recommendation-list li {
-            background: white;
-            margin: 15px 0;
-            padding: 15px 20px;
-            border-radius: 8px;
-            border-left: 3px solid #10b981;
-            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        }
-        .recommendation-list li:before {
-            content: "✓ ";
-            color: #10b981;
-            font-weight: bold;
-            margin-right: 10px;
-        }
-        .conclusion {
-            background: linear-gradient(135deg, #fef3c7 0%, #fcd34d 100%);
-            padding: 30px;
-            border-radius: 12px;
-            margin: 40px 0;
-            border-left: 5px solid #f59e0b;
-        }
-        .conclusion h2 {
-            color: #92400e;
-            margin-top: 0;
-        }
-        .footer {
-            text-align: center;
-            margin-top: 60px;
-            padding-top: 30px;
-            border-top: 2px solid #e5e7eb;
-            color: #6b7280;
-            font-size: 0.9em;
-        }
-        @media print {
-            body { margin: 0; padding: 20px; }
-            .header, .section, .recommendations, .conclusion {
-                page-break-inside: avoid;
-            }
-        }
-        @media (max-width: 768px) {
-            body { padding: 20px 15px; }
-            h1 { font-size: 2em; }
-            .executive-summary, .section, .recommendations, .conclusion {
-                padding: 20px;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="header">
-        <h1>{{ report_data.title }}</h1>
-        <div class="meta-info">
-            <p>生成时间：{{ current_time }}</p>
-            <p>产业集群智能体系统 - 专业分析报告</p>
-        </div>
-    </div>
-
-    <div class="executive-summary">
-        <h2>📋 执行摘要</h2>
-        <p>{{ report_data.executive_summary }}</p>
-    </div>
-
-    {% for section in report_data.sections %}
-    <div class="section">
-        <h2>{{ loop.index }}. {{ section.title }}</h2>
-        <p>{{ section.content }}</p>
-        
-        {% if section.subsections %}
-            {% for subsection in section.subsections %}
-            <div class="subsection">
-                <h3>{{ subsection.title }}</h3>
-                <p>{{ subsection.content }}</p>
-            </div>
-            {% endfor %}
-        {% endif %}
-    </div>
-    {% endfor %}
-
-    <div class="recommendations">
-        <h2>💡 建议措施</h2>
-        <ul class="recommendation-list">
-            {% for recommendation in report_data.recommendations %}
-            <li>{{ recommendation }}</li>
-            {% endfor %}
-        </ul>
-    </div>
-
-    <div class="conclusion">
-        <h2>🎯 总结</h2>
-        <p>{{ report_data.conclusion }}</p>
-    </div>
-
-    <div class="footer">
-        <p>本报告由产业集群智能体系统自动生成</p>
-        <p>© 2025 产业集群智能体 - 专业的产业分析解决方案</p>
-    </div>
-</body>
-</html>
-"""
-        
-        template = Template(template_str)
-        return template.render(
+        return self.get_template(template).render(
             report_data=report_data,
             current_time=datetime.now().strftime("%Y年%m月%d日 %H:%M")
         )
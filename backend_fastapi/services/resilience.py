@@ -0,0 +1,143 @@
+import asyncio
+import os
+import random
+import time
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+import httpx
+
+# Upstream responses that indicate the service itself is struggling
+RETRYABLE_STATUS = (502, 503, 504)
+
+class CircuitOpenError(Exception):
+    """熔断器打开时快速失败"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"上游服务 {name} 暂不可用（熔断中），{retry_after:.0f}秒后重试")
+
+class CircuitBreaker:
+    """简单的三态熔断器：closed -> open -> half_open -> closed"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.total_failures = 0
+        self.total_rejected = 0
+        self._trial_in_flight = False
+
+    def before_call(self):
+        """调用前检查熔断状态"""
+        if self.state == "open":
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.recovery_timeout:
+                self.total_rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout - elapsed)
+            self.state = "half_open"
+
+        if self.state == "half_open":
+            # Only one trial request is let through while half open
+            if self._trial_in_flight:
+                self.total_rejected += 1
+                raise CircuitOpenError(self.name, self.recovery_timeout)
+            self._trial_in_flight = True
+
+    def record_success(self):
+        """记录成功调用"""
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def release(self):
+        """调用被取消或出现非网络错误时释放半开试探名额（不计入失败）"""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        """记录失败调用"""
+        self.failures += 1
+        self.total_failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def get_state(self) -> Dict[str, Any]:
+        """获取熔断器状态"""
+        state = {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+            "total_failures": self.total_failures,
+            "total_rejected": self.total_rejected
+        }
+        if self.state == "open":
+            state["retry_after"] = round(max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at)), 1)
+        return state
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """按上游名称获取共享熔断器"""
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+            recovery_timeout=float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "30"))
+        )
+    return _breakers[name]
+
+def get_breaker_states() -> Dict[str, Dict[str, Any]]:
+    """获取所有熔断器状态"""
+    return {name: breaker.get_state() for name, breaker in _breakers.items()}
+
+def backoff_delay(attempt: int, base_delay: float = 0.5, max_delay: float = 5.0) -> float:
+    """指数退避加全抖动"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+async def call_with_resilience(
+    func: Callable[[], Awaitable[httpx.Response]],
+    breaker: Optional[CircuitBreaker] = None,
+    retries: int = 0
+) -> httpx.Response:
+    """通过熔断器执行HTTP调用，对可重试错误进行抖动退避重试"""
+    base_delay = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+    max_delay = float(os.getenv("RETRY_MAX_DELAY", "5"))
+
+    attempt = 0
+    while True:
+        if breaker:
+            breaker.before_call()
+        try:
+            response = await func()
+        except asyncio.CancelledError:
+            if breaker:
+                breaker.release()
+            raise
+        except httpx.TransportError:
+            if breaker:
+                breaker.record_failure()
+            if attempt >= retries:
+                raise
+        except Exception:
+            # Not an upstream health signal, but the half-open trial slot must still be freed
+            if breaker:
+                breaker.release()
+            raise
+        else:
+            if response.status_code not in RETRYABLE_STATUS:
+                if breaker:
+                    breaker.record_success()
+                return response
+            if breaker:
+                breaker.record_failure()
+            if attempt >= retries:
+                return response
+
+        await asyncio.sleep(backoff_delay(attempt, base_delay, max_delay))
+        attempt += 1
@@ -0,0 +1,348 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from services.segment_store import (
+    DeltaSegment, Segment, SegmentedIndex, concat_texts, pack_texts, select_texts
+)
+
+try:
+    import jieba  # Chinese word segmentation is optional; CJK bigrams are the fallback
+    jieba.setLogLevel(60)
+    JIEBA_AVAILABLE = True
+except ImportError:
+    JIEBA_AVAILABLE = False
+
+_CJK_RUN = re.compile(r"[一-鿿㐀-䶿]+")
+_WORD = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    """分词：英文/数字按单词切分；中文用jieba搜索模式，未安装时用单字加二元组"""
+    text = text.lower()
+    tokens = _WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if JIEBA_AVAILABLE:
+            tokens.extend(word for word in jieba.cut_for_search(run) if word.strip())
+        else:
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """按字符切分为带重叠的片段，优先在换行或句号处断开"""
+    text = text.strip()
+    overlap = min(overlap, chunk_size // 2)
+    if len(text) <= chunk_size:
+        return [text] if text else []
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            cut = max(text.rfind("\n", start, end), text.rfind("。", start, end))
+            if cut > start + chunk_size // 2:
+                end = cut + 1
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+def _matches(metadata: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """过滤条件：列表值表示"属于其一"，其余值要求相等"""
+    for key, expected in filters.items():
+        value = metadata.get(key)
+        if isinstance(expected, (list, tuple, set)):
+            if value not in expected:
+                return False
+        elif value != expected:
+            return False
+    return True
+
+def reciprocal_rank_fusion(
+    ranked_lists: List[Tuple[List[Dict[str, Any]], str]],
+    max_results: int,
+    k: int = 60
+) -> List[Dict[str, Any]]:
+    """倒数排名融合：同一文档同一片段在各列表中的 1/(k+名次) 相加，各列表的原始分数保留在对应键下"""
+    fused: Dict[tuple, Dict[str, Any]] = {}
+    for hits, score_key in ranked_lists:
+        for rank, hit in enumerate(hits):
+            key = (hit["doc_id"], hit["content"])
+            entry = fused.setdefault(key, {**hit, "rrf_score": 0.0})
+            entry[score_key] = hit.get("score", hit.get("similarity"))
+            entry["rrf_score"] += 1.0 / (k + rank + 1)
+
+    ranked = sorted(fused.values(), key=lambda hit: hit["rrf_score"], reverse=True)[:max_results]
+    for hit in ranked:
+        hit.pop("score", None)
+        hit["rrf_score"] = round(hit["rrf_score"], 6)
+    return ranked
+
+def _layout_postings(term_ids: np.ndarray, rows: np.ndarray, tfs: np.ndarray, names: List[str]) -> tuple:
+    """按词项连续排列倒排表，返回 (词表 {词项: [起, 止)}, 片段行号, 词频)"""
+    order = np.lexsort((rows, term_ids))
+    counts = np.bincount(term_ids, minlength=len(names)) if len(term_ids) else np.zeros(len(names), dtype=np.int64)
+    ends = np.cumsum(counts)
+    vocab = {names[g]: [int(ends[g] - counts[g]), int(ends[g])] for g in np.flatnonzero(counts)}
+    return vocab, rows[order].astype(np.int32), tfs[order].astype(np.float32)
+
+class _Segment(Segment):
+    """BM25磁盘段：每个词项的倒排在postings数组中占一段连续区间"""
+
+    ARRAYS = ["chunk_ids", "lengths", "postings_chunk", "postings_tf", "text_offsets", "texts"]
+
+    def __init__(self, name: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        super().__init__(name, arrays, meta)
+        self.lengths = arrays["lengths"]
+        self.postings_chunk = arrays["postings_chunk"]
+        self.postings_tf = arrays["postings_tf"]
+        self.vocab: Dict[str, List[int]] = meta["vocab"]
+
+    def arrays(self) -> tuple:
+        return np.asarray(self.chunk_ids), np.asarray(self.lengths), self.alive
+
+    def postings(self, term: str) -> Optional[tuple]:
+        span = self.vocab.get(term)
+        if not span:
+            return None
+        start, end = span
+        return np.asarray(self.postings_chunk[start:end], dtype=np.int64), np.asarray(self.postings_tf[start:end])
+
+class _Delta(DeltaSegment):
+    """BM25增量段：倒排以字典保存，刷盘时一次性排成段数组"""
+
+    def __init__(self, first: int):
+        super().__init__(first)
+        self.terms: Dict[str, Dict[int, int]] = {}
+        self.lengths: List[int] = []
+
+    def add(self, counts: Counter, text: str):
+        row = len(self.texts)
+        for term, tf in counts.items():
+            self.terms.setdefault(term, {})[row] = tf
+        self.lengths.append(sum(counts.values()))
+        self.texts.append(text)
+        self.alive.append(True)
+
+    def arrays(self) -> tuple:
+        return self.chunk_id_array(), np.asarray(self.lengths, dtype=np.float32), np.asarray(self.alive, dtype=bool)
+
+    def postings(self, term: str) -> Optional[tuple]:
+        entries = self.terms.get(term)
+        if not entries:
+            return None
+        return (
+            np.fromiter(entries.keys(), dtype=np.int64, count=len(entries)),
+            np.fromiter(entries.values(), dtype=np.float32, count=len(entries))
+        )
+
+    def to_segment(self, documents: Dict[str, Dict[str, Any]]) -> Optional[tuple]:
+        """把仍有效的片段及其文档条目编成段，全部已删除时返回None"""
+        chunk_ids, lengths, keep = self.arrays()
+        if not keep.any():
+            return None
+        new_rows = np.cumsum(keep) - 1
+        names: List[str] = []
+        term_ids: List[int] = []
+        rows: List[int] = []
+        tfs: List[int] = []
+        for term, entries in self.terms.items():
+            names.append(term)
+            term_ids.extend([len(names) - 1] * len(entries))
+            rows.extend(entries.keys())
+            tfs.extend(entries.values())
+        term_array = np.asarray(term_ids, dtype=np.int64)
+        row_array = np.asarray(rows, dtype=np.int64)
+        mask = keep[row_array]
+        vocab, postings_chunk, postings_tf = _layout_postings(
+            term_array[mask], new_rows[row_array[mask]], np.asarray(tfs, dtype=np.float32)[mask], names
+        )
+        offsets, texts = pack_texts([text for text, alive in zip(self.texts, self.alive) if alive])
+        arrays = {
+            "chunk_ids": chunk_ids[keep],
+            "lengths": lengths[keep],
+            "postings_chunk": postings_chunk,
+            "postings_tf": postings_tf,
+            "text_offsets": offsets,
+            "texts": texts
+        }
+        return arrays, {"vocab": vocab, "documents": self.owned_documents(documents)}
+
+def _merge_segments(sources: List[_Segment], keeps: List[np.ndarray]) -> tuple:
+    """合并相邻段并去掉已删除片段（全部为NumPy数组运算，不逐条重建倒排）"""
+    terms: Dict[str, int] = {}
+    documents: Dict[str, Dict[str, Any]] = {}
+    term_parts, row_parts, tf_parts, id_parts, length_parts, text_parts = [], [], [], [], [], []
+    base = 0
+    for segment, keep in zip(sources, keeps):
+        new_rows = np.cumsum(keep) - 1 + base
+        # Postings are laid out term by term, so spans in start order cover the arrays in sequence
+        spans = sorted(segment.vocab.items(), key=lambda item: item[1][0])
+        term_ids = np.fromiter((terms.setdefault(term, len(terms)) for term, _ in spans), dtype=np.int64, count=len(spans))
+        counts = np.fromiter((end - start for _, (start, end) in spans), dtype=np.int64, count=len(spans))
+        local = np.asarray(segment.postings_chunk, dtype=np.int64)
+        mask = keep[local]
+        term_parts.append(np.repeat(term_ids, counts)[mask])
+        row_parts.append(new_rows[local[mask]])
+        tf_parts.append(np.asarray(segment.postings_tf)[mask])
+
+        kept_ids = np.asarray(segment.chunk_ids)[keep]
+        kept_set = set(kept_ids.tolist())
+        documents.update(
+            (doc_id, doc) for doc_id, doc in segment.documents.items() if doc["chunk_ids"][0] in kept_set
+        )
+        id_parts.append(kept_ids)
+        length_parts.append(np.asarray(segment.lengths)[keep])
+        text_parts.append(select_texts(segment.text_offsets, segment.texts, keep))
+        base += int(keep.sum())
+
+    vocab, postings_chunk, postings_tf = _layout_postings(
+        np.concatenate(term_parts), np.concatenate(row_parts), np.concatenate(tf_parts), list(terms)
+    )
+    offsets, texts = concat_texts(text_parts)
+    arrays = {
+        "chunk_ids": np.concatenate(id_parts),
+        "lengths": np.concatenate(length_parts).astype(np.float32),
+        "postings_chunk": postings_chunk,
+        "postings_tf": postings_tf,
+        "text_offsets": offsets,
+        "texts": texts
+    }
+    return arrays, {"vocab": vocab, "documents": documents}
+
+class BM25Index(SegmentedIndex):
+    """分段全文倒排索引（BM25排序），文档频率和平均长度只统计有效片段"""
+
+    label = "search index"
+
+    def __init__(self, index_dir: Optional[str] = None):
+        self.chunk_size = int(os.getenv("SEARCH_CHUNK_SIZE", "500"))
+        self.chunk_overlap = int(os.getenv("SEARCH_CHUNK_OVERLAP", "50"))
+        self.k1 = float(os.getenv("SEARCH_BM25_K1", "1.5"))
+        self.b = float(os.getenv("SEARCH_BM25_B", "0.75"))
+        self._live_length = 0.0
+        super().__init__(
+            index_dir or os.getenv("SEARCH_INDEX_DIR", "cache/search_index"),
+            int(os.getenv("SEARCH_INDEX_FLUSH_CHUNKS", "1000")),
+            int(os.getenv("SEARCH_INDEX_MERGE_FACTOR", "4"))
+        )
+        self._load()
+
+    def _open(self, name: str) -> _Segment:
+        arrays, meta = self.store.open_segment(name, _Segment.ARRAYS)
+        return _Segment(name, arrays, meta)
+
+    def _new_delta(self, first: int) -> _Delta:
+        return _Delta(first)
+
+    def _build_delta(self) -> Optional[tuple]:
+        return self._delta.to_segment(self.documents)
+
+    def _merge(self, sources: List[_Segment], keeps: List[np.ndarray]) -> tuple:
+        return _merge_segments(sources, keeps)
+
+    def _chunks_removed(self, view, rows: np.ndarray):
+        self._live_length -= float(np.asarray(view.lengths, dtype=np.float64)[rows].sum())
+
+    def _loaded(self):
+        self._live_length = sum(float(np.asarray(segment.lengths)[segment.alive].sum()) for segment in self._segments)
+
+    def add_document(self, doc_id: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """增量索引文档；同一doc_id重复添加时替换旧内容，返回片段数"""
+        chunks = chunk_text(content or "", self.chunk_size, self.chunk_overlap)
+        tokenized = [Counter(tokenize(chunk)) for chunk in chunks]
+
+        with self._lock:
+            flushed = self._index_locked(doc_id, metadata, list(zip(tokenized, chunks)))
+            self._live_length += sum(sum(counts.values()) for counts in tokenized)
+        if flushed:
+            self._schedule_merge()
+        return len(chunks)
+
+    def search(self, query: str, top_k: int = 20, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """BM25检索（文档频率和平均长度只统计有效片段），按文档元数据过滤，返回得分最高的片段"""
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or self._live_chunks == 0:
+                return []
+            live = self._live_chunks
+            avgdl = self._live_length / live or 1.0
+            views = self._segments + ([self._delta] if len(self._delta) else [])
+            arrays = [view.arrays() for view in views]
+
+            # Collect live postings per term first: df must span every segment before scoring
+            matched = []
+            for term in terms:
+                parts, df = [], 0
+                for index, view in enumerate(views):
+                    found = view.postings(term)
+                    if found is None:
+                        continue
+                    rows, tf = found
+                    alive = arrays[index][2][rows]
+                    if alive.any():
+                        parts.append((index, rows[alive], tf[alive]))
+                        df += int(alive.sum())
+                if df:
+                    matched.append((df, parts))
+
+            scores = [np.zeros(len(view), dtype=np.float32) for view in views]
+            for df, parts in matched:
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                for index, rows, tf in parts:
+                    norm = self.k1 * (1 - self.b + self.b * arrays[index][1][rows] / avgdl)
+                    scores[index][rows] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            if filters:
+                allowed = np.asarray([
+                    chunk_id for doc in self.documents.values() if _matches(doc["metadata"], filters)
+                    for chunk_id in doc["chunk_ids"]
+                ], dtype=np.int64)
+                for index in range(len(views)):
+                    scores[index][~np.isin(arrays[index][0], allowed)] = 0
+
+            ranked = []
+            for index, row_scores in enumerate(scores):
+                candidates = np.flatnonzero(row_scores > 0)
+                if len(candidates) > top_k:
+                    candidates = candidates[np.argpartition(-row_scores[candidates], top_k - 1)[:top_k]]
+                ranked.extend((-float(row_scores[row]), index, int(row)) for row in candidates)
+            ranked.sort()
+
+            results = []
+            for negative_score, index, row in ranked[:top_k]:
+                chunk_id = int(arrays[index][0][row])
+                doc_id = self.chunk_docs[chunk_id]
+                results.append({
+                    "id": f"{doc_id}#{chunk_id}",
+                    "doc_id": doc_id,
+                    "chunk_id": chunk_id,
+                    "score": round(-negative_score, 4),
+                    "content": views[index].text(row),
+                    "metadata": self.documents[doc_id]["metadata"]
+                })
+            return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计信息"""
+        with self._lock:
+            return {
+                **self._segment_stats(),
+                "vocabulary": len(set(self._delta.terms).union(*(segment.vocab for segment in self._segments))),
+                "tokenizer": "jieba" if JIEBA_AVAILABLE else "cjk_bigram"
+            }
+
+_search_index: Optional[BM25Index] = None
+
+def get_search_index() -> BM25Index:
+    """获取进程内共享的全文索引"""
+    global _search_index
+    if _search_index is None:
+        _search_index = BM25Index()
+    return _search_index
@@ -0,0 +1,428 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+MANIFEST = "manifest.json"
+SEGMENT_PREFIX = "seg_"
+
+def pack_texts(texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """将文本打包为 (偏移数组, UTF-8字节数组)，便于mmap读取"""
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+def text_at(offsets: np.ndarray, texts: np.ndarray, row: int) -> str:
+    start, end = int(offsets[row]), int(offsets[row + 1])
+    return bytes(texts[start:end]).decode("utf-8")
+
+def select_texts(offsets: np.ndarray, texts: np.ndarray, keep: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """按行掩码筛选打包文本（按字节掩码一次完成，不逐行解码）"""
+    sizes = np.diff(np.asarray(offsets))
+    kept = np.zeros(int(keep.sum()) + 1, dtype=np.int64)
+    kept[1:] = np.cumsum(sizes[keep])
+    return kept, np.asarray(texts)[np.repeat(keep, sizes)]
+
+def take_texts(offsets: np.ndarray, texts: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """按行号重排打包文本（IVF分区改变行序时使用）"""
+    offsets = np.asarray(offsets)
+    sizes = np.diff(offsets)[rows]
+    taken = np.zeros(len(rows) + 1, dtype=np.int64)
+    taken[1:] = np.cumsum(sizes)
+    positions = np.repeat(offsets[:-1][rows] - taken[:-1], sizes) + np.arange(int(taken[-1]), dtype=np.int64)
+    return taken, np.asarray(texts)[positions]
+
+def concat_texts(parts: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """拼接多段打包文本"""
+    offset_parts, text_parts, base = [np.zeros(1, dtype=np.int64)], [], 0
+    for offsets, texts in parts:
+        offset_parts.append(np.asarray(offsets[1:]) + base)
+        text_parts.append(np.asarray(texts))
+        base += len(texts)
+    texts = np.concatenate(text_parts).astype(np.uint8) if text_parts else np.zeros(0, dtype=np.uint8)
+    return np.concatenate(offset_parts), texts
+
+def plan_merge(live_sizes: List[int], dead_sizes: List[int], flush_size: int, factor: int) -> Optional[Tuple[int, int]]:
+    """分层合并策略，返回要合并的相邻段区间 [start, end)：
+    末尾连续factor个同层段合并为一段（每个片段只被重写对数次），已删除片段过半的段单独压缩"""
+    def tier(size: int) -> int:
+        level, limit = 0, max(1, flush_size) * factor
+        while size >= limit:
+            level, limit = level + 1, limit * factor
+        return level
+
+    if factor > 1 and len(live_sizes) >= factor:
+        last = tier(live_sizes[-1])
+        start = len(live_sizes) - 1
+        while start > 0 and tier(live_sizes[start - 1]) == last:
+            start -= 1
+        if len(live_sizes) - start >= factor:
+            return start, len(live_sizes)
+    for index, (live, dead) in enumerate(zip(live_sizes, dead_sizes)):
+        if dead and dead >= live:
+            return index, index + 1
+    return None
+
+class SegmentStore:
+    """索引段目录：每个段是不可变目录（写入临时目录后整体改名），manifest.json列出当前生效的段。
+    新段和合并结果都先完整写入新目录，再原子替换清单切换；崩溃只会留下未被引用、下次启动时清理的目录"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def read_manifest(self) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.root, MANIFEST)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_segment(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> str:
+        """写入新段并返回段名；目录改名前段不可见"""
+        name = f"{SEGMENT_PREFIX}{time.time_ns():016x}_{uuid.uuid4().hex[:6]}"
+        temp_dir = os.path.join(self.root, f".{name}.tmp")
+        os.makedirs(temp_dir)
+        try:
+            for key, array in arrays.items():
+                with open(os.path.join(temp_dir, f"{key}.npy"), "wb") as f:
+                    np.save(f, array)
+                    f.flush()
+                    os.fsync(f.fileno())
+            with open(os.path.join(temp_dir, "segment.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(temp_dir, os.path.join(self.root, name))
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+        return name
+
+    def open_segment(self, name: str, keys: List[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """以mmap方式打开段内数组"""
+        directory = os.path.join(self.root, name)
+        with open(os.path.join(directory, "segment.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {key: np.load(os.path.join(directory, f"{key}.npy"), mmap_mode="r") for key in keys}
+        return arrays, meta
+
+    def commit(self, manifest: Dict[str, Any]):
+        """原子替换清单，这是新段集合生效的唯一切换点"""
+        path = os.path.join(self.root, MANIFEST)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def remove(self, names: List[str]):
+        """删除已被合并替换的段目录（清单已不再引用）"""
+        for name in names:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def remove_unreferenced(self, live: List[str], include_temp: bool = False):
+        """删除清单未引用的段目录；仍被mmap占用（Windows）时跳过，下次启动再清理"""
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path) or name in live:
+                continue
+            if name.startswith(SEGMENT_PREFIX) or (include_temp and name.startswith(f".{SEGMENT_PREFIX}")):
+                shutil.rmtree(path, ignore_errors=True)
+
+class Segment:
+    """只读磁盘段（mmap）：片段id、打包文本和本段持有的文档条目（一个文档的片段不会跨段）；
+    alive标记仍有效的片段。id_order为片段id的升序行号，行序本身已按id升序时为None"""
+
+    def __init__(self, name: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.name = name
+        self.chunk_ids = arrays["chunk_ids"]
+        self.id_order: Optional[np.ndarray] = arrays.get("id_order")
+        self.text_offsets = arrays["text_offsets"]
+        self.texts = arrays["texts"]
+        self.documents: Dict[str, Dict[str, Any]] = meta["documents"]
+        self.alive = np.ones(len(self.chunk_ids), dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def rows(self, chunk_ids: np.ndarray) -> np.ndarray:
+        """段内存在的片段id对应的行号"""
+        if not len(self) or not len(chunk_ids):
+            return np.zeros(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.chunk_ids, chunk_ids, sorter=self.id_order), len(self) - 1)
+        rows = positions if self.id_order is None else np.asarray(self.id_order)[positions]
+        return rows[np.asarray(self.chunk_ids)[rows] == chunk_ids]
+
+    def text(self, row: int) -> str:
+        return text_at(self.text_offsets, self.texts, row)
+
+class DeltaSegment:
+    """内存增量段：片段id从first起连续分配，刷盘时整体写成一个新段"""
+
+    def __init__(self, first: int):
+        self.first = first
+        self.texts: List[str] = []
+        self.alive: List[bool] = []
+        self.doc_ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def text(self, row: int) -> str:
+        return self.texts[row]
+
+    def chunk_id_array(self) -> np.ndarray:
+        return np.arange(self.first, self.first + len(self), dtype=np.int64)
+
+    def owned_documents(self, documents: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """片段位于本增量段的文档条目（没有片段的文档不可检索，不写盘）"""
+        return {
+            doc_id: documents[doc_id] for doc_id in self.doc_ids
+            if doc_id in documents and documents[doc_id]["chunk_ids"]
+            and documents[doc_id]["chunk_ids"][0] >= self.first
+        }
+
+class SegmentedIndex(ABC):
+    """分段索引的公共部分
+
+    新增片段先进入内存增量段，达到阈值时写成一个新的不可变磁盘段（mmap加载），写入量只与增量成正比；
+    后台线程按分层策略合并相邻段并清除已删除片段，新段写完后原子替换清单生效。
+    片段id全局递增且永不重编号，合并不影响正在进行的写入。子类提供段的打开、增量段和合并实现。
+    """
+
+    label = "index"
+
+    def __init__(self, index_dir: str, flush_chunks: int, merge_factor: int):
+        self.index_dir = index_dir
+        self.flush_chunks = flush_chunks
+        self.merge_factor = merge_factor
+        self.store = SegmentStore(index_dir)
+        self._lock = threading.RLock()
+        self._merge_thread: Optional[threading.Thread] = None
+
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.chunk_docs: Dict[int, str] = {}
+        # Dead chunk ids still physically present in a segment (dropped by the next merge)
+        self.deleted: set = set()
+        self._segments: List[Segment] = []
+        self._next_chunk_id = 0
+        self._delta = self._new_delta(0)
+        self._live_chunks = 0
+        self._dirty = False
+        # Deletions as of the last flush; merges commit against it so unflushed changes never reach the manifest
+        self._committed_deleted: set = set()
+
+    @abstractmethod
+    def _open(self, name: str) -> Segment:
+        """打开（mmap）一个已提交的磁盘段"""
+
+    @abstractmethod
+    def _new_delta(self, first: int) -> DeltaSegment:
+        """创建片段id从first开始的空增量段"""
+
+    @abstractmethod
+    def _build_delta(self) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+        """把当前增量段转为 (数组, 段元数据)；没有需要写入的片段时返回None"""
+
+    @abstractmethod
+    def _merge(self, sources: List[Segment], keeps: List[np.ndarray]) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """合并多个段中保留的行，返回新段的 (数组, 段元数据)"""
+
+    def _manifest_extra(self) -> Dict[str, Any]:
+        return {}
+
+    def _accepts(self, manifest: Dict[str, Any]) -> bool:
+        return True
+
+    def _chunks_removed(self, view: Any, rows: np.ndarray):
+        """片段被标记删除时的回调（子类维护自身的统计量）"""
+
+    def _loaded(self):
+        """清单加载完成后的回调"""
+
+    def _load(self):
+        """按清单加载磁盘段（mmap），清理未被引用的段目录"""
+        try:
+            manifest = self.store.read_manifest()
+            if manifest is None:
+                if os.path.exists(os.path.join(self.index_dir, "meta.json")):
+                    print(f"Warning: {self.label} at {self.index_dir} uses the old layout and is rebuilt as documents are indexed")
+                return
+            if not self._accepts(manifest):
+                return
+            segments = [self._open(name) for name in manifest["segments"]]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: {self.label} at {self.index_dir} is unreadable, starting empty: {e}")
+            return
+
+        self._segments = segments
+        self._next_chunk_id = manifest["next_chunk_id"]
+        self.deleted = set(manifest["deleted"])
+        for segment in segments:
+            self.documents.update(
+                (doc_id, doc) for doc_id, doc in segment.documents.items() if doc["chunk_ids"][0] not in self.deleted
+            )
+        if self.deleted:
+            dead = np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted))
+            for segment in segments:
+                segment.alive[segment.rows(dead)] = False
+        self._live_chunks = sum(int(segment.alive.sum()) for segment in segments)
+        self.chunk_docs = {chunk_id: doc_id for doc_id, doc in self.documents.items() for chunk_id in doc["chunk_ids"]}
+        self._delta = self._new_delta(self._next_chunk_id)
+        self._committed_deleted = set(self.deleted)
+        self._loaded()
+        self.store.remove_unreferenced(manifest["segments"], include_temp=True)
+
+    @property
+    def total_chunks(self) -> int:
+        return self._live_chunks
+
+    def _index_locked(self, doc_id: str, metadata: Optional[Dict[str, Any]], entries: List[tuple]) -> bool:
+        """替换文档并把片段追加到增量段（entries逐条传给增量段的add），返回是否已刷盘"""
+        self._remove_locked(doc_id)
+        first = self._next_chunk_id
+        self._delta.doc_ids.append(doc_id)
+        for entry in entries:
+            self._delta.add(*entry)
+            self.chunk_docs[self._next_chunk_id] = doc_id
+            self._next_chunk_id += 1
+        self._live_chunks += self._next_chunk_id - first
+
+        self.documents[doc_id] = {
+            "metadata": metadata or {},
+            "chunk_ids": list(range(first, self._next_chunk_id)),
+            "indexed_at": time.time()
+        }
+        self._dirty = True
+        if len(self._delta) < self.flush_chunks:
+            return False
+        self._flush_locked()
+        return True
+
+    def remove_document(self, doc_id: str) -> bool:
+        """删除文档（磁盘段中的片段标记为已删除，由后台合并清除）"""
+        with self._lock:
+            return self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str) -> bool:
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return False
+        for chunk_id in document["chunk_ids"]:
+            self.chunk_docs.pop(chunk_id, None)
+
+        ids = np.asarray(document["chunk_ids"], dtype=np.int64)
+        rows = np.asarray([row for row in (ids[ids >= self._delta.first] - self._delta.first).tolist()
+                           if self._delta.alive[row]], dtype=np.int64)
+        if len(rows):
+            for row in rows.tolist():
+                self._delta.alive[row] = False
+            self._live_chunks -= len(rows)
+            self._chunks_removed(self._delta, rows)
+
+        persisted = ids[ids < self._delta.first]
+        for segment in self._segments if len(persisted) else []:
+            rows = segment.rows(persisted)
+            rows = rows[segment.alive[rows]]
+            if len(rows):
+                segment.alive[rows] = False
+                self._live_chunks -= len(rows)
+                self._chunks_removed(segment, rows)
+                self.deleted.update(np.asarray(segment.chunk_ids)[rows].tolist())
+        self._dirty = True
+        return True
+
+    def _manifest(self, deleted: set) -> Dict[str, Any]:
+        return {
+            "version": 2,
+            **self._manifest_extra(),
+            "segments": [segment.name for segment in self._segments],
+            "deleted": sorted(deleted),
+            "next_chunk_id": self._next_chunk_id
+        }
+
+    def _flush_locked(self):
+        """把增量段写成新段并提交清单（写入量与增量成正比，不重写已有段）"""
+        built = self._build_delta() if len(self._delta) else None
+        if built is not None:
+            self._segments.append(self._open(self.store.write_segment(*built)))
+        self._delta = self._new_delta(self._next_chunk_id)
+        self._committed_deleted = set(self.deleted)
+        self.store.commit(self._manifest(self._committed_deleted))
+        self._dirty = False
+
+    def _plan_locked(self) -> Optional[Tuple[int, int]]:
+        live = [int(segment.alive.sum()) for segment in self._segments]
+        dead = [len(segment) - count for segment, count in zip(self._segments, live)]
+        return plan_merge(live, dead, self.flush_chunks, self.merge_factor)
+
+    def _schedule_merge(self):
+        """需要合并时启动后台合并线程（同一时间只有一个）"""
+        with self._lock:
+            if self._merge_thread is not None and self._merge_thread.is_alive():
+                return
+            if self._plan_locked() is None:
+                return
+            self._merge_thread = threading.Thread(target=self._merge_loop, name=f"{self.label}-merge", daemon=True)
+            self._merge_thread.start()
+
+    def _merge_loop(self):
+        """合并在锁外读取不可变段并写新段，只在切换清单时短暂持锁"""
+        while True:
+            with self._lock:
+                plan = self._plan_locked()
+                if plan is None:
+                    return
+                sources = self._segments[plan[0]:plan[1]]
+                keeps = [segment.alive.copy() for segment in sources]
+            try:
+                merged = self._open(self.store.write_segment(*self._merge(sources, keeps)))
+            except Exception as e:
+                print(f"Warning: {self.label} merge failed, keeping the current segments: {e}")
+                return
+
+            with self._lock:
+                start = self._segments.index(sources[0])
+                self._segments[start:start + len(sources)] = [merged]
+                dropped = np.concatenate([np.asarray(s.chunk_ids)[~keep] for s, keep in zip(sources, keeps)]).tolist()
+                self.deleted.difference_update(dropped)
+                self._committed_deleted.difference_update(dropped)
+                # Chunks removed while the merge was running
+                if self.deleted:
+                    dead = np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted))
+                    merged.alive[merged.rows(dead)] = False
+                self.store.commit(self._manifest(self._committed_deleted))
+            self.store.remove([segment.name for segment in sources])
+
+    def persist(self):
+        """把增量段刷盘并等待进行中的合并完成（关闭时调用）"""
+        with self._lock:
+            if self._dirty:
+                self._flush_locked()
+        self._schedule_merge()
+        thread = self._merge_thread
+        if thread is not None:
+            thread.join()
+
+    def _segment_stats(self) -> Dict[str, Any]:
+        pending = int(sum(self._delta.alive))
+        return {
+            "documents": len(self.documents),
+            "chunks": self._live_chunks,
+            "persisted_chunks": self._live_chunks - pending,
+            "pending_chunks": pending,
+            "deleted_chunks": len(self.deleted),
+            "segments": len(self._segments),
+            "merging": self._merge_thread is not None and self._merge_thread.is_alive(),
+            "index_dir": self.index_dir
+        }
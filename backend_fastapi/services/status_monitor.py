@@ -0,0 +1,82 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+from services.file_reader import FileReader
+from services.mcp_client import MCPClient
+
+class ServerStatusMonitor:
+    """后台并发探测远程服务器和MCP服务器，缓存最新状态"""
+
+    def __init__(self, file_reader: FileReader, mcp_client: MCPClient, interval: Optional[float] = None):
+        self.file_reader = file_reader
+        self.mcp_client = mcp_client
+        self.interval = interval if interval is not None else float(os.getenv("SERVER_STATUS_INTERVAL", "30"))
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._last_checked: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+
+    async def _timed(self, name: str, probe) -> Dict[str, Any]:
+        """执行单个探测并记录时间戳和延迟"""
+        started = time.perf_counter()
+        try:
+            result = await probe
+        except Exception as e:
+            result = {"status": "offline", "server": name, "error": str(e)}
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        result["checked_at"] = datetime.now(timezone.utc).isoformat()
+        return result
+
+    async def refresh(self) -> Dict[str, Any]:
+        """并发探测所有服务器并更新缓存"""
+        async with self._refresh_lock:
+            probes = {
+                name: self.file_reader.check_server_status(name)
+                for name in self.file_reader.remote_servers
+            }
+            probes["mcp_server"] = self.mcp_client.health_check()
+
+            results = await asyncio.gather(*(self._timed(name, probe) for name, probe in probes.items()))
+            self._status = dict(zip(probes.keys(), results))
+            self._last_checked = datetime.now(timezone.utc).isoformat()
+            return self.get_status()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Warning: Server status probe failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """启动后台探测任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台探测任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_status(self) -> Dict[str, Any]:
+        """返回缓存的最新状态"""
+        return {
+            "servers": self._status,
+            "timestamp": self._last_checked,
+            "interval": self.interval
+        }
+
+    async def get_or_refresh(self) -> Dict[str, Any]:
+        """缓存为空时（首次探测尚未完成）同步刷新一次"""
+        if self._last_checked is None:
+            return await self.refresh()
+        return self.get_status()
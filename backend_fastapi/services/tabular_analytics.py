@@ -0,0 +1,488 @@
+import asyncio
+import csv
+import io
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from services.extraction_cache import ExtractionCache
+from services.local_extractor import _decode
+
+# Bump when parsing rules change so stale column caches are ignored
+PARSER_VERSION = "1"
+
+AGGREGATIONS = ("sum", "mean", "count", "min", "max")
+FREQUENCIES = ("day", "week", "month", "quarter", "year")
+_AGG_LABELS = {"sum": "合计", "mean": "平均", "count": "计数", "min": "最小值", "max": "最大值"}
+_FREQ_LABELS = {"day": "日", "week": "周", "month": "月", "quarter": "季度", "year": "年"}
+_DATE_PATTERN = re.compile(r"^\d{4}[-/.]\d{1,2}([-/.]\d{1,2})?([ T].*)?$")
+
+class TableError(ValueError):
+    """表格无法解析或分析参数无效"""
+
+class Table:
+    """列式表格：数值列为float64（缺失为NaN），日期列为datetime64[D]，其余为字符串"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], kinds: Dict[str, str], sha256: str):
+        self.columns = columns
+        self.kinds = kinds
+        self.sha256 = sha256
+        self.rows = len(next(iter(columns.values()))) if columns else 0
+
+    def column(self, name: str, kind: Optional[str] = None) -> np.ndarray:
+        if name not in self.columns:
+            raise TableError(f"列不存在: {name}（可用列：{', '.join(self.columns)}）")
+        if kind and self.kinds[name] != kind:
+            raise TableError(f"列 {name} 不是{'数值' if kind == 'number' else '日期'}列")
+        return self.columns[name]
+
+def _to_number(values: np.ndarray) -> Optional[np.ndarray]:
+    """整列转为float64；非空值中有无法解析的则返回None"""
+    cleaned = np.char.replace(np.char.replace(values, ",", ""), "%", "")
+    cleaned = np.where(cleaned == "", "nan", cleaned)
+    try:
+        return cleaned.astype(np.float64)
+    except ValueError:
+        return None
+
+def _to_date(values: np.ndarray) -> Optional[np.ndarray]:
+    present = values[values != ""]
+    if not len(present) or not all(_DATE_PATTERN.match(v) for v in present[:50]):
+        return None
+    normalized = np.char.replace(np.char.replace(values, "/", "-"), ".", "-")
+    # Drop any time-of-day part and zero-pad month/day so numpy can parse it
+    parts = [re.split(r"[ T]", v)[0].split("-") if v else None for v in normalized]
+    iso = ["NaT" if p is None else "-".join([p[0]] + [x.zfill(2) for x in p[1:]]) for p in parts]
+    try:
+        return np.array(iso, dtype="datetime64[D]")
+    except ValueError:
+        return None
+
+def _build_columns(header: List[Any], rows: List[List[Any]]) -> Tuple[Dict[str, np.ndarray], Dict[str, str]]:
+    """按列推断类型并转换为NumPy数组"""
+    names: List[str] = []
+    for index, name in enumerate(header):
+        name = str(name).strip() or f"列{index + 1}"
+        while name in names:
+            name += "_"
+        names.append(name)
+
+    width = len(names)
+    padded = [list(row[:width]) + [""] * (width - len(row)) for row in rows if any(str(v).strip() for v in row)]
+    grid = np.array(padded, dtype=str).reshape(len(padded), width) if padded else np.empty((0, width), dtype=str)
+    grid = np.char.strip(grid)
+
+    columns: Dict[str, np.ndarray] = {}
+    kinds: Dict[str, str] = {}
+    for index, name in enumerate(names):
+        values = grid[:, index]
+        number = _to_number(values) if len(values) else None
+        if number is not None and not np.all(np.isnan(number)):
+            columns[name], kinds[name] = number, "number"
+            continue
+        dates = _to_date(values)
+        if dates is not None:
+            columns[name], kinds[name] = dates, "datetime"
+            continue
+        columns[name], kinds[name] = values, "text"
+    return columns, kinds
+
+def _parse_csv(path: str) -> Tuple[List[Any], List[List[Any]]]:
+    with open(path, "rb") as f:
+        text = _decode(f.read())
+    delimiter = "\t" if path.lower().endswith(".tsv") else ","
+    if delimiter == ",":
+        try:
+            delimiter = csv.Sniffer().sniff(text[:4096], delimiters=",;\t|").delimiter
+        except csv.Error:
+            pass
+    rows = list(csv.reader(io.StringIO(text), delimiter=delimiter))
+    if not rows:
+        raise TableError("表格为空")
+    return rows[0], rows[1:]
+
+def _parse_xlsx(path: str, sheet: Optional[str]) -> Tuple[List[Any], List[List[Any]]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        if sheet is not None and sheet not in workbook.sheetnames:
+            raise TableError(f"工作表不存在: {sheet}")
+        worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        rows = [
+            ["" if v is None else (v.isoformat()[:10] if isinstance(v, date) else v) for v in row]
+            for row in worksheet.iter_rows(values_only=True)
+        ]
+    finally:
+        workbook.close()
+    if not rows:
+        raise TableError("表格为空")
+    return rows[0], rows[1:]
+
+def _group(keys: np.ndarray, values: Optional[np.ndarray], agg: str) -> Tuple[np.ndarray, np.ndarray]:
+    """按键分组聚合（np.unique + bincount，忽略NaN）"""
+    if agg not in AGGREGATIONS:
+        raise TableError(f"不支持的聚合方式: {agg}")
+    labels, inverse = np.unique(keys, return_inverse=True)
+    if agg == "count" or values is None:
+        return labels, np.bincount(inverse, minlength=len(labels)).astype(np.float64)
+
+    valid = ~np.isnan(values)
+    counts = np.bincount(inverse[valid], minlength=len(labels))
+    if agg in ("sum", "mean"):
+        sums = np.bincount(inverse[valid], weights=values[valid], minlength=len(labels))
+        if agg == "sum":
+            return labels, sums
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return labels, np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    result = np.full(len(labels), np.inf if agg == "min" else -np.inf)
+    (np.minimum if agg == "min" else np.maximum).at(result, inverse[valid], values[valid])
+    return labels, np.where(counts > 0, result, np.nan)
+
+def growth_rates(values: np.ndarray) -> np.ndarray:
+    """环比增长率（%）；首期及上期为0或缺失时为NaN"""
+    values = np.asarray(values, dtype=np.float64)
+    rates = np.full(len(values), np.nan)
+    if len(values) > 1:
+        previous = values[:-1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rates[1:] = np.where(previous != 0, (values[1:] - previous) / np.abs(previous) * 100, np.nan)
+    return rates
+
+def top_n(labels: np.ndarray, values: np.ndarray, n: int, ascending: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """取前N项（argpartition后只对N项排序），NaN排在最后"""
+    keyed = np.where(np.isnan(values), np.inf, values if ascending else -values)
+    if n < len(keyed):
+        picked = np.argpartition(keyed, n)[:n]
+    else:
+        picked = np.arange(len(keyed))
+    picked = picked[np.argsort(keyed[picked], kind="stable")]
+    return labels[picked], values[picked]
+
+def _bucket(dates: np.ndarray, freq: str) -> Tuple[np.ndarray, Callable[[np.datetime64], str]]:
+    """日期分桶，返回可排序的桶键和对应标签"""
+    if freq not in FREQUENCIES:
+        raise TableError(f"不支持的时间粒度: {freq}")
+    if freq == "day":
+        keys = dates
+    elif freq == "week":
+        # Weeks start on Monday; 1970-01-01 was a Thursday
+        keys = dates - ((dates.astype(np.int64) + 3) % 7).astype("timedelta64[D]")
+    elif freq == "quarter":
+        months = dates.astype("datetime64[M]").astype(np.int64)
+        keys = (months - months % 3).astype("datetime64[M]")
+    else:
+        keys = dates.astype("datetime64[M]" if freq == "month" else "datetime64[Y]")
+
+    def label(key: np.datetime64) -> str:
+        text = str(key)
+        if freq == "quarter":
+            return f"{text[:4]}Q{(int(text[5:7]) - 1) // 3 + 1}"
+        return text
+
+    return keys, label
+
+def _period_range(first: np.datetime64, last: np.datetime64, freq: str) -> np.ndarray:
+    """从首个到末个桶键的完整周期序列（与 _bucket 的键同单位）"""
+    if freq == "week":
+        return np.arange(first, last + np.timedelta64(1, "D"), np.timedelta64(7, "D"))
+    if freq == "quarter":
+        return np.arange(first, last + np.timedelta64(1, "M"), np.timedelta64(3, "M"))
+    return np.arange(first, last + 1)
+
+def _fill_periods(
+    buckets: np.ndarray,
+    aggregated: np.ndarray,
+    freq: str,
+    agg: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """补齐缺失的时间桶，使环比总是与紧邻的上一期比较；合计和计数补0，其余补NaN"""
+    if len(buckets) < 2:
+        return buckets, aggregated
+    periods = _period_range(buckets[0], buckets[-1], freq)
+    filled = np.full(len(periods), 0.0 if agg in ("sum", "count") else np.nan)
+    filled[np.searchsorted(periods, buckets)] = aggregated
+    return periods, filled
+
+def _clean(values: np.ndarray) -> List[Optional[float]]:
+    """转为JSON友好的列表（NaN -> None）"""
+    return [None if np.isnan(v) else round(float(v), 4) for v in values]
+
+class TabularAnalytics:
+    """上传表格（CSV/TSV/XLSX）的向量化分析：解析后的列按文件哈希缓存到磁盘（.npz），
+    分组聚合、时间分桶、增长率和TopN均基于NumPy数组计算"""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or os.getenv("TABLE_CACHE_DIR", "cache/tables")
+        self.memory_entries = int(os.getenv("TABLE_MEMORY_ENTRIES", "16"))
+        self.cache_max_bytes = int(os.getenv("TABLE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+        self.max_rows = int(os.getenv("TABLE_MAX_ROWS", "2000000"))
+        self.data_dirs = [
+            os.path.realpath(d.strip())
+            for d in os.getenv("TABLE_DATA_DIRS", "../uploads,temp_uploads").split(",") if d.strip()
+        ]
+        # Keyed by (path, sheet, mtime, size) so a memory hit never re-reads the file
+        self._tables: "OrderedDict[tuple, Table]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Column cache files in LRU order with their sizes
+        self._disk_entries: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "parsed": 0, "parse_ms": 0.0, "evictions": 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_disk_index()
+
+    def _load_disk_index(self):
+        """启动时按修改时间重建列缓存的LRU索引"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        """列缓存超出字节预算时淘汰最久未使用的文件（调用方持有锁或处于初始化阶段）"""
+        while self._disk_bytes > self.cache_max_bytes and self._disk_entries:
+            key, size = self._disk_entries.popitem(last=False)
+            self._disk_bytes -= size
+            self._stats["evictions"] += 1
+            try:
+                os.remove(self._cache_path(key))
+            except OSError:
+                pass
+
+    def resolve(self, file_path: str) -> str:
+        """把文件路径解析到允许的数据目录内（防止读取任意文件）"""
+        for directory in self.data_dirs:
+            candidate = os.path.realpath(os.path.join(directory, file_path))
+            if candidate.startswith(directory + os.sep) and os.path.isfile(candidate):
+                return candidate
+        raise TableError(f"文件不存在或不在允许的数据目录中: {file_path}")
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _load_cached(self, key: str, sha256: str) -> Optional[Table]:
+        with self._lock:
+            if key not in self._disk_entries:
+                return None
+        try:
+            with np.load(self._cache_path(key), allow_pickle=False) as data:
+                names = list(data["__names__"])
+                kinds = list(data["__kinds__"])
+                columns = {name: data[f"c{i}"] for i, name in enumerate(names)}
+            os.utime(self._cache_path(key), None)
+        except (OSError, KeyError, ValueError):
+            return None
+        with self._lock:
+            if key in self._disk_entries:
+                self._disk_entries.move_to_end(key)
+        return Table(columns, dict(zip(names, kinds)), sha256)
+
+    def _save_cached(self, key: str, table: Table):
+        names = list(table.columns)
+        arrays = {f"c{i}": table.columns[name] for i, name in enumerate(names)}
+        temp_path = f"{self._cache_path(key)}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f,
+                __names__=np.array(names, dtype=str),
+                __kinds__=np.array([table.kinds[n] for n in names], dtype=str),
+                **arrays
+            )
+        os.replace(temp_path, self._cache_path(key))
+
+        size = os.path.getsize(self._cache_path(key))
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+            self._evict_disk()
+
+    def load(self, path: str, sheet: Optional[str] = None) -> Table:
+        """加载表格：内存（按路径、修改时间和大小命中，不读文件） -> 磁盘列缓存（按内容哈希） -> 解析原文件"""
+        stat = os.stat(path)
+        memory_key = (os.path.realpath(path), sheet or "", stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            table = self._tables.get(memory_key)
+            if table is not None:
+                self._tables.move_to_end(memory_key)
+                self._stats["memory_hits"] += 1
+                return table
+
+        sha256 = ExtractionCache.hash_file(path)
+        key = ExtractionCache.make_key(f"sha256:{sha256}", f"table:{sheet or ''}:v{PARSER_VERSION}")
+        table = self._load_cached(key, sha256)
+        if table is not None:
+            self._stats["disk_hits"] += 1
+        else:
+            started = time.perf_counter()
+            if path.lower().endswith((".xlsx", ".xlsm")):
+                header, rows = _parse_xlsx(path, sheet)
+            elif path.lower().endswith((".csv", ".tsv", ".txt")):
+                header, rows = _parse_csv(path)
+            else:
+                raise TableError("仅支持CSV/TSV/XLSX表格")
+            if len(rows) > self.max_rows:
+                raise TableError(f"表格行数超过上限 {self.max_rows}")
+            columns, kinds = _build_columns(header, rows)
+            table = Table(columns, kinds, sha256)
+            self._save_cached(key, table)
+            self._stats["parsed"] += 1
+            self._stats["parse_ms"] += (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self._tables[memory_key] = table
+            while len(self._tables) > self.memory_entries:
+                self._tables.popitem(last=False)
+        return table
+
+    def _aggregate(
+        self,
+        table: Table,
+        value: Optional[str],
+        agg: str,
+        group_by: Optional[str],
+        time_column: Optional[str],
+        freq: str,
+        limit: Optional[int],
+        ascending: bool
+    ) -> Dict[str, Any]:
+        values = table.column(value, "number") if value else None
+        if agg != "count" and values is None:
+            raise TableError(f"聚合方式 {agg} 需要指定数值列")
+
+        if time_column:
+            dates = table.column(time_column, "datetime")
+            present = ~np.isnat(dates)
+            keys, label = _bucket(dates[present], freq)
+            buckets, aggregated = _group(keys, values[present] if values is not None else None, agg)
+            buckets, aggregated = _fill_periods(buckets, aggregated, freq, agg)
+            categories = [label(b) for b in buckets]
+            result = {
+                "title": f"{value or '记录数'}按{_FREQ_LABELS[freq]}{_AGG_LABELS[agg]}",
+                "categories": categories,
+                "values": _clean(aggregated),
+                "growth_rates": _clean(growth_rates(aggregated))
+            }
+            if limit:
+                # Most recent periods
+                result["categories"] = result["categories"][-limit:]
+                result["values"] = result["values"][-limit:]
+                result["growth_rates"] = result["growth_rates"][-limit:]
+            return result
+
+        if not group_by:
+            raise TableError("需要指定 group_by 或 time_column")
+        keys = table.column(group_by).astype(str)
+        labels, aggregated = _group(keys, values, agg)
+        # Shares are of the grand total, so they stay meaningful after the top-N cut
+        total = np.nansum(aggregated)
+        # Group-by results are ranked, largest first unless ascending
+        labels, aggregated = top_n(labels, aggregated, limit or len(labels), ascending)
+        share = aggregated / total * 100 if agg in ("sum", "count") and total else None
+        result = {
+            "title": f"{value or '记录数'}按{group_by}{_AGG_LABELS[agg]}",
+            "categories": [str(label) for label in labels],
+            "values": _clean(aggregated)
+        }
+        if share is not None:
+            result["shares"] = _clean(share)
+        return result
+
+    def analyze_sync(
+        self,
+        path: str,
+        value: Optional[str] = None,
+        agg: str = "sum",
+        group_by: Optional[str] = None,
+        time_column: Optional[str] = None,
+        freq: str = "month",
+        limit: Optional[int] = None,
+        ascending: bool = False,
+        sheet: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """计算分组或时间序列聚合，结果可直接交给 ChartGenerator.generate_from_data"""
+        started = time.perf_counter()
+        table = self.load(path, sheet)
+        result = self._aggregate(table, value, agg, group_by, time_column, freq, limit, ascending)
+        result["series_name"] = value or "记录数"
+        result["metadata"] = {
+            "rows": table.rows,
+            "file_sha256": table.sha256,
+            "compute_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        return result
+
+    def profile_sync(self, path: str, sheet: Optional[str] = None, top: int = 5) -> Dict[str, Any]:
+        """按列汇总：数值列的合计/均值/极值，文本列的高频取值，日期列的范围"""
+        table = self.load(path, sheet)
+        columns: Dict[str, Any] = {}
+        for name, values in table.columns.items():
+            kind = table.kinds[name]
+            if kind == "number":
+                valid = values[~np.isnan(values)]
+                columns[name] = {
+                    "type": "number",
+                    "count": int(len(valid)),
+                    **({
+                        "sum": round(float(valid.sum()), 4),
+                        "mean": round(float(valid.mean()), 4),
+                        "min": round(float(valid.min()), 4),
+                        "max": round(float(valid.max()), 4)
+                    } if len(valid) else {})
+                }
+            elif kind == "datetime":
+                valid = values[~np.isnat(values)]
+                columns[name] = {
+                    "type": "datetime",
+                    "count": int(len(valid)),
+                    **({"min": str(valid.min()), "max": str(valid.max())} if len(valid) else {})
+                }
+            else:
+                labels, counts = np.unique(values[values != ""], return_counts=True)
+                order = np.argsort(-counts, kind="stable")[:top]
+                columns[name] = {
+                    "type": "text",
+                    "distinct": int(len(labels)),
+                    "top_values": {str(labels[i]): int(counts[i]) for i in order}
+                }
+        return {"rows": table.rows, "file_sha256": table.sha256, "columns": columns}
+
+    async def analyze(self, path: str, **spec: Any) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.analyze_sync, path, **spec)
+
+    async def profile(self, path: str, sheet: Optional[str] = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.profile_sync, path, sheet)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取列缓存命中统计"""
+        return {
+            **self._stats,
+            "parse_ms": round(self._stats["parse_ms"], 2),
+            "memory_tables": len(self._tables),
+            "disk_entries": len(self._disk_entries),
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.cache_max_bytes,
+            "cache_dir": self.cache_dir,
+            "data_dirs": self.data_dirs
+        }
+
+_tabular_analytics: Optional[TabularAnalytics] = None
+
+def get_tabular_analytics() -> TabularAnalytics:
+    """获取进程内共享的表格分析器"""
+    global _tabular_analytics
+    if _tabular_analytics is None:
+        _tabular_analytics = TabularAnalytics()
+    return _tabular_analytics
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import re
+import uuid
+from typing import Dict, Any, List, Optional
+
+import aiofiles
+from fastapi import UploadFile
+
+class UploadTooLargeError(Exception):
+    """上传文件超过大小限制"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"文件大小超过限制（最大 {max_bytes} 字节）")
+
+def server_file_dirs() -> List[str]:
+    """服务器自己写入文件的目录（上传临时目录和远程下载目录）"""
+    dirs = os.getenv("LOCAL_FILE_DIRS") or ",".join([
+        os.getenv("UPLOAD_DIR", "temp_uploads"),
+        os.getenv("REMOTE_DOWNLOAD_DIR", "temp_downloads")
+    ])
+    return [os.path.realpath(d.strip()) for d in dirs.split(",") if d.strip()]
+
+def resolve_server_file(path: str) -> Optional[str]:
+    """路径指向服务器自己写入的文件时返回真实路径，否则返回None（调用方应视为远程引用，不得按本地路径读取）"""
+    real = os.path.realpath(path)
+    if any(real.startswith(directory + os.sep) for directory in server_file_dirs()) and os.path.isfile(real):
+        return real
+    return None
+
+def _safe_filename(filename: Optional[str]) -> str:
+    """去除路径和特殊字符，避免目录穿越"""
+    name = os.path.basename(filename or "upload")
+    name = re.sub(r'[<>:"/\\|?*\s]', '_', name)
+    return name[-100:] or "upload"
+
+async def save_upload(
+    file: UploadFile,
+    upload_dir: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    chunk_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """分块流式保存上传文件，同时计算SHA-256，返回路径、大小和哈希"""
+    upload_dir = upload_dir or os.getenv("UPLOAD_DIR", "temp_uploads")
+    max_bytes = max_bytes if max_bytes is not None else int(os.getenv("UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+    chunk_size = chunk_size or int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+    os.makedirs(upload_dir, exist_ok=True)
+    # Unique prefix so concurrent uploads of the same filename never collide
+    file_path = os.path.join(upload_dir, f"{uuid.uuid4().hex}_{_safe_filename(file.filename)}")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(file_path, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    return {
+        "path": file_path,
+        "size": size,
+        "sha256": digest.hexdigest()
+    }
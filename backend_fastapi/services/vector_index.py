@@ -0,0 +1,425 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from services.search_index import chunk_text, tokenize, _matches
+from services.segment_store import (
+    DeltaSegment, Segment, SegmentedIndex, concat_texts, pack_texts, select_texts, take_texts
+)
+
+class HashingEmbedder:
+    """确定性的本地嵌入：对分词结果做带符号特征哈希，可离线使用和测试"""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+        # Unrelated texts still share a few hashed features; matches on a topic start around 0.2
+        self.default_threshold = 0.15
+
+    def _slot(self, token: str) -> tuple:
+        digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.dim, 1.0 if value >> 63 else -1.0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts: Dict[str, int] = {}
+            for token in tokenize(text):
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                slot, sign = self._slot(token)
+                vectors[row, slot] += sign * (1.0 + np.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+class OpenAIEmbedder:
+    """OpenAI嵌入模型（通过langchain_openai调用）"""
+
+    def __init__(self, model: str):
+        from langchain_openai import OpenAIEmbeddings
+
+        self._client = OpenAIEmbeddings(model=model)
+        self.name = f"openai-{model}"
+        self.dim: Optional[int] = None
+        self.default_threshold = 0.3
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self._client.embed_documents(texts), dtype=np.float32)
+        self.dim = vectors.shape[1]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+def create_embedder():
+    """按EMBEDDING_BACKEND创建嵌入函数（hashing或openai）"""
+    backend = os.getenv("EMBEDDING_BACKEND", "hashing").lower()
+    if backend == "openai":
+        return OpenAIEmbedder(os.getenv("EMBEDDING_MODEL", "text-embedding-3-small"))
+    return HashingEmbedder(int(os.getenv("EMBEDDING_DIM", "256")))
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _save_array(path: str, array: np.ndarray):
+    temp_path = f"{path}.tmp.npy"
+    np.save(temp_path, array)
+    os.replace(temp_path, path)
+
+def _train_ivf(vectors: np.ndarray, block_rows: int, iterations: int = 10) -> tuple:
+    """球面k-means划分IVF分区，返回 (质心, 每行所属分区)"""
+    rng = np.random.default_rng(0)
+    nlist = max(1, int(np.sqrt(len(vectors))))
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), nlist * 64), replace=False)]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(nlist):
+            members = sample[assignment == cluster]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[cluster] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return centroids, assignment
+
+class _VectorSegment(Segment):
+    """向量段：float16/float32矩阵；大段按IVF分区连续存放（ivf_centroids为空表示全量扫描）"""
+
+    ARRAYS = ["chunk_ids", "id_order", "vectors", "text_offsets", "texts", "ivf_centroids", "ivf_offsets"]
+
+    def __init__(self, name: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        super().__init__(name, arrays, meta)
+        self.vectors = arrays["vectors"]
+        self.centroids = np.asarray(arrays["ivf_centroids"], dtype=np.float32)
+        self.ivf_offsets = np.asarray(arrays["ivf_offsets"])
+
+    def arrays(self) -> tuple:
+        return np.asarray(self.chunk_ids), self.alive
+
+    def score(self, queries: np.ndarray, block_rows: int, nprobe: int) -> np.ndarray:
+        """无IVF时分块矩阵乘法全量扫描，有IVF时只扫描最近的nprobe个分区（未扫描的行为-inf）"""
+        scores = np.full((len(queries), len(self)), -np.inf, dtype=np.float32)
+        if not len(self.centroids):
+            for start in range(0, len(self), block_rows):
+                block = np.asarray(self.vectors[start:start + block_rows], dtype=np.float32)
+                scores[:, start:start + len(block)] = queries @ block.T
+            return scores
+
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        for row, lists in enumerate(probes):
+            for cluster in lists:
+                start, end = int(self.ivf_offsets[cluster]), int(self.ivf_offsets[cluster + 1])
+                if end > start:
+                    block = np.asarray(self.vectors[start:end], dtype=np.float32)
+                    scores[row, start:end] = block @ queries[row]
+        return scores
+
+class _VectorDelta(DeltaSegment):
+    """向量增量段"""
+
+    def __init__(self, first: int, dtype):
+        super().__init__(first)
+        self.dtype = dtype
+        self.vectors: List[np.ndarray] = []
+
+    def add(self, vector: np.ndarray, text: str):
+        self.vectors.append(vector)
+        self.texts.append(text)
+        self.alive.append(True)
+
+    def arrays(self) -> tuple:
+        return self.chunk_id_array(), np.asarray(self.alive, dtype=bool)
+
+    def score(self, queries: np.ndarray, block_rows: int, nprobe: int) -> np.ndarray:
+        return queries @ np.vstack(self.vectors).T
+
+    def to_segment(self, documents: Dict[str, Dict[str, Any]]) -> Optional[tuple]:
+        """把仍有效的片段及其文档条目编成段，全部已删除时返回None"""
+        chunk_ids, keep = self.arrays()
+        if not keep.any():
+            return None
+        vectors = np.vstack(self.vectors)[keep].astype(self.dtype)
+        offsets, texts = pack_texts([text for text, alive in zip(self.texts, self.alive) if alive])
+        arrays = {
+            "chunk_ids": chunk_ids[keep],
+            "id_order": np.arange(int(keep.sum()), dtype=np.int64),
+            "vectors": vectors,
+            "text_offsets": offsets,
+            "texts": texts,
+            "ivf_centroids": np.zeros((0, vectors.shape[1]), dtype=np.float32),
+            "ivf_offsets": np.zeros(1, dtype=np.int64)
+        }
+        return arrays, {"documents": self.owned_documents(documents)}
+
+class VectorIndex(SegmentedIndex):
+    """本地向量索引
+
+    片段向量按内容哈希缓存，只嵌入一次；向量段以float16/float32矩阵存储并mmap加载，
+    查询按块做矩阵乘法求top-k；合并后片段数超过阈值的段在后台训练IVF分区，只扫描最近的若干分区。
+    """
+
+    label = "vector index"
+
+    def __init__(self, index_dir: Optional[str] = None, embedder=None):
+        self.embedder = embedder or create_embedder()
+        self.chunk_size = int(os.getenv("SEARCH_CHUNK_SIZE", "500"))
+        self.chunk_overlap = int(os.getenv("SEARCH_CHUNK_OVERLAP", "50"))
+        self.dtype = np.float16 if os.getenv("VECTOR_DTYPE", "float16") == "float16" else np.float32
+        self.block_rows = int(os.getenv("VECTOR_SEARCH_BLOCK_ROWS", "65536"))
+        self.ivf_min_chunks = int(os.getenv("VECTOR_IVF_MIN_CHUNKS", "1000000"))
+        self.ivf_nprobe = int(os.getenv("VECTOR_IVF_NPROBE", "8"))
+        self.embedding_cache_size = int(os.getenv("VECTOR_EMBEDDING_CACHE_SIZE", "200000"))
+        super().__init__(
+            index_dir or os.getenv("VECTOR_INDEX_DIR", "cache/vector_index"),
+            int(os.getenv("SEARCH_INDEX_FLUSH_CHUNKS", "1000")),
+            int(os.getenv("SEARCH_INDEX_MERGE_FACTOR", "4"))
+        )
+
+        # Content hash -> embedding (memory LRU in front of the persisted cache)
+        self._embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._disk_cache_rows: Dict[str, int] = {}
+        self._disk_cache: Optional[np.ndarray] = None
+        self._stats = {"embedded": 0, "embedding_cache_hits": 0, "queries": 0}
+
+        self._load_embedding_cache()
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _open(self, name: str) -> _VectorSegment:
+        arrays, meta = self.store.open_segment(name, _VectorSegment.ARRAYS)
+        return _VectorSegment(name, arrays, meta)
+
+    def _new_delta(self, first: int) -> _VectorDelta:
+        return _VectorDelta(first, self.dtype)
+
+    def _build_delta(self) -> Optional[tuple]:
+        return self._delta.to_segment(self.documents)
+
+    def _manifest_extra(self) -> Dict[str, Any]:
+        return {"model": self.embedder.name}
+
+    def _accepts(self, manifest: Dict[str, Any]) -> bool:
+        if manifest.get("model") != self.embedder.name:
+            print(f"Warning: vector index was built with {manifest.get('model')}, rebuilding for {self.embedder.name}")
+            return False
+        return True
+
+    def _merge(self, sources: List[_VectorSegment], keeps: List[np.ndarray]) -> tuple:
+        """合并相邻段并去掉已删除片段；合并结果足够大时训练IVF并按分区重排行"""
+        documents: Dict[str, Dict[str, Any]] = {}
+        for segment, keep in zip(sources, keeps):
+            kept = set(np.asarray(segment.chunk_ids)[keep].tolist())
+            documents.update((doc_id, doc) for doc_id, doc in segment.documents.items() if doc["chunk_ids"][0] in kept)
+        chunk_ids = np.concatenate([np.asarray(segment.chunk_ids)[keep] for segment, keep in zip(sources, keeps)])
+        vectors = np.concatenate([np.asarray(segment.vectors)[keep] for segment, keep in zip(sources, keeps)])
+        vectors = vectors.astype(self.dtype, copy=False)
+        offsets, texts = concat_texts([
+            select_texts(segment.text_offsets, segment.texts, keep) for segment, keep in zip(sources, keeps)
+        ])
+
+        centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        ivf_offsets = np.zeros(1, dtype=np.int64)
+        if len(chunk_ids) >= self.ivf_min_chunks:
+            centroids, assignment = _train_ivf(vectors, self.block_rows)
+            order = np.argsort(assignment, kind="stable")
+            chunk_ids, vectors = chunk_ids[order], vectors[order]
+            offsets, texts = take_texts(offsets, texts, order)
+            ivf_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+            ivf_offsets[1:] = np.cumsum(np.bincount(assignment, minlength=len(centroids)))
+
+        arrays = {
+            "chunk_ids": chunk_ids,
+            "id_order": np.argsort(chunk_ids, kind="stable"),
+            "vectors": vectors,
+            "text_offsets": offsets,
+            "texts": texts,
+            "ivf_centroids": centroids.astype(np.float32),
+            "ivf_offsets": ivf_offsets
+        }
+        return arrays, {"documents": documents}
+
+    def _load_embedding_cache(self):
+        """加载持久化的嵌入缓存（嵌入模型不一致时丢弃）"""
+        cache_meta = self._path("embedding_cache.json")
+        if not os.path.exists(cache_meta):
+            return
+        try:
+            with open(cache_meta, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("model") == self.embedder.name:
+                self._disk_cache = np.load(self._path("embedding_cache.npy"), mmap_mode="r")
+                self._disk_cache_rows = {key: row for row, key in enumerate(meta["keys"])}
+        except (OSError, ValueError) as e:
+            print(f"Warning: embedding cache at {self.index_dir} is unreadable: {e}")
+
+    @property
+    def default_threshold(self) -> float:
+        """当前嵌入模型的默认相似度阈值"""
+        return self.embedder.default_threshold
+
+    def _cached_embedding(self, key: str) -> Optional[np.ndarray]:
+        vector = self._embedding_cache.get(key)
+        if vector is not None:
+            self._embedding_cache.move_to_end(key)
+            return vector
+        row = self._disk_cache_rows.get(key)
+        if row is not None and self._disk_cache is not None:
+            return np.asarray(self._disk_cache[row], dtype=np.float32)
+        return None
+
+    def embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """嵌入片段，命中内容哈希缓存的片段不再重复计算"""
+        keys = [_content_hash(chunk) for chunk in chunks]
+        with self._lock:
+            vectors: List[Optional[np.ndarray]] = [self._cached_embedding(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        # The embedding call may hit the network, so it runs outside the lock
+        embedded = self.embedder.embed([chunks[i] for i in missing]) if missing else []
+        with self._lock:
+            self._stats["embedding_cache_hits"] += len(chunks) - len(missing)
+            self._stats["embedded"] += len(missing)
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                self._embedding_cache[keys[i]] = vector
+            while len(self._embedding_cache) > self.embedding_cache_size:
+                self._embedding_cache.popitem(last=False)
+        return np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def add_document(self, doc_id: str, content: str, metadata: Optional[Dict[str, Any]] = None) -> int:
+        """增量索引文档；同一doc_id重复添加时替换旧内容，返回片段数"""
+        chunks = chunk_text(content or "", self.chunk_size, self.chunk_overlap)
+        vectors = self.embed_chunks(chunks)
+        with self._lock:
+            flushed = self._index_locked(doc_id, metadata, list(zip(vectors, chunks)))
+        if flushed:
+            self._schedule_merge()
+        return len(chunks)
+
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 20,
+        similarity_threshold: Optional[float] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """批量查询：每个段一次矩阵乘法得到所有查询的余弦相似度；阈值缺省时使用嵌入模型的默认值"""
+        if not queries:
+            return []
+        if similarity_threshold is None:
+            similarity_threshold = self.default_threshold
+        query_vectors = self.embedder.embed(queries)
+        with self._lock:
+            self._stats["queries"] += len(queries)
+            if self._live_chunks == 0:
+                return [[] for _ in queries]
+
+            views = self._segments + ([self._delta] if len(self._delta) else [])
+            allowed_ids = None
+            if filters:
+                allowed_ids = np.asarray([
+                    chunk_id for doc in self.documents.values() if _matches(doc["metadata"], filters)
+                    for chunk_id in doc["chunk_ids"]
+                ], dtype=np.int64)
+
+            ranked: List[List[tuple]] = [[] for _ in queries]
+            for index, view in enumerate(views):
+                chunk_ids, allowed = view.arrays()
+                if allowed_ids is not None:
+                    allowed = allowed & np.isin(chunk_ids, allowed_ids)
+                if not allowed.any():
+                    continue
+                scores = view.score(query_vectors, self.block_rows, self.ivf_nprobe)
+                scores[:, ~allowed] = -np.inf
+                for query, row in enumerate(scores):
+                    candidates = np.flatnonzero(row >= similarity_threshold)
+                    if len(candidates) > top_k:
+                        candidates = candidates[np.argpartition(-row[candidates], top_k - 1)[:top_k]]
+                    ranked[query].extend((-float(row[i]), int(chunk_ids[i]), index, int(i)) for i in candidates)
+
+            results = []
+            for hits in ranked:
+                hits.sort()
+                results.append([
+                    {
+                        "id": f"{self.chunk_docs[chunk_id]}#{chunk_id}",
+                        "doc_id": self.chunk_docs[chunk_id],
+                        "chunk_id": chunk_id,
+                        "similarity": round(-negative_score, 4),
+                        "content": views[index].text(row),
+                        "metadata": self.documents[self.chunk_docs[chunk_id]]["metadata"]
+                    }
+                    for negative_score, chunk_id, index, row in hits[:top_k]
+                ])
+            return results
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 20,
+        similarity_threshold: Optional[float] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """单条查询"""
+        return self.search_batch([query], top_k, similarity_threshold, filters)[0]
+
+    def persist(self):
+        """把增量段刷盘、等待合并完成并写出嵌入缓存（关闭时调用）"""
+        super().persist()
+        with self._lock:
+            self._persist_embedding_cache()
+
+    def _persist_embedding_cache(self):
+        """合并内存与磁盘嵌入缓存并写盘（超出容量时保留最近使用的条目）"""
+        if not self._embedding_cache:
+            return
+        budget = max(0, self.embedding_cache_size - len(self._embedding_cache))
+        keys = [key for key in self._disk_cache_rows if key not in self._embedding_cache]
+        keys = keys[max(0, len(keys) - budget):] if budget else []
+        rows = [np.asarray(self._disk_cache[self._disk_cache_rows[key]], dtype=np.float32) for key in keys]
+        keys += list(self._embedding_cache)
+        rows += list(self._embedding_cache.values())
+
+        self._disk_cache = None
+        _save_array(self._path("embedding_cache.npy"), np.vstack(rows).astype(self.dtype))
+        temp_meta = f"{self._path('embedding_cache.json')}.tmp"
+        with open(temp_meta, "w", encoding="utf-8") as f:
+            json.dump({"model": self.embedder.name, "keys": keys}, f)
+        os.replace(temp_meta, self._path("embedding_cache.json"))
+        self._embedding_cache.clear()
+        self._disk_cache_rows = {}
+        self._load_embedding_cache()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计信息"""
+        with self._lock:
+            return {
+                **self._stats,
+                **self._segment_stats(),
+                "embedding_model": self.embedder.name,
+                "default_threshold": self.default_threshold,
+                "dtype": np.dtype(self.dtype).name,
+                "ivf_lists": sum(len(segment.centroids) for segment in self._segments),
+                "cached_embeddings": len(self._embedding_cache) + len(self._disk_cache_rows)
+            }
+
+_vector_index: Optional[VectorIndex] = None
+
+def get_vector_index() -> VectorIndex:
+    """获取进程内共享的向量索引"""
+    global _vector_index
+    if _vector_index is None:
+        _vector_index = VectorIndex()
+    return _vector_index
@@ -0,0 +1,28 @@
+import asyncio
+
+from services.chat_history import ChatHistoryStore
+
+def test_messages_evicted_from_the_ring_are_summarized(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHAT_HISTORY_RING_SIZE", "5")
+    monkeypatch.setenv("CHAT_CONTEXT_TOKENS", "10")
+    monkeypatch.setenv("CHAT_SUMMARY_MIN_MESSAGES", "2")
+    store = ChatHistoryStore(db_path=str(tmp_path / "chat.db"))
+    summarized = []
+
+    async def summarize(summary, messages):
+        summarized.extend(message["seq"] for message in messages)
+        return f"{summary}|{messages[0]['seq']}-{messages[-1]['seq']}"
+
+    async def scenario():
+        # Twelve messages overflow the five-slot ring before any summary runs
+        for i in range(12):
+            await store.append("s", "user", f"message {i:02d}")
+        window = await store.get_window("s")
+        store.schedule_summary("s", summarize)
+        await store.aclose()
+        return window, await store.get_window("s")
+
+    before, after = asyncio.run(scenario())
+    assert summarized == list(range(1, before["first_seq"]))
+    assert after["summary"] == f"|1-5|6-{before['first_seq'] - 1}"
+    assert store.get_stats()["summaries"] == 2
@@ -0,0 +1,32 @@
+import asyncio
+
+from services.context_store import ContextStore
+
+def test_flush_loop_survives_write_errors(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONTEXT_FLUSH_INTERVAL", "0")
+    monkeypatch.setenv("CONTEXT_FLUSH_RETRY_DELAY", "0.01")
+    store = ContextStore(db_path=str(tmp_path / "context.db"))
+    write_batch = store._write_batch
+    failures = []
+
+    def flaky_write(pending):
+        if not failures:
+            failures.append(True)
+            raise OSError("disk full")
+        write_batch(pending)
+
+    monkeypatch.setattr(store, "_write_batch", flaky_write)
+
+    async def scenario():
+        await store.set("session", "a", {"value": 1})
+        for _ in range(100):
+            if not store._pending and store.get_stats()["flushes"]:
+                break
+            await asyncio.sleep(0.01)
+        assert not store._flush_task.done()
+        await store.close()
+
+    asyncio.run(scenario())
+    stats = store.get_stats()
+    assert stats["flush_errors"] == 1 and stats["last_flush_error"] == "disk full"
+    assert ContextStore(db_path=str(tmp_path / "context.db"))._select("session", "a") is not None
@@ -0,0 +1,91 @@
+import json
+
+import numpy as np
+import pytest
+
+from services.chart_builder import normalize_series, scatter_series
+from services.chart_generator import ChartGenerator
+from services.downsampling import downsample_chart_data, lttb_indices, minmax_indices
+
+def noisy_series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.cumsum(rng.normal(size=n))
+
+@pytest.mark.parametrize("select", [
+    lambda y, t: lttb_indices(np.arange(len(y), dtype=np.float64), y, t),
+    minmax_indices
+], ids=["lttb", "minmax"])
+@pytest.mark.parametrize("threshold", [1, 2, 3, 4, 5, 10, 99, 100, 101])
+def test_selection_stays_within_budget(select, threshold):
+    for n in (threshold + 1, 257, 1000):
+        y = noisy_series(n)
+        y[n // 3] = np.nan
+        keep = select(y, threshold)
+        assert len(keep) <= threshold
+        assert np.all(np.diff(keep) > 0) and keep[0] == 0 and keep[-1] < n
+        if threshold >= 2:
+            assert keep[-1] == n - 1
+
+def test_minmax_keeps_extremes():
+    y = noisy_series(1000)
+    keep = minmax_indices(y, 50)
+    assert int(np.argmax(y)) in keep and int(np.argmin(y)) in keep
+
+def test_line_series_with_duplicate_names_are_kept_apart():
+    categories = list(range(500))
+    data = {"categories": categories, "series": [
+        {"name": "产值", "data": noisy_series(500, 1).tolist()},
+        {"name": "产值", "data": noisy_series(500, 2).tolist()}
+    ]}
+    reduced, sampling = downsample_chart_data(data, "line", 100, "minmax")
+
+    assert sampling["points"] == len(reduced["categories"]) <= 100
+    _, series = normalize_series(reduced)
+    assert [name for name, _ in series] == ["产值", "产值"]
+    assert series[0][1] != series[1][1]
+
+def test_scatter_series_with_duplicate_names_are_kept_apart():
+    rng = np.random.default_rng(3)
+    points = rng.normal(size=(400, 2)).tolist()
+    data = [[x, y] for x, y in points]
+    reduced, sampling = downsample_chart_data({"series": {"a": data}}, "scatter", 50)
+    assert sampling["points"] <= 50
+
+    reduced, sampling = downsample_chart_data(
+        {"series": [{"name": "a", "data": data}, {"name": "a", "data": data[::-1]}]}, "scatter", 60, "minmax"
+    )
+    series = scatter_series(reduced)
+    assert [name for name, _ in series] == ["a", "a"]
+    assert sampling["points"] == sum(len(p) for _, p in series) <= 60
+
+def test_sampling_note_is_skipped_for_non_object_charts():
+    sampling = {"method": "lttb", "points": 10}
+    assert json.loads(ChartGenerator._with_sampling([{"type": "line"}], sampling)) == [{"type": "line"}]
+    assert json.loads(ChartGenerator._with_sampling({}, sampling))["metadata"]["downsampling"] == sampling
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_many_scatter_series_share_the_budget(method):
+    rng = np.random.default_rng(4)
+    data = {"series": [{"name": f"s{i}", "data": rng.normal(size=(1000, 2)).tolist()} for i in range(50)]}
+    reduced, meta = downsample_chart_data(data, "scatter", 100, method)
+
+    assert meta["points"] <= 100
+    # Only as many series as can keep three points each survive
+    assert len(reduced["series"]) == 33 and meta["dropped_series"] == 17
+    assert all(len(s["data"]) >= 3 for s in reduced["series"])
+
+    small = {"series": [{"name": "tiny", "data": [[0, 0], [1, 1]]}, {"name": "big", "data": data["series"][0]["data"]}]}
+    reduced, meta = downsample_chart_data(small, "scatter", 100, method)
+    # The small series keeps everything and its unused share goes to the big one
+    assert [len(s["data"]) for s in reduced["series"]][0] == 2
+    assert 90 <= meta["points"] <= 100 and "dropped_series" not in meta
+
+@pytest.mark.parametrize("method", ["lttb", "minmax"])
+def test_many_line_series_fill_but_do_not_exceed_the_budget(method):
+    data = {"categories": list(range(1000)), "series": [
+        {"name": f"s{i}", "data": noisy_series(1000, i).tolist()} for i in range(50)
+    ]}
+    reduced, meta = downsample_chart_data(data, "line", 100, method)
+
+    assert 90 <= meta["points"] == len(reduced["categories"]) <= 100
+    assert all(len(s["data"]) == meta["points"] for s in reduced["series"])
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from agent.file_analyzer import COMBINE_PROMPT, FileAnalyzer
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("FILE_CHUNK_TOKENS", "50")
+    monkeypatch.setenv("FILE_DIRECT_TOKENS", "50")
+    monkeypatch.setenv("FILE_SUMMARY_TOKENS", "20")
+    monkeypatch.setenv("FILE_REDUCE_INPUT_TOKENS", "60")
+    monkeypatch.setenv("FILE_SUMMARY_CACHE_DIR", str(tmp_path / "summaries"))
+    from langchain_openai import ChatOpenAI
+    return FileAnalyzer(ChatOpenAI(openai_api_key="test"))
+
+def document(paragraphs: int) -> str:
+    return "\n".join(f"paragraph {i} " + "word " * 30 for i in range(paragraphs))
+
+def test_failed_chunks_do_not_fail_the_analysis(analyzer, monkeypatch):
+    async def complete(llm, prompt, callbacks=None):
+        if "paragraph 2 " in prompt:
+            raise RuntimeError("rate limited")
+        return "answer" if prompt.startswith("以下是一个文件") else "summary"
+
+    monkeypatch.setattr(analyzer, "_complete", complete)
+    result = asyncio.run(analyzer.analyze(document(4), "总结"))
+
+    assert result["failed_chunks"] == 1
+    assert result["analysis"].startswith("answer")
+    assert "1 个片段摘要失败" in result["analysis"]
+
+def test_reduce_reserve_is_held_while_collapsing(analyzer, monkeypatch):
+    seen = []
+
+    async def complete(llm, prompt, callbacks=None):
+        if prompt.startswith(COMBINE_PROMPT.split("{")[0]):
+            seen.append(state_ref[0]["tokens_used"])
+        return "answer" if prompt.startswith("以下是一个文件") else "summary " + "x " * 20
+
+    state_ref = []
+    collapse = analyzer._collapse
+
+    async def spy(summaries, state):
+        state_ref.append(state)
+        return await collapse(summaries, state)
+
+    monkeypatch.setattr(analyzer, "_complete", complete)
+    monkeypatch.setattr(analyzer, "_collapse", spy)
+    asyncio.run(analyzer.analyze(document(6), "总结"))
+
+    reserve = analyzer.reduce_input_tokens + analyzer.tokens.count("总结") + 1000
+    assert seen and min(seen) >= reserve
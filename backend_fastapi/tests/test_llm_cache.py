@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from services.llm_cache import LLMResponseCache, normalize_prompt
+
+@pytest.fixture
+def make_cache(tmp_path):
+    def make(**kwargs):
+        options = {"ttl": 60, "memory_entries": 8, "max_bytes": 1 << 20, **kwargs}
+        return LLMResponseCache(cache_dir=str(tmp_path / "llm"), **options)
+    return make
+
+def test_concurrent_requests_share_one_call(make_cache):
+    cache = make_cache()
+    calls = []
+
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"chart": "bar"}, True
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_create("k", create) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert results == [{"chart": "bar"}] * 5
+    stats = cache.get_stats()
+    assert stats["misses"] == 1 and stats["coalesced"] == 4
+
+    # Served from disk by a fresh instance
+    assert asyncio.run(make_cache().get("k")) == {"chart": "bar"}
+
+def test_cancelled_creator_hands_over_to_a_waiter(make_cache):
+    cache = make_cache()
+    calls = []
+
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls), True
+
+    async def scenario():
+        creator = asyncio.create_task(cache.get_or_create("k", create))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_create("k", create))
+        await asyncio.sleep(0.01)
+        creator.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await creator
+        return await waiter
+
+    assert asyncio.run(scenario()) == 2
+    assert len(calls) == 2
+
+def test_cancelled_waiter_leaves_the_call_running(make_cache):
+    cache = make_cache()
+
+    async def create():
+        await asyncio.sleep(0.02)
+        return "value", True
+
+    async def scenario():
+        creator = asyncio.create_task(cache.get_or_create("k", create))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_create("k", create))
+        await asyncio.sleep(0.005)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return await creator
+
+    assert asyncio.run(scenario()) == "value"
+
+def test_errors_reach_waiters_and_are_not_cached(make_cache):
+    cache = make_cache()
+
+    async def create():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model unavailable")
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_create("k", create) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert asyncio.run(cache.get("k")) is None
+
+def test_uncacheable_and_expired_values_are_regenerated(make_cache):
+    cache = make_cache(ttl=0)
+    calls = []
+
+    async def create():
+        calls.append(1)
+        return "value", len(calls) > 1
+
+    async def scenario():
+        await cache.get_or_create("k", create)
+        await cache.get_or_create("k", create)
+        await cache.get_or_create("k", create)
+
+    asyncio.run(scenario())
+    assert len(calls) == 3
+    assert cache.get_stats()["expired"] >= 1
+
+def test_prompt_normalization():
+    assert normalize_prompt("  生成  柱状图。 ") == normalize_prompt("生成 柱状图")
+    assert normalize_prompt("Ｂａｒ Chart!") == "bar chart"
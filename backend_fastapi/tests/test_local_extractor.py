@@ -0,0 +1,36 @@
+import asyncio
+
+from services.extraction_cache import ExtractionCache
+from services.local_extractor import LocalExtractor
+
+def test_only_server_written_files_are_read(tmp_path, monkeypatch):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    monkeypatch.setenv("LOCAL_FILE_DIRS", str(uploads))
+    inside = uploads / "notes.txt"
+    inside.write_text("产业集群", encoding="utf-8")
+    outside = tmp_path / "secret.txt"
+    outside.write_text("secret", encoding="utf-8")
+
+    extractor = LocalExtractor()
+    assert extractor.supports(str(inside))
+    assert not extractor.supports(str(outside))
+    # Traversal out of the allowed directory is resolved before the check
+    assert not extractor.supports(str(uploads / ".." / "secret.txt"))
+
+    result = asyncio.run(extractor.extract(str(inside)))
+    assert result["content"] == "产业集群"
+    assert asyncio.run(extractor.extract(str(outside))) is None
+
+def test_fingerprint_ignores_client_paths(tmp_path, monkeypatch):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    monkeypatch.setenv("LOCAL_FILE_DIRS", str(uploads))
+    inside = uploads / "a.txt"
+    inside.write_text("a", encoding="utf-8")
+    outside = tmp_path / "b.txt"
+    outside.write_text("b", encoding="utf-8")
+
+    cache = ExtractionCache(cache_dir=str(tmp_path / "cache"))
+    assert asyncio.run(cache.fingerprint(str(inside))).startswith("sha256:")
+    assert asyncio.run(cache.fingerprint(str(outside))) is None
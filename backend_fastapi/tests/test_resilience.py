@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services.resilience import CircuitBreaker, CircuitOpenError, call_with_resilience
+
+def _open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0.0)
+
+    async def refuse():
+        raise httpx.ConnectError("refused")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(call_with_resilience(refuse, breaker))
+    assert breaker.state == "open"
+    return breaker
+
+def test_non_network_error_frees_half_open_trial():
+    breaker = _open_breaker()
+
+    async def undecodable():
+        raise httpx.DecodingError("bad gzip")
+
+    with pytest.raises(httpx.DecodingError):
+        asyncio.run(call_with_resilience(undecodable, breaker))
+
+    async def ok():
+        return httpx.Response(200)
+
+    response = asyncio.run(call_with_resilience(ok, breaker))
+    assert response.status_code == 200
+    assert breaker.state == "closed"
+
+def test_half_open_allows_single_trial():
+    breaker = _open_breaker()
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+
+def test_retryable_status_is_retried_then_returned(monkeypatch):
+    monkeypatch.setenv("RETRY_BASE_DELAY", "0")
+    breaker = CircuitBreaker("retry", failure_threshold=10)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        return httpx.Response(503 if len(calls) < 3 else 200)
+
+    response = asyncio.run(call_with_resilience(flaky, breaker, retries=2))
+    assert response.status_code == 200
+    assert len(calls) == 3
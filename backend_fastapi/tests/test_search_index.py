@@ -0,0 +1,136 @@
+import math
+import os
+from collections import Counter
+
+import pytest
+
+from services.search_index import BM25Index, reciprocal_rank_fusion, tokenize
+from services.segment_store import SegmentedIndex
+
+DOCS = {
+    "a": "new energy vehicles battery supply chain",
+    "b": "battery recycling and battery materials",
+    "c": "semiconductor equipment and materials",
+    "d": "vehicles exports grew in the third quarter",
+    "e": "industrial park energy consumption report",
+}
+
+@pytest.fixture
+def make_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("SEARCH_INDEX_FLUSH_CHUNKS", "2")
+    monkeypatch.setenv("SEARCH_INDEX_MERGE_FACTOR", "2")
+    return lambda: BM25Index(index_dir=str(tmp_path / "index"))
+
+def reference_scores(docs, query, k1=1.5, b=0.75):
+    """按定义逐文档计算BM25，作为分段实现的对照"""
+    tokens = {doc_id: Counter(tokenize(text)) for doc_id, text in docs.items()}
+    avgdl = sum(sum(counts.values()) for counts in tokens.values()) / len(tokens)
+    scores = {}
+    for doc_id, counts in tokens.items():
+        length = sum(counts.values())
+        score = 0.0
+        for term in set(tokenize(query)):
+            df = sum(1 for other in tokens.values() if term in other)
+            if not df or term not in counts:
+                continue
+            idf = math.log(1 + (len(tokens) - df + 0.5) / (df + 0.5))
+            tf = counts[term]
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avgdl))
+        if score > 0:
+            scores[doc_id] = round(score, 4)
+    return scores
+
+def scores_of(index, query):
+    return {hit["doc_id"]: hit["score"] for hit in index.search(query, top_k=10)}
+
+def test_scores_match_reference_across_segments(make_index):
+    index = make_index()
+    for doc_id, text in DOCS.items():
+        index.add_document(doc_id, text)
+    index.persist()
+
+    assert index.get_stats()["segments"] >= 1
+    for query in ("battery", "energy vehicles", "materials report"):
+        assert scores_of(index, query) == pytest.approx(reference_scores(DOCS, query), abs=1e-3)
+
+def test_deleted_chunks_do_not_count_towards_df(make_index):
+    index = make_index()
+    for doc_id, text in DOCS.items():
+        index.add_document(doc_id, text)
+    index.persist()
+    index.remove_document("b")
+    index.add_document("a", "semiconductor vehicles")
+
+    remaining = {**{k: v for k, v in DOCS.items() if k != "b"}, "a": "semiconductor vehicles"}
+    for query in ("battery", "semiconductor vehicles"):
+        assert scores_of(index, query) == pytest.approx(reference_scores(remaining, query), abs=1e-3)
+
+def test_persist_reload_and_filters(make_index):
+    index = make_index()
+    for doc_id, text in DOCS.items():
+        index.add_document(doc_id, text, {"kind": "news" if doc_id in "ad" else "report"})
+    index.remove_document("e")
+    index.persist()
+
+    reloaded = make_index()
+    assert reloaded.get_stats()["documents"] == 4
+    assert scores_of(reloaded, "vehicles") == scores_of(index, "vehicles")
+    hits = reloaded.search("materials", filters={"kind": "report"})
+    assert {hit["doc_id"] for hit in hits} == {"b", "c"}
+    assert reloaded.search("materials", filters={"kind": "news"}) == []
+    assert reloaded.search("consumption") == []
+
+def test_merge_drops_deleted_chunks_and_keeps_one_manifest(make_index):
+    index = make_index()
+    for round_ in range(6):
+        for doc_id, text in DOCS.items():
+            index.add_document(doc_id, f"{text} round{round_}")
+    index.persist()
+
+    stats = index.get_stats()
+    assert stats["documents"] == len(DOCS)
+    assert stats["chunks"] == len(DOCS)
+    assert stats["deleted_chunks"] == 0
+    assert not stats["merging"]
+    assert index.search("round5 recycling")[0]["doc_id"] == "b"
+    assert index.search("round4") == []
+    segment_dirs = [name for name in os.listdir(index.index_dir) if name.startswith("seg_")]
+    assert sorted(segment_dirs) == sorted(segment.name for segment in index._segments)
+
+def test_unfinished_segments_are_ignored_and_cleaned(make_index):
+    index = make_index()
+    index.add_document("a", DOCS["a"])
+    index.persist()
+    # A crash mid-write leaves an uncommitted temp dir and an unreferenced segment
+    os.makedirs(os.path.join(index.index_dir, ".seg_dead.tmp"))
+    os.makedirs(os.path.join(index.index_dir, "seg_orphan"))
+
+    reloaded = make_index()
+    assert [hit["doc_id"] for hit in reloaded.search("battery")] == ["a"]
+    leftovers = set(os.listdir(reloaded.index_dir))
+    assert ".seg_dead.tmp" not in leftovers and "seg_orphan" not in leftovers
+
+def test_reciprocal_rank_fusion_combines_both_lists():
+    bm25 = [
+        {"doc_id": "a", "content": "x", "score": 3.0},
+        {"doc_id": "b", "content": "y", "score": 2.0},
+    ]
+    vector = [
+        {"doc_id": "b", "content": "y", "similarity": 0.9},
+        {"doc_id": "c", "content": "z", "similarity": 0.8},
+    ]
+    fused = reciprocal_rank_fusion([(bm25, "bm25_score"), (vector, "similarity")], max_results=10)
+
+    assert [hit["doc_id"] for hit in fused] == ["b", "a", "c"]
+    assert fused[0]["rrf_score"] == round(1 / 62 + 1 / 61, 6)
+    assert fused[0]["bm25_score"] == 2.0 and fused[0]["similarity"] == 0.9
+    assert "score" not in fused[0]
+    assert len(reciprocal_rank_fusion([(bm25, "bm25_score")], max_results=1)) == 1
+
+def test_segmented_index_subclass_must_implement_hooks(tmp_path):
+    class Incomplete(SegmentedIndex):
+        def _open(self, name):
+            return None
+
+    with pytest.raises(TypeError, match="_merge"):
+        Incomplete(str(tmp_path / "index"), flush_chunks=2, merge_factor=2)
@@ -0,0 +1,71 @@
+import os
+
+from services.extraction_cache import ExtractionCache
+from services.tabular_analytics import TabularAnalytics
+
+def write_csv(path, rows):
+    path.write_text("\n".join(["日期,产值"] + rows), encoding="utf-8")
+    return str(path)
+
+def test_growth_compares_adjacent_periods_with_gaps_filled(tmp_path, monkeypatch):
+    monkeypatch.setenv("TABLE_CACHE_DIR", str(tmp_path / "cache"))
+    path = write_csv(tmp_path / "sales.csv", ["2023-01-05,100", "2023-02-10,120", "2023-05-01,60", "2023-07-20,90"])
+    analytics = TabularAnalytics()
+
+    monthly = analytics.analyze_sync(path, value="产值", time_column="日期", freq="month")
+    assert monthly["title"] == "产值按月合计"
+    assert monthly["categories"] == ["2023-01", "2023-02", "2023-03", "2023-04", "2023-05", "2023-06", "2023-07"]
+    assert monthly["values"] == [100, 120, 0, 0, 60, 0, 90]
+    # May follows an empty April, so there is no period-over-period rate
+    assert monthly["growth_rates"] == [None, 20.0, -100.0, None, None, -100.0, None]
+
+    quarterly = analytics.analyze_sync(path, value="产值", agg="mean", time_column="日期", freq="quarter")
+    assert quarterly["title"] == "产值按季度平均"
+    assert quarterly["categories"] == ["2023Q1", "2023Q2", "2023Q3"]
+    assert quarterly["growth_rates"][1] == -45.4545
+
+    weekly = analytics.analyze_sync(path, agg="count", time_column="日期", freq="week")
+    assert weekly["title"] == "记录数按周计数"
+    assert len(weekly["categories"]) == 29 and sum(weekly["values"]) == 4
+
+def test_memory_hits_skip_hashing_until_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setenv("TABLE_CACHE_DIR", str(tmp_path / "cache"))
+    path = write_csv(tmp_path / "sales.csv", ["2023-01-05,100"])
+    analytics = TabularAnalytics()
+    analytics.load(path)
+
+    hashed = []
+    original = ExtractionCache.hash_file
+    monkeypatch.setattr(ExtractionCache, "hash_file", staticmethod(lambda p: hashed.append(p) or original(p)))
+    analytics.load(path)
+    assert hashed == [] and analytics.get_stats()["memory_hits"] == 1
+
+    write_csv(tmp_path / "sales.csv", ["2023-01-05,100", "2023-02-05,300"])
+    assert analytics.load(path).rows == 2
+    assert hashed == [path]
+
+def test_column_cache_stays_within_byte_budget(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("TABLE_CACHE_DIR", str(cache_dir))
+    monkeypatch.setenv("TABLE_MEMORY_ENTRIES", "1")
+    paths = [write_csv(tmp_path / f"t{i}.csv", [f"2023-01-0{i + 1},{i}"]) for i in range(3)]
+    analytics = TabularAnalytics()
+    analytics.load(paths[0])
+    entry_size = analytics.get_stats()["disk_bytes"]
+
+    monkeypatch.setenv("TABLE_CACHE_MAX_BYTES", str(entry_size * 2 + entry_size // 2))
+    analytics = TabularAnalytics()
+    for path in paths:
+        analytics.load(path)
+    stats = analytics.get_stats()
+    assert stats["disk_entries"] == 2 and stats["evictions"] == 1
+    assert stats["disk_bytes"] <= stats["disk_max_bytes"]
+    assert len(os.listdir(cache_dir)) == 2
+
+    # Startup rebuilds the index from disk and the oldest file was the one evicted
+    reloaded = TabularAnalytics()
+    assert reloaded.get_stats()["disk_entries"] == 2
+    reloaded.load(paths[0])
+    assert reloaded.get_stats()["parsed"] == 1
+    reloaded.load(paths[2])
+    assert reloaded.get_stats()["disk_hits"] == 1
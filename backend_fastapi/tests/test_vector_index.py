@@ -0,0 +1,87 @@
+import pytest
+
+from services.vector_index import HashingEmbedder, VectorIndex
+
+DOCS = {
+    "ev": "新能源汽车产业链上下游企业分布与产值分析，电池材料和整车制造是重点环节。",
+    "chip": "半导体设备与材料国产化进展，晶圆制造产能持续扩张。",
+    "park": "2023年第三季度工业园区能耗统计报告，单位产值能耗下降。",
+}
+
+@pytest.fixture
+def make_index(tmp_path, monkeypatch):
+    monkeypatch.setenv("SEARCH_INDEX_FLUSH_CHUNKS", "2")
+    monkeypatch.setenv("SEARCH_INDEX_MERGE_FACTOR", "2")
+    monkeypatch.setenv("VECTOR_DTYPE", "float32")
+    return lambda: VectorIndex(index_dir=str(tmp_path / "vectors"), embedder=HashingEmbedder())
+
+def top_doc(index, query, **kwargs):
+    hits = index.search(query, top_k=3, **kwargs)
+    return hits[0]["doc_id"] if hits else None
+
+def test_default_threshold_keeps_topic_matches(make_index):
+    index = make_index()
+    for doc_id, text in DOCS.items():
+        index.add_document(doc_id, text, {"kind": "report" if doc_id == "park" else "industry"})
+
+    assert top_doc(index, "新能源汽车产业链") == "ev"
+    assert top_doc(index, "半导体材料") == "chip"
+    assert top_doc(index, "园区能耗") == "park"
+    # A fixed 0.7 cut-off drops even exact topic matches under the hashing embedder
+    assert index.search("新能源汽车产业链", similarity_threshold=0.7) == []
+    assert index.search("天气预报") == []
+
+def test_filters_and_replacement(make_index):
+    index = make_index()
+    for doc_id, text in DOCS.items():
+        index.add_document(doc_id, text, {"kind": "report" if doc_id == "park" else "industry"})
+
+    assert top_doc(index, "园区能耗", filters={"kind": "industry"}) is None
+    assert {hit["doc_id"] for hit in index.search("产值", similarity_threshold=0.0, filters={"kind": ["report"]})} == {"park"}
+
+    index.add_document("ev", "物流仓储配送中心建设规划")
+    assert top_doc(index, "新能源汽车产业链") != "ev"
+    assert top_doc(index, "物流仓储") == "ev"
+    assert index.get_stats()["chunks"] == len(DOCS)
+
+def test_persist_reload_and_merge(make_index):
+    index = make_index()
+    for round_ in range(4):
+        for doc_id, text in DOCS.items():
+            index.add_document(doc_id, f"{text} 第{round_}轮")
+    index.remove_document("chip")
+    index.persist()
+
+    stats = index.get_stats()
+    assert stats["documents"] == 2 and stats["chunks"] == 2
+    assert not stats["merging"] and stats["pending_chunks"] == 0
+
+    reloaded = make_index()
+    assert reloaded.get_stats()["documents"] == 2
+    assert top_doc(reloaded, "园区能耗") == "park"
+    assert top_doc(reloaded, "半导体材料") is None
+    assert reloaded.search("新能源汽车") == index.search("新能源汽车")
+    assert reloaded.get_stats()["cached_embeddings"] > 0
+
+def test_large_merged_segments_use_ivf(make_index, monkeypatch):
+    monkeypatch.setenv("VECTOR_IVF_MIN_CHUNKS", "4")
+    monkeypatch.setenv("VECTOR_IVF_NPROBE", "64")
+    index = make_index()
+    for i in range(12):
+        index.add_document(f"doc{i}", f"{DOCS['ev']} 编号{i}")
+    index.add_document("chip", DOCS["chip"])
+    index.persist()
+
+    assert index.get_stats()["ivf_lists"] > 0
+    assert top_doc(index, "半导体材料") == "chip"
+    reloaded = make_index()
+    assert top_doc(reloaded, "半导体材料") == "chip"
+    assert {hit["doc_id"] for hit in reloaded.search("新能源汽车", top_k=20)} >= {f"doc{i}" for i in range(12)}
+
+def test_model_change_starts_empty(make_index, tmp_path):
+    index = make_index()
+    index.add_document("ev", DOCS["ev"])
+    index.persist()
+
+    other = VectorIndex(index_dir=str(tmp_path / "vectors"), embedder=HashingEmbedder(dim=128))
+    assert other.get_stats()["documents"] == 0